@@ -0,0 +1,77 @@
+import os
+import random
+import sys
+import time
+
+import num2words
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import words  # noqa: E402
+
+# words.py against num2words(..., lang="en_IN"): first that every number
+# spells the same, then the time to spell the amounts of 50k bills.
+#
+#   python benchmarks/amount_words.py [bills]
+
+
+def spell(number) -> str:
+    return num2words.num2words(number, lang="en_IN")
+
+
+def old_amount(amount: str, separator: str = " ") -> str:
+    return separator.join(spell(part) if part != "00" else "" for part in amount.split("."))
+
+
+def old_digits(number: str) -> str:
+    return " ".join(spell(digit) for digit in number)
+
+
+def check(rng: random.Random):
+    numbers = list(range(0, 200_001))
+    numbers += [rng.randrange(10 ** 10) for _ in range(200_000)]
+    numbers += [-n for n in numbers[:1000]] + [10 ** 10 - 1]
+    for number in numbers:
+        assert words.cardinal(number) == spell(number), number
+        assert words.cardinal(str(number)) == spell(str(number)), number
+    for text in ["07", "00", "-0", " 5", "+5", "1e3"]:
+        assert words.cardinal(text) == spell(text), text
+    for _ in range(20_000):
+        amount = "{:.2f}".format(rng.randrange(10 ** 9) / 100)
+        assert words.amount_in_words(amount) == old_amount(amount), amount
+        assert words.amount_in_words(amount, "") == old_amount(amount, ""), amount
+        assert words.digits_in_words(amount[:-3]) == old_digits(amount[:-3]), amount
+    print(f"{len(numbers) * 2 + 60_000} numbers spelled the same as num2words")
+
+
+def timed(speak, amounts: list[str]) -> float:
+    start = time.perf_counter()
+    for amount in amounts:
+        speak(amount)
+    return time.perf_counter() - start
+
+
+def main():
+    bills = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rng = random.Random(0)
+    check(rng)
+
+    # quantity in quarter quintals times a handful of rates, like the bills
+    rates = [6500.0, 6620.5, 7010.0, 7125.25]
+    amounts = ["{:.2f}".format(rng.randrange(4, 800) / 4 * rng.choice(rates))
+               for _ in range(bills)]
+    distinct = [str(n) for n in range(bills)]
+
+    words.cardinal.cache_clear()
+    words.amount_in_words.cache_clear()
+    print(f"{bills} amounts, {len(set(amounts))} distinct")
+    print(f"num2words          {timed(old_amount, amounts):8.3f} s")
+    print(f"words, cold cache  {timed(words.amount_in_words, amounts):8.3f} s")
+    print(f"words, warm cache  {timed(words.amount_in_words, amounts):8.3f} s")
+    print(f"{bills} distinct numbers")
+    print(f"num2words          {timed(spell, distinct):8.3f} s")
+    print(f"words.cardinal     {timed(words.cardinal, distinct):8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
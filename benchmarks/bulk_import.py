@@ -0,0 +1,78 @@
+import io
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import ingest  # noqa: E402
+from print_context import workbook  # noqa: E402
+
+# A backfill through /upload's pipeline (chunked read, per chunk checks,
+# one upsert) against the same bills posted one by one through
+# create_bill, the only way in before. The per bill path is timed on a
+# sample and scaled up. Runs on the engine BILL_STORAGE selects.
+#
+#   python benchmarks/bulk_import.py [rows] [sample]
+
+
+def bills(rows: int):
+    # one bill per invoice, the upload has no duplicates
+    df_bill_data = workbook(rows).drop(columns=["id"])
+    df_bill_data["invoiceNo"] = [str(n) for n in range(1, rows + 1)]
+    return df_bill_data
+
+
+def upload(rows: int, ids: bool = False) -> bytes:
+    df_bill_data = bills(rows)
+    if ids:
+        # as exported, the ids the first upload gave the bills
+        df_bill_data.insert(0, "id", range(1, rows + 1))
+    return df_bill_data.to_csv(index=False).encode()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    sample = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    directory = tempfile.mkdtemp()
+
+    one_by_one = os.path.join(directory, "one_by_one.xlsx")
+    sample_bills = bills(sample).astype(str).to_dict(orient="records")
+    start = time.perf_counter()
+    for bill in sample_bills:
+        assert db.create_bill(one_by_one, db.Bill(**bill))
+    per_bill = (time.perf_counter() - start) / sample
+    db.compact_journal(one_by_one)
+
+    body = upload(rows)
+    bulk = os.path.join(directory, "bulk.xlsx")
+    report = ingest.ImportReport(filename="bulk.xlsx")
+    start = time.perf_counter()
+    header, chunks = ingest.open_upload(io.BytesIO(body), "bulk.csv")
+    assert not ingest.header_problems(header)
+    report.inserted, report.updated = db.import_bills(bulk, ingest.bills(chunks, report))
+    seconds = time.perf_counter() - start
+    assert report.inserted == rows and report.rejected == 0, report
+
+    # the same bills uploaded again with their ids update every bill
+    body_with_ids = upload(rows, ids=True)
+    start = time.perf_counter()
+    header, chunks = ingest.open_upload(io.BytesIO(body_with_ids), "bulk.csv")
+    inserted, updated = db.import_bills(bulk, ingest.bills(chunks, report))
+    again = time.perf_counter() - start
+    assert (inserted, updated) == (0, rows), (inserted, updated)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{rows} rows, {len(body) / 2**20:.1f} MB of csv")
+    print(f"one by one  {per_bill * 1000:8.2f} ms a bill, {per_bill * rows:8.1f} s for all")
+    print(f"upload      {seconds:8.1f} s  ({rows / seconds:,.0f} bills/s)")
+    print(f"re-upload   {again:8.1f} s  {inserted} added, {updated} updated")
+    print(f"peak rss    {peak:8.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
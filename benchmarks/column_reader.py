@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+import printing  # noqa: E402
+import reader  # noqa: E402
+import storage  # noqa: E402
+import summary  # noqa: E402
+from print_context import workbook  # noqa: E402
+
+# Cold parse of a workbook for the routes that need a few columns: the
+# whole sheet through pd.read_excel, as every route did before, against
+# reader.read with the route's columns, on openpyxl and (when
+# python-calamine is installed) calamine. Every projection is first
+# checked against pd.read_excel's columns.
+#
+#   python benchmarks/column_reader.py [rows]
+
+PROJECTIONS = [
+    ("dashboard", summary.COLUMNS),
+    # the stored columns behind the prints' display columns
+    ("gate pass", storage.read_columns(printing.GET_PASS_COLUMNS)),
+    ("purchase", storage.read_columns(printing.PURCHASE_COLUMNS)),
+    ("bill", storage.read_columns(printing.BILL_COLUMNS)),
+    ("everything", storage.BILL_COLUMNS),
+]
+
+
+def measure(run):
+    # timed on its own, tracemalloc slows openpyxl down a lot
+    start = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    directory = tempfile.mkdtemp()
+    file_name = os.path.join(directory, "bills.xlsx")
+    storage.write_xlsx(file_name, workbook(rows))
+
+    seconds, peak, whole = measure(lambda: pd.read_excel(file_name))
+    print(f"{rows} rows")
+    print(f"  {'pd.read_excel':<24} {seconds:7.2f} s  peak {peak / 2**20:7.1f} MB")
+
+    engines = ["openpyxl"]
+    if reader.engine() == "calamine" or reader.READ_ENGINE == "calamine":
+        engines.append("calamine")
+    for engine in engines:
+        reader.READ_ENGINE = engine
+        for name, columns in PROJECTIONS:
+            seconds, peak, df_bill_data = measure(lambda: reader.read(file_name, columns))
+            assert df_bill_data.equals(whole.reindex(columns=columns)), (engine, name)
+            print(f"  {engine + ' ' + name:<24} {seconds:7.2f} s  peak {peak / 2**20:7.1f} MB"
+                  f"  {len(columns):2} columns")
+    os.remove(file_name)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
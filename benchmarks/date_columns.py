@@ -0,0 +1,86 @@
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+
+# The dates and times of a weight slip print for every bill: row by row
+# with strptime and strftime as the print routes once did, a whole column
+# at a time on every request as the bulk prints did since, and parsed
+# once at load (storage.typed) with the display columns made once per
+# version of the workbook, which later prints get from the cache.
+#
+#   python benchmarks/date_columns.py [rows]
+
+
+def bills(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    days = pd.Timestamp("2024-10-01") + pd.to_timedelta(rng.integers(0, 365, rows), "D")
+    minutes = rng.integers(8 * 60, 17 * 60, rows)
+    return pd.DataFrame({
+        # typed into Excel, the only createdAt the old routes could print
+        "createdAt": days.strftime("%d-%m-%Y"),
+        # time cells, the only in_time the old routes could print
+        "in_time": [datetime.time(m // 60, m % 60) for m in minutes],
+    })
+
+
+def row_by_row(df_bill_data: pd.DataFrame) -> list[tuple[str, str]]:
+    return [
+        (datetime.datetime.strptime(i["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y"),
+         i["in_time"].strftime("%I:%M %p"))
+        for i in df_bill_data.to_dict(orient="records")
+    ]
+
+
+def per_request(df_bill_data: pd.DataFrame) -> list[tuple[str, str]]:
+    created = df_bill_data["createdAt"]
+    is_text = created.map(lambda value: isinstance(value, str))
+    days = pd.to_datetime(created.where(~is_text), errors="coerce").fillna(
+        pd.to_datetime(created.where(is_text), format="%d-%m-%Y", errors="coerce"))
+    dates = days.dt.strftime("%d/%m/%Y").fillna(created.astype(str))
+    times = pd.to_datetime(df_bill_data["in_time"].astype(str), format="mixed",
+                           errors="coerce").dt.strftime("%I:%M %p").fillna("")
+    return list(zip(dates, times))
+
+
+def timed(run, repeat: int = 3):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    df_bill_data = bills(rows)
+    print(f"{rows} bills, best of 3")
+
+    seconds, expected = timed(lambda: row_by_row(df_bill_data))
+    print(f"  {'row by row, per print':<34} {seconds * 1000:8.1f} ms")
+    seconds, result = timed(lambda: per_request(df_bill_data))
+    assert result == expected
+    print(f"  {'whole columns, per print':<34} {seconds * 1000:8.1f} ms")
+
+    seconds, typed = timed(lambda: storage.typed(df_bill_data))
+    print(f"  {'parse at load, once':<34} {seconds * 1000:8.1f} ms")
+    names = ["date", "in_time_12h"]
+    seconds, shown = timed(lambda: storage.with_display(typed, names))
+    assert list(zip(shown["date"], shown["in_time_12h"])) == expected
+    print(f"  {'display columns, once a version':<34} {seconds * 1000:8.1f} ms")
+    seconds, _ = timed(lambda: storage.select(shown, names))
+    print(f"  {'display columns, per print':<34} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+
+from jinja2 import Environment, FileSystemLoader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import escp  # noqa: E402
+import printing  # noqa: E402
+from print_context import workbook  # noqa: E402
+
+# A day of weighbridge slips as ESC/P against the all_dot_matrex.html page.
+# The slip layout itself is checked byte for byte in tests/test_escp.py.
+#
+#   python benchmarks/escp_slips.py [slips]
+
+def main():
+    slips = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    df_bill_data = workbook(slips)
+    template = Environment(loader=FileSystemLoader(os.path.join(ROOT, "templates")))
+    template.filters["enumerate"] = enumerate
+    page = template.get_template("all_dot_matrex.html")
+
+    start = time.perf_counter()
+    records = list(printing.dot_matrix(df_bill_data))
+    records_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    html = "".join(page.generate(data=records))
+    html_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raw = b"".join(escp.slips(records))
+    escp_seconds = time.perf_counter() - start
+
+    # the html still has to go through the browser's layout and print
+    # pipeline, the ESC/P bytes go to the printer as they are
+    print(f"{slips} slips, slip data built in {records_seconds:.3f} s")
+    print(f"html page  {html_seconds:8.3f} s  {len(html.encode()):>10} bytes")
+    print(f"ESC/P      {escp_seconds:8.3f} s  {len(raw):>10} bytes")
+
+
+if __name__ == "__main__":
+    main()
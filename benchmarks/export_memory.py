@@ -0,0 +1,87 @@
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+import export  # noqa: E402
+import storage  # noqa: E402
+from print_context import workbook  # noqa: E402
+
+# Peak memory an export adds on top of the loaded workbook, the old way
+# (whole file in a BytesIO, whole DataFrame through pandas) against the
+# chunked writers, for a small and a large workbook. The chunked numbers
+# should stay flat as the workbook grows.
+#
+#   python benchmarks/export_memory.py [rows]
+
+
+def measure(run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = run()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, size
+
+
+def drain(chunks) -> int:
+    return sum(len(chunk) for chunk in chunks)
+
+
+def old_xlsx(df_bill_data, path):
+    storage.write_xlsx(path, df_bill_data)
+    with open(path, "rb") as f:
+        return len(io.BytesIO(f.read()).getvalue())
+
+
+def chunked_xlsx(df_bill_data, path):
+    storage.write_xlsx_rows(path, storage.chunked(df_bill_data),
+                            list(df_bill_data.columns))
+    return drain(export.file_chunks(path))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    query = export.ExportQuery()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "export.xlsx")
+
+    # the chunked csv reads back as the whole frame
+    df_bill_data = workbook(1000)
+    text = b"".join(export.csv_chunks(export.frames(df_bill_data, query)))
+    assert pd.read_csv(io.BytesIO(text)).equals(
+        pd.read_csv(io.BytesIO(df_bill_data.to_csv(index=False).encode())))
+    print("chunked csv matches to_csv")
+
+    runs = [
+        ("xlsx old", lambda df: old_xlsx(df, path)),
+        ("xlsx chunked", lambda df: chunked_xlsx(df, path)),
+        ("csv old", lambda df: len(df.to_csv(index=False).encode())),
+        ("csv chunked", lambda df: drain(export.csv_chunks(export.frames(df, query)))),
+        ("jsonl chunked", lambda df: drain(export.jsonl_chunks(export.frames(df, query)))),
+    ]
+    if export.pa is not None:
+        runs.append(("parquet chunked",
+                     lambda df: drain(export.parquet_chunks(export.frames(df, query)))))
+
+    for size in (rows // 10, rows):
+        df_bill_data = workbook(size)
+        print(f"{size} rows")
+        for name, run in runs:
+            seconds, peak, written = measure(lambda: run(df_bill_data))
+            print(f"  {name:<16} {seconds:7.2f} s  peak {peak / 2**20:8.1f} MB"
+                  f"  {written:>11} bytes")
+    os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import offload  # noqa: E402
+import storage  # noqa: E402
+import writer  # noqa: E402
+from print_context import workbook  # noqa: E402
+
+# Bursts of counters submitting (then deleting) one bill each at the same
+# moment: every request writing on its own, one after the other behind the
+# workbook lock as before, against the group commit of writer.py. Runs on
+# the engine BILL_STORAGE selects; the background journal compaction is
+# left out, it runs the same either way.
+#
+#   python benchmarks/group_commit.py [rows]
+
+BILL = db.Bill(
+    invoiceNo="1", supplierName="Supplier", supplierOtherInfo="", goods="Cotton",
+    hsn_sac="5201", quantity=2.5, rate=7000, par="Qtl", farmerName="Ram",
+    vehicle_no="MH40", farmerCode="F1", before_wight="2000", after_wight="6000",
+    year="2024-25", in_time=None, out_time=None, address=None)
+
+
+async def one_by_one(file_name: str, count: int) -> list[int]:
+    async def submit():
+        return await offload.write(file_name, db.create_bills, file_name, [BILL])
+
+    async def remove(bill_id):
+        return await offload.write(file_name, db.delete_bills, file_name, [bill_id])
+
+    ids = [bill_id for bills in await asyncio.gather(*(submit() for _ in range(count)))
+           for bill_id in bills]
+    await asyncio.gather(*(remove(bill_id) for bill_id in ids))
+    return ids
+
+
+async def grouped(file_name: str, count: int) -> list[int]:
+    ids = [bill_id for bills in await asyncio.gather(
+        *(writer.insert(file_name, [BILL]) for _ in range(count))) for bill_id in bills]
+    await asyncio.gather(*(writer.delete(file_name, [bill_id]) for bill_id in ids))
+    return ids
+
+
+async def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    db.JOURNAL_COMPACT_ROWS = 10 ** 9
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, "source.xlsx")
+    storage.write_xlsx(source, workbook(rows))
+
+    print(f"{storage.engine().name} engine, {rows} bills, window"
+          f" {writer.WRITE_WINDOW * 1000:g} ms, batch {writer.WRITE_BATCH}")
+    for count in (1, 10, 50, 200):
+        line = f"  {count:4} counters"
+        for name, run in (("one by one", one_by_one), ("grouped", grouped)):
+            file_name = os.path.join(directory, f"{name[0]}{count}.xlsx")
+            shutil.copy(source, file_name)
+            if storage.engine().name == "sqlite":
+                await offload.run(db.import_bills, file_name, [workbook(rows)])
+            # warm the cache, the parse is not what is measured
+            before = len(await offload.read(file_name, db.get_frame, file_name))
+            start = time.perf_counter()
+            ids = await run(file_name, count)
+            seconds = time.perf_counter() - start
+            assert len(set(ids)) == count
+            assert len(await offload.read(file_name, db.get_frame, file_name)) == before
+            line += f"  {name} {seconds:7.2f} s ({2 * count / seconds:7.0f} changes/s)"
+        print(line)
+    await offload.shutdown()
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What `import main` costs at startup, module by module, from Python's own
+# -X importtime, best of a few fresh interpreters. Then what each module
+# main.py used to import at the top (the PDF and HTTP libraries, num2words,
+# openpyxl) would add on its own on top of the app's imports, now that they
+# are only imported when used.
+#
+#   python benchmarks/import_time.py [runs]
+
+DEFERRED = [
+    "pyppeteer", "pdfkit", "xhtml2pdf.pisa", "requests", "pyhtml2pdf.converter",
+    "httpx", "num2words", "openpyxl",
+]
+
+
+def import_times(code: str) -> dict[str, tuple[int, int, int]]:
+    # module -> (depth, self us, cumulative us)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (depth, int(own), int(cumulative))
+    return times
+
+
+def best(code: str, runs: int) -> dict[str, tuple[int, int, int]]:
+    samples = [import_times(code) for _ in range(runs)]
+    return {
+        name: min((sample[name] for sample in samples if name in sample),
+                  key=lambda t: t[2])
+        for name in samples[0]
+    }
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    times = best("import main", runs)
+    print(f"import main  {times['main'][2] / 1000:8.1f} ms  (best of {runs})")
+    # what main.py imports itself, by cumulative cost. A module is listed
+    # after what it imports, main's own imports are the top level lines
+    # between the previous top level module and main
+    names = list(times)
+    start = max((n for n, name in enumerate(names[:names.index("main")])
+                 if times[name][0] == 0), default=-1) + 1
+    direct = sorted(
+        ((times[name][2], name) for name in names[start:names.index("main")]
+         if times[name][0] == 1),
+        reverse=True)
+    for cumulative, name in direct[:15]:
+        print(f"  {name:<24} {cumulative / 1000:8.1f} ms")
+
+    print("imported on first use, extra cost each:")
+    for module in DEFERRED:
+        extra = best(f"import main\nimport {module}", runs)
+        added = sum(own for name, (_, own, _) in extra.items() if name not in times)
+        print(f"  {module:<24} {added / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
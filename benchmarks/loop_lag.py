@@ -0,0 +1,83 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import offload  # noqa: E402
+import storage  # noqa: E402
+from print_context import workbook  # noqa: E402
+
+# Event loop lag while a few cold workbooks are parsed at once, the old way
+# (the blocking read right in the handler, on the loop) against offload.read.
+# A ping task stands in for every other client: it asks to run every 10 ms
+# and records how late it got to. Every run parses fresh copies, nothing
+# comes from the cache or the sidecars.
+#
+#   python benchmarks/loop_lag.py [rows] [workbooks]
+
+PING = 0.01
+
+
+async def ping(done: asyncio.Event, delays: list[float]):
+    loop = asyncio.get_running_loop()
+    while not done.is_set():
+        start = loop.time()
+        await asyncio.sleep(PING)
+        delays.append(loop.time() - start - PING)
+
+
+async def blocking(file_name: str, func, *args):
+    return func(*args)
+
+
+async def measure(files: list[str], read) -> tuple[float, list[float]]:
+    done = asyncio.Event()
+    delays: list[float] = []
+    pinger = asyncio.create_task(ping(done, delays))
+    await asyncio.sleep(PING * 5)
+    delays.clear()
+    start = time.perf_counter()
+    frames = await asyncio.gather(
+        *(read(file_name, db.get_frame, file_name) for file_name in files))
+    seconds = time.perf_counter() - start
+    assert all(len(frame) == len(frames[0]) for frame in frames)
+    done.set()
+    await pinger
+    return seconds, sorted(delays)
+
+
+def copies(source: str, directory: str, name: str, count: int) -> list[str]:
+    files = []
+    for n in range(count):
+        file_name = os.path.join(directory, f"{name}{n}.xlsx")
+        shutil.copy(source, file_name)
+        files.append(file_name)
+    return files
+
+
+async def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, "source.xlsx")
+    storage.write_xlsx(source, workbook(rows))
+
+    print(f"{count} workbooks of {rows} rows, {offload.STORAGE_THREADS} storage threads")
+    for name, read in (("on the loop", blocking), ("offload.read", offload.read)):
+        seconds, delays = await measure(copies(source, directory, name[:2], count), read)
+        worst = delays[-1] if delays else 0.0
+        p99 = delays[min(int(len(delays) * 0.99), len(delays) - 1)] if delays else 0.0
+        print(f"  {name:<13} {seconds:6.2f} s  {len(delays):5} pings"
+              f"  p99 lag {p99 * 1000:8.1f} ms  max {worst * 1000:8.1f} ms")
+    await offload.shutdown()
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
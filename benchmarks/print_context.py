@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+
+import numpy as np
+import num2words
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import printing  # noqa: E402
+
+# Bulk print context for a 50k bill workbook: the old row by row build of
+# /bill_all_print against printing.bills.
+#
+#   python benchmarks/print_context.py [rows]
+
+
+def workbook(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    days = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), "D")
+    return pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "invoiceNo": rng.integers(1, 5000, rows).astype(str),
+        "supplierName": "Supplier",
+        "supplierOtherInfo": "",
+        "goods": rng.choice(["Cotton", "Soybean", "Wheat"], rows),
+        "hsn_sac": 5201,
+        "quantity": rng.integers(1, 200, rows) / 4,
+        "rate": rng.choice([6500.0, 6620.5, 7010.0, 7125.25], rows),
+        "par": "",
+        "farmerName": rng.choice(["Ram", "Shyam", "Sita"], rows),
+        "vehicle_no": "MH40",
+        "farmerCode": "F1",
+        "before_wight": rng.integers(2000, 4000, rows).astype(float),
+        "after_wight": rng.integers(6000, 9000, rows).astype(float),
+        # typed into Excel, the only createdAt the old route could print
+        "createdAt": days.strftime("%d-%m-%Y"),
+        "year": "2024-25",
+        "in_time": "10:00",
+        "out_time": "11:30",
+        "address": "",
+    })
+
+
+def words(amount: str) -> str:
+    return " ".join(
+        [
+            str(num2words.num2words(k, lang="en_IN")) if k != "00" else ""
+            for k in amount.split(".")
+        ]
+    )
+
+
+def row_by_row(df_bill_data: pd.DataFrame) -> list[dict]:
+    # what /bill_all_print did before printing.bills
+    return [
+        {
+            "invoiceNo": i["invoiceNo"],
+            "date": i["createdAt"],
+            "supplierName": i["supplierName"],
+            "supplierOtherInfo": i["supplierOtherInfo"],
+            "items": [
+                {
+                    "farmerCode": i["farmerCode"],
+                    "good": i["goods"],
+                    "hsn_sac": i["hsn_sac"],
+                    "quantity": "{:.2f}".format(float(i["quantity"])),
+                    "rate": "{:.2f}".format(float(i["rate"])),
+                    "par": i["par"],
+                    "amount": "{:.2f}".format(float(i["quantity"]) * float(i["rate"])),
+                    "vehicle_no": i["vehicle_no"],
+                    "invoiceNo": i["invoiceNo"],
+                    "total": "{:.2f}".format(float(i["quantity"]) * float(i["rate"])),
+                    "amount_in_word": words(
+                        "{:.2f}".format(float(i["quantity"]) * float(i["rate"]))),
+                }
+            ],
+            "total_quantity": "{:.2f}".format(i["quantity"]),
+            "total_amount": "{:.2f}".format(float(i["quantity"]) * float(i["rate"])),
+            "bill_items": [
+                {
+                    "hsn_sac": i["hsn_sac"],
+                    "total": "{:.2f}".format(float(i["quantity"]) * float(i["rate"])),
+                }
+            ],
+            "tex_amount": "{:.2f}".format(float(i["quantity"]) * float(i["rate"])),
+            "amount_in_word": words(
+                "{:.2f}".format(float(i["quantity"]) * float(i["rate"]))),
+            "par": i["par"],
+        }
+        for i in df_bill_data.to_dict(orient="records")
+    ]
+
+
+def timed(build, df_bill_data: pd.DataFrame):
+    start = time.perf_counter()
+    result = list(build(df_bill_data))
+    return time.perf_counter() - start, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    df_bill_data = workbook(rows)
+    old_seconds, old = timed(row_by_row, df_bill_data)
+    new_seconds, new = timed(printing.bills, df_bill_data)
+
+    # the new route prints the date as dd/mm/YYYY, everything else matches
+    for before, after in zip(old, new):
+        assert {**before, "date": None} == {**after, "date": None}, (before, after)
+
+    print(f"{rows} bills")
+    print(f"row by row     {old_seconds:8.3f} s")
+    print(f"printing.bills {new_seconds:8.3f} s  ({old_seconds / new_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
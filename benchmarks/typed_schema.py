@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import reader  # noqa: E402
+import storage  # noqa: E402
+
+# Memory of a year of bills once loaded: the workbook as read, every text
+# column a Python string per bill, against storage.typed's BILL_SCHEMA.
+# The workbook looks like a season at a ginning mill: a few hundred
+# farmers and vehicles, a handful of goods, weights and times from the
+# form (text), createdAt from the app and some typed into Excel.
+#
+#   python benchmarks/typed_schema.py [rows]
+
+
+def yearly_workbook(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    farmers = np.array([f"Farmer {n} Patil" for n in range(600)])
+    codes = np.array([f"MHNAGICS{10000 + n}" for n in range(600)])
+    vehicles = np.array([f"MH40CD{1000 + n}" for n in range(250)])
+    farmer = rng.integers(0, len(farmers), rows)
+    days = pd.Timestamp("2024-10-01") + pd.to_timedelta(np.sort(rng.integers(0, 365, rows)), "D")
+    created = pd.Series(days + pd.to_timedelta(rng.integers(8 * 3600, 18 * 3600, rows), "s"),
+                        dtype=object)
+    typed_in = rng.random(rows) < 0.2
+    created[typed_in] = days[typed_in].strftime("%d-%m-%Y")
+    minutes = rng.integers(8 * 60, 17 * 60, rows)
+    before = rng.integers(2000, 4000, rows)
+    return pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "invoiceNo": np.arange(1, rows + 1).astype(str),
+        "supplierName": farmers[farmer],
+        "supplierOtherInfo": rng.choice(["Masora", "Bhandara", "Pauni"], rows),
+        "goods": rng.choice(["REGENAGRI RAW COTTON", "RAW COTTON", "SOYBEAN", "WHEAT"], rows),
+        "hsn_sac": rng.choice(["52010015", "12019000", "10019910"], rows),
+        "quantity": rng.integers(10, 400, rows) / 10,
+        "rate": rng.choice([6500.0, 6620.5, 7010.0, 7125.25, 7700.0], rows),
+        "par": "Qtl",
+        "farmerName": farmers[farmer],
+        "vehicle_no": vehicles[rng.integers(0, len(vehicles), rows)],
+        "farmerCode": codes[farmer],
+        "before_wight": before.astype(str),
+        "after_wight": (before + rng.integers(1000, 5000, rows)).astype(str),
+        "createdAt": created,
+        "year": "2024-2025",
+        "in_time": [f"{m // 60:02}:{m % 60:02}" for m in minutes],
+        "out_time": [f"{m // 60:02}:{m % 60:02}" for m in minutes + 90],
+        "address": rng.choice(["Masora", "Bhandara", "Pauni"], rows),
+    })
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    directory = tempfile.mkdtemp()
+    file_name = os.path.join(directory, "bills.xlsx")
+    storage.write_xlsx(file_name, yearly_workbook(rows))
+    as_read = reader.read(file_name)
+    os.remove(file_name)
+    os.rmdir(directory)
+
+    start = time.perf_counter()
+    typed = storage.typed(as_read)
+    seconds = time.perf_counter() - start
+    # codes become text, categories where BILL_SCHEMA says so
+    assert typed.dtypes.astype(str).to_dict() == {
+        **as_read.dtypes.astype(str).to_dict(),
+        **dict.fromkeys(storage.CODE_COLUMNS, "object"), **storage.BILL_SCHEMA}
+    # nothing is lost: the prints and exports read the same values back
+    for column in ("quantity", "rate", "before_wight", "after_wight"):
+        assert (pd.to_numeric(as_read[column]) == typed[column]).all(), column
+    assert storage.created_dates(as_read["createdAt"]).equals(typed["createdAt"])
+    assert (as_read["goods"] == typed["goods"].astype(object)).all()
+
+    before = as_read.memory_usage(index=False, deep=True)
+    after = typed.memory_usage(index=False, deep=True)
+    print(f"{rows} bills, typed in {seconds * 1000:.0f} ms")
+    print(f"  {'column':<18} {'as read':>10} {'typed':>10}")
+    for column in as_read.columns:
+        print(f"  {column:<18} {before[column] / 2**20:8.2f} MB {after[column] / 2**20:8.2f} MB"
+              f"  {str(typed[column].dtype)[:14]}")
+    print(f"  {'total':<18} {before.sum() / 2**20:8.2f} MB {after.sum() / 2**20:8.2f} MB"
+          f"  {before.sum() / after.sum():.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
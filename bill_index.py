@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+import sidecar
+
+# Hash indexes over a workbook: id -> row position and invoiceNo -> row
+# positions. The index of the rows stored in the .xlsx is persisted next to
+# the sidecar and trusted only while the workbook fingerprint matches, rows
+# coming from the journal are added on top in memory.
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_invoice(value) -> str:
+    # Excel hands back 12 for what the form posted as "12"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+class BillIndex:
+    def __init__(self, by_id: dict[int, int], by_invoice: dict[str, list[int]], rows: int):
+        self.by_id = by_id
+        self.by_invoice = by_invoice
+        self.rows = rows
+
+    @classmethod
+    def build(cls, df_bill_data: pd.DataFrame):
+        return cls({}, {}, 0).extend(df_bill_data, 0)
+
+    def position(self, bill_id):
+        return self.by_id.get(_as_id(bill_id))
+
+    def positions_for_invoice(self, invoice_no) -> list[int]:
+        return self.by_invoice.get(_as_invoice(invoice_no), [])
+
+    # Function to index the rows of the frame from position `start` on.
+    # Rows are only ever appended, so positions handed out before stay valid
+
+    def extend(self, df_bill_data: pd.DataFrame, start: int):
+        by_id = self.by_id
+        by_invoice = self.by_invoice
+        ids = df_bill_data['id'].values[start:]
+        invoices = df_bill_data['invoiceNo'].values[start:]
+        for offset, (bill_id, invoice_no) in enumerate(zip(ids, invoices)):
+            position = start + offset
+            bill_id = _as_id(bill_id)
+            if bill_id is not None:
+                # first row wins, like the old boolean mask lookup
+                by_id.setdefault(bill_id, position)
+            by_invoice.setdefault(_as_invoice(invoice_no), []).append(position)
+        self.rows = len(df_bill_data)
+        return self
+
+    # Function to drop the row at `position`, later rows move up by one
+
+    def removed(self, position: int):
+        def shift(p):
+            return p - 1 if p > position else p
+
+        by_id = {k: shift(p) for k, p in self.by_id.items() if p != position}
+        by_invoice = {}
+        for k, positions in self.by_invoice.items():
+            kept = [shift(p) for p in positions if p != position]
+            if kept:
+                by_invoice[k] = kept
+        return BillIndex(by_id, by_invoice, self.rows - 1)
+
+    def to_json(self) -> dict:
+        return {"rows": self.rows, "id": self.by_id, "invoiceNo": self.by_invoice}
+
+    @classmethod
+    def from_json(cls, data: dict):
+        return cls(
+            {int(k): v for k, v in data["id"].items()},
+            data["invoiceNo"],
+            data["rows"],
+        )
+
+# Function to load the persisted index of the workbook rows, or build it
+
+
+def load_or_build(file_name: str, fingerprint, df_bill_data: pd.DataFrame) -> BillIndex:
+    path = sidecar.path_for(file_name, ".index.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if tuple(data["fingerprint"]) == tuple(fingerprint) and data["rows"] == len(df_bill_data):
+            return BillIndex.from_json(data)
+    except (OSError, ValueError, KeyError):
+        pass
+    index = BillIndex.build(df_bill_data)
+    save(file_name, fingerprint, index)
+    return index
+
+
+def save(file_name: str, fingerprint, index: BillIndex):
+    path = sidecar.path_for(file_name, ".index.json")
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": list(fingerprint), **index.to_json()}, f)
+        os.replace(path + ".tmp", path)
+    except Exception as e:
+        print(f"Error writing index for {file_name}: {e}")
+
+# Indexes of the frames currently served, keyed like cache.frames
+
+
+class IndexRegistry:
+    def __init__(self):
+        self._entries: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str, version):
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(path))
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def put(self, path: str, version, index: BillIndex):
+        with self._lock:
+            self._entries[os.path.abspath(path)] = (version, index)
+
+    def rekey(self, path: str, old_version, new_version):
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == old_version:
+                self._entries[key] = (new_version, entry[1])
+
+
+live = IndexRegistry()
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory the parsed workbooks may use before the least recently used go
+CACHE_BUDGET_BYTES = int(os.environ.get("BILL_CACHE_MB", 256)) * 1024 * 1024
+
+# Memory for rendered single bill prints
+PAGE_CACHE_BYTES = int(os.environ.get("BILL_PAGE_CACHE_MB", 32)) * 1024 * 1024
+
+
+def frame_size(df_bill_data: pd.DataFrame) -> int:
+    return int(df_bill_data.memory_usage(index=True, deep=True).sum())
+
+# Process wide LRU cache of parsed workbooks.
+# Each entry remembers the version (file fingerprints) it was read at, a
+# lookup with any other version is a miss, so edits made in Excel are
+# picked up on the next request. Cached frames are shared, treat them as
+# read only.
+
+
+class DataFrameCache:
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: str, version):
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, path: str, version, df_bill_data: pd.DataFrame):
+        key = os.path.abspath(path)
+        size = frame_size(df_bill_data)
+        with self._lock:
+            self._drop(key)
+            if size > self.budget_bytes:
+                return
+            self._entries[key] = (version, df_bill_data, size)
+            self._used += size
+            while self._used > self.budget_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def rekey(self, path: str, old_version, new_version):
+        # The data did not change, only the files holding it did
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == old_version:
+                self._entries[key] = (new_version, entry[1], entry[2])
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._drop(os.path.abspath(path))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used = 0
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._used -= entry[2]
+
+
+frames = DataFrameCache(CACHE_BUDGET_BYTES)
+
+
+def _plain(value):
+    # a column turns from int to float when a bill with a decimal is added,
+    # 7700 and 7700.0 print the same and must hash the same
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+# Function to hash the content of a bill row
+
+
+def row_hash(row: dict) -> str:
+    content = json.dumps(
+        {key: _plain(value) for key, value in row.items()},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+# LRU cache of rendered pages, keyed by their strong ETag, which already
+# names everything the page was rendered from (see page_etag). Entries are
+# never stale, a changed bill or template simply gets a new key.
+
+
+class PageCache:
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: str, body: bytes):
+        if len(body) > self.budget_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._used -= len(old)
+            self._entries[key] = body
+            self._used += len(body)
+            while self._used > self.budget_bytes:
+                self._used -= len(self._entries.popitem(last=False)[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used = 0
+
+
+pages = PageCache(PAGE_CACHE_BYTES)
+
+# Function to name a rendered page: the workbook, the template and the
+# time it was last changed, and the content of the bill (its id included)
+
+
+def page_etag(file_name: str, template_path: str, row: dict) -> str:
+    key = "\0".join([
+        os.path.abspath(file_name),
+        template_path,
+        str(os.stat(template_path).st_mtime_ns),
+        row_hash(row),
+    ])
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
@@ -0,0 +1,83 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+# Dashboard chart series: daily totals from the workbook summaries, grouped
+# into day / week / month buckets and thinned down to a point budget with
+# largest-triangle-three-buckets, which keeps the peaks and dips a plain
+# stride would drop.
+
+BUCKETS = {
+    "day": "%d-%b-%y",
+    "week": "%d-%b-%y",
+    "month": "%b-%y",
+}
+
+
+def _bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+# Function to add up the daily totals of several workbooks per bucket
+
+
+def series(summaries: list[dict], bucket: str = "day"):
+    amounts: dict[date, float] = {}
+    for result in summaries:
+        for day, values in result["days"].items():
+            try:
+                start = _bucket_start(
+                    datetime.strptime(day, "%Y-%m-%d").date(), bucket)
+            except ValueError:
+                # bills whose date could not be read
+                continue
+            amounts[start] = amounts.get(start, 0.0) + values["amount"]
+    starts = sorted(amounts)
+    return starts, [amounts[start] for start in starts]
+
+# Function to pick `threshold` points out of x/y that keep the shape
+# (largest-triangle-three-buckets), returns the indexes of the kept points
+
+
+def lttb(x, y, threshold: int):
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # average of the next bucket is the third corner of the triangle
+        next_start = int(np.floor((i + 1) * every)) + 1
+        next_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        kept.append(a)
+    kept.append(n - 1)
+    return np.asarray(kept)
+
+# Function to build what the dashboard chart draws
+
+
+def chart_data(summaries: list[dict], bucket: str = "day", points: int = 365) -> dict:
+    starts, values = series(summaries, bucket)
+    kept = lttb([start.toordinal() for start in starts], values, points)
+    return {
+        "bucket": bucket,
+        "labels": [starts[i].strftime(BUCKETS[bucket]) for i in kept],
+        "data": [round(values[i], 2) for i in kept],
+        "total_points": len(starts),
+    }
@@ -1,9 +1,19 @@
 import pandas as pd
 import os
+import tempfile
 from datetime import datetime
 from pydantic import BaseModel
-from openpyxl import Workbook, load_workbook
-from typing import Optional
+import bill_index
+import cache
+import journal
+import reader
+import sidecar
+import sqlite_engine  # noqa: F401  registers the sqlite engine
+import storage
+import summary
+
+# Number of journal rows after which the workbook's writer compacts it
+JOURNAL_COMPACT_ROWS = int(os.environ.get("BILL_JOURNAL_COMPACT_ROWS", 50))
 
 # Set Pandas display options
 pd.set_option('display.max_columns', 1000, 'display.width',
@@ -35,81 +45,438 @@ class Bill(BaseModel):
 
 
 def check_excel(file_name: str):
-    if not os.path.exists(file_name):
-        bill_data_columns = [
-            "id",
-            "invoiceNo",
-            "supplierName",
-            "supplierOtherInfo",
-            "goods",
-            "hsn_sac",
-            "quantity",
-            "rate",
-            "par",
-            "farmerName",
-            "vehicle_no",
-            "farmerCode",
-            "before_wight",
-            "after_wight",
-            "createdAt",
-            "year",
-            "in_time",
-            "out_time",
-            "address"
-        ]
-
-        # Create an empty DataFrame with the specified columns
-        df_bill_data = pd.DataFrame(columns=bill_data_columns)
-
-        # Save the DataFrame to an Excel file
-        df_bill_data.to_excel(file_name, index=False, sheet_name='Sheet1')
-
-        # Set column widths using openpyxl
-        workbook = load_workbook(file_name)
-        worksheet = workbook.active
-        column_widths = {
-            'A': 10,  # id
-            'B': 20,  # invoiceNo
-            'C': 30,  # supplierName
-            'D': 30,  # supplierOtherInfo
-            'E': 15,  # goods
-            'F': 15,  # hsn_sac
-            'G': 10,  # quantity
-            'H': 10,  # rate
-            'I': 10,  # par
-            'J': 20,  # villagerName
-            'K': 15,  # vehicle_no
-            'L': 15,  # goodType
-            'M': 15,  # before_wight
-            'N': 15,  # after_wight
-            'O': 20,  # createdAt
-        }
-
-        # Set column widths
-        for col, width in column_widths.items():
-            worksheet.column_dimensions[col].width = width
-
-        # Save the workbook
-        workbook.save(file_name)
-
-        return (True, df_bill_data)
-
-    # If the file exists, read and return the data
-    df_bill_data = pd.read_excel(file_name)
-    return (True, df_bill_data)
+    engine = _workbook(file_name)
+    return (True, engine.load(file_name))
 
-# Function to create a new bill entry
 
+def _workbook(file_name: str) -> storage.StorageEngine:
+    engine = storage.engine()
+    if not engine.exists(file_name):
+        engine.create(file_name)
+    return engine
 
-def create_bill(file_name: str, data: Bill):
-    it_valid_excel, df_bill_data = check_excel(file_name)
-    if not it_valid_excel:
+# Function to create an empty workbook
+
+
+def _create_excel(file_name: str):
+    bill_data_columns = storage.BILL_COLUMNS
+
+    # Create an empty DataFrame with the specified columns
+    df_bill_data = pd.DataFrame(columns=bill_data_columns)
+
+    # Save the DataFrame to an Excel file
+    df_bill_data.to_excel(file_name, index=False, sheet_name='Sheet1')
+
+    # Set column widths using openpyxl, imported here, it is slow to import
+    # and only needed for new workbooks
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_name)
+    worksheet = workbook.active
+    column_widths = {
+        'A': 10,  # id
+        'B': 20,  # invoiceNo
+        'C': 30,  # supplierName
+        'D': 30,  # supplierOtherInfo
+        'E': 15,  # goods
+        'F': 15,  # hsn_sac
+        'G': 10,  # quantity
+        'H': 10,  # rate
+        'I': 10,  # par
+        'J': 20,  # villagerName
+        'K': 15,  # vehicle_no
+        'L': 15,  # goodType
+        'M': 15,  # before_wight
+        'N': 15,  # after_wight
+        'O': 20,  # createdAt
+    }
+
+    # Set column widths
+    for col, width in column_widths.items():
+        worksheet.column_dimensions[col].width = width
+
+    # Save the workbook
+    workbook.save(file_name)
+
+# Function to get the bills of an existing workbook together with their index
+
+
+def _load(file_name: str):
+    version = _version(file_name)
+    df_bill_data = cache.frames.get(file_name, version)
+    index = bill_index.live.get(file_name, version)
+    if df_bill_data is not None and index is not None:
+        return df_bill_data, index
+    df_bill_data = _read_workbook(file_name, version[0])
+    index = bill_index.load_or_build(file_name, version[0], df_bill_data)
+    workbook_rows = len(df_bill_data)
+    df_bill_data, _, dropped = _merge_journal(file_name, df_bill_data)
+    if dropped:
+        index = bill_index.BillIndex.build(df_bill_data)
+    else:
+        index.extend(df_bill_data, workbook_rows)
+    _remember(file_name, version, df_bill_data, index)
+    return df_bill_data, index
+
+
+def _remember(file_name: str, version, df_bill_data: pd.DataFrame, index):
+    cache.frames.put(file_name, version, df_bill_data)
+    bill_index.live.put(file_name, version, index)
+
+
+def _row(df_bill_data: pd.DataFrame, position):
+    # Positions come from the index, guard against one that is ahead of us
+    if position is None or position >= len(df_bill_data):
+        return None
+    return df_bill_data.iloc[[position]].to_dict(orient='records')[0]
+
+# Function to read the workbook, through its columnar sidecar when it is current
+
+
+def _read_workbook(file_name: str, fingerprint):
+    df_bill_data = sidecar.load(file_name, fingerprint)
+    if df_bill_data is None:
+        df_bill_data = storage.typed(reader.read(file_name), file_name)
+        sidecar.save(file_name, fingerprint, df_bill_data)
+    return storage.typed(df_bill_data, file_name)
+
+# Function to read some columns of the bills, from the loaded workbook, the
+# sidecar or the .xlsx itself, whichever is at hand first. Projections are
+# cached like whole workbooks, with their display columns
+
+
+def _load_columns(file_name: str, columns: list[str]) -> pd.DataFrame:
+    version = _version(file_name)
+    df_bill_data = cache.frames.get(file_name, version)
+    displayed = set(columns) & set(storage.DISPLAY_COLUMNS)
+    if df_bill_data is not None and not displayed:
+        return df_bill_data.reindex(columns=columns)
+    key = storage.projection_key(file_name, columns)
+    projected = cache.frames.get(key, version)
+    if projected is not None:
+        return projected
+    if df_bill_data is None:
+        # the ids tell which journal rows a compaction already folded in
+        read = storage.read_columns(columns if "id" in columns else ["id"] + columns)
+        df_bill_data = sidecar.load(file_name, version[0], read)
+        if df_bill_data is None:
+            df_bill_data = reader.read(file_name, read)
+        df_bill_data, _, _ = _merge_journal(file_name, storage.typed(df_bill_data, file_name))
+    df_bill_data = storage.select(df_bill_data, columns)
+    cache.frames.put(key, version, df_bill_data)
+    return df_bill_data
+
+# Function to merge in rows still waiting in the journal
+
+
+def _merge_journal(file_name: str, df_bill_data: pd.DataFrame):
+    # Returns the bills, the number of journal lines merged and whether
+    # bills of the workbook were dropped (positions after them moved)
+    rows = journal.read_rows(file_name)
+    if not rows:
+        return df_bill_data, 0, False
+    known_ids = set(df_bill_data['id'].values)
+    pending, deleted = {}, set()
+    for row in rows:
+        if journal.DELETED in row:
+            # a delete, journaled before its workbook rewrite: the bills
+            # stay deleted whether or not that rewrite happened
+            for bill_id in row[journal.DELETED]:
+                pending.pop(bill_id, None)
+                deleted.add(bill_id)
+        elif row['id'] not in known_ids:
+            # rows that a compaction already folded into the workbook are
+            # skipped
+            pending[row['id']] = row
+    dropped = bool(deleted & known_ids)
+    if dropped:
+        df_bill_data = df_bill_data[
+            ~df_bill_data['id'].isin(list(deleted))].reset_index(drop=True)
+    if pending:
+        df_bill_data = storage.append(
+            df_bill_data, pd.DataFrame(list(pending.values())), file_name)
+    return df_bill_data, len(rows), dropped
+
+
+def _fingerprint(file_name: str):
+    stat = os.stat(file_name)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _version(file_name: str):
+    # Workbook and journal together decide what check_excel returns
+    journal_file = journal.journal_path(file_name)
+    return (
+        _fingerprint(file_name),
+        _fingerprint(journal_file) if os.path.exists(journal_file) else None,
+    )
+
+
+def _assign(df_bill_data: pd.DataFrame, positions: list[int], column: str, values):
+    # Write values into rows of a column, widening it when the types differ
+    # (whole numbers getting a fraction, numbers getting text)
+    if not positions:
+        return
+    if column not in df_bill_data.columns:
+        df_bill_data[column] = None
+    current = df_bill_data[column].dtype
+    if current != values.dtype:
+        numbers = values.dtype.kind == "f" and current.kind in "iuf"
+        df_bill_data[column] = df_bill_data[column].astype(
+            "float64" if numbers else object)
+    df_bill_data.iloc[positions, df_bill_data.columns.get_loc(column)] = values
+
+
+def _file_mode(file_name: str) -> int:
+    try:
+        return os.stat(file_name).st_mode & 0o7777
+    except FileNotFoundError:
+        # a new file gets what open() would give it under the umask
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _write_temp(file_name: str, df_bill_data: pd.DataFrame) -> str:
+    # Write to a temp file of its own next to the workbook, two rewrites
+    # never share one and a failed write never leaves a half written file
+    fd, tmp_name = tempfile.mkstemp(
+        dir=os.path.dirname(file_name) or ".", suffix=".xlsx.tmp")
+    os.close(fd)
+    try:
+        # mkstemp makes it private (0600), give it the workbook's mode so
+        # whoever could open the workbook still can once it is swapped in
+        os.chmod(tmp_name, _file_mode(file_name))
+        storage.write_xlsx(tmp_name, df_bill_data)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+    return tmp_name
+
+
+def _replace_excel(file_name: str, df_bill_data: pd.DataFrame):
+    # Write next to the workbook and swap it in
+    os.replace(_write_temp(file_name, df_bill_data), file_name)
+
+# Function to fold the journal into the workbook
+
+
+def compact_journal(file_name: str):
+    if not os.path.exists(journal.journal_path(file_name)):
+        return True
+    try:
+        with journal.lock_for(file_name):
+            fingerprint = _fingerprint(file_name)
+            df_bill_data = _read_workbook(file_name, fingerprint)
+            df_bill_data, folded, _ = _merge_journal(file_name, df_bill_data)
+        # The slow rewrite runs without the lock, inserts keep landing in
+        # the journal meanwhile
+        tmp_name = _write_temp(file_name, df_bill_data)
+        with journal.lock_for(file_name):
+            if _fingerprint(file_name) != fingerprint:
+                # The workbook changed underneath us, try again later
+                os.remove(tmp_name)
+                return False
+            before = _version(file_name)
+            os.replace(tmp_name, file_name)
+            journal.discard_rows(file_name, folded)
+            after = _version(file_name)
+            cache.frames.rekey(file_name, before, after)
+            bill_index.live.rekey(file_name, before, after)
+            summary.rekey(file_name, before, after)
+        fingerprint = _fingerprint(file_name)
+        sidecar.save(file_name, fingerprint, df_bill_data)
+        bill_index.save(file_name, fingerprint,
+                        bill_index.BillIndex.build(df_bill_data))
+    except Exception as e:
+        print(f"Error compacting journal for {file_name}: {e}")
         return False
+    return True
+
+
+def compact_all(directory: str):
+    for file_name in journal.pending_journals(directory):
+        compact_journal(file_name)
 
-    new_id = df_bill_data['id'].max() + 1 if not df_bill_data.empty else 1
 
-    new_bill = {
-        "id": str(new_id),
+_compaction_due: set[str] = set()
+
+# Function to tell (once) whether a workbook's journal has grown enough to be
+# compacted, the workbook's writer then compacts it like any other write
+
+
+def compaction_due(file_name: str) -> bool:
+    if file_name not in _compaction_due:
+        return False
+    _compaction_due.discard(file_name)
+    return True
+
+# Excel workbook storage: the .xlsx stays the system of record, inserts go
+# through the journal and reads through the cache, sidecar and index
+
+
+@storage.register
+class ExcelEngine(storage.StorageEngine):
+    name = "excel"
+
+    def exists(self, file_name: str) -> bool:
+        return os.path.exists(file_name)
+
+    def version(self, file_name: str):
+        return _version(file_name)
+
+    def create(self, file_name: str):
+        _create_excel(file_name)
+
+    def load(self, file_name: str) -> pd.DataFrame:
+        df_bill_data, index = _load(file_name)
+        return df_bill_data
+
+    def load_columns(self, file_name: str, columns: list[str], where=None) -> pd.DataFrame:
+        return storage.select(_load_columns(file_name, columns), columns, where)
+
+    def insert(self, file_name: str, rows: list[dict]) -> list[int]:
+        with journal.lock_for(file_name):
+            df_bill_data, index = _load(file_name)
+
+            new_id = int(df_bill_data['id'].max()) + \
+                1 if not df_bill_data.empty else 1
+            rows = [{"id": new_id + n, **row} for n, row in enumerate(rows)]
+
+            # Append the new bills to the journal, the workbook catches up
+            # on the next compaction
+            journal.append_rows(file_name, rows)
+            known_rows = len(df_bill_data)
+            df_bill_data = storage.append(df_bill_data, pd.DataFrame(rows), file_name)
+            _remember(file_name, _version(file_name), df_bill_data,
+                      index.extend(df_bill_data, known_rows))
+            if len(journal.read_rows(file_name)) >= JOURNAL_COMPACT_ROWS:
+                _compaction_due.add(file_name)
+        return [row["id"] for row in rows]
+
+    def upsert(self, file_name: str, chunks) -> tuple[int, int]:
+        with journal.lock_for(file_name):
+            df_bill_data, index = _load(file_name)
+            df_bill_data = df_bill_data.copy()
+            next_id = int(df_bill_data['id'].max()) + \
+                1 if not df_bill_data.empty else 1
+            # What an id of the upload points at: ("row", position) for a
+            # bill of the workbook, ("new", number) for a bill added earlier
+            # in the upload. Rows are matched on their id only, the items of
+            # one invoice share its invoiceNo
+            seen_ids = {}
+            added, added_ids, superseded = [], [], set()
+            updated_rows = set()
+            for chunk in chunks:
+                updates, new = {}, []
+                for offset, bill_id in enumerate(chunk['id']):
+                    bill_id = None if pd.isna(bill_id) else int(bill_id)
+                    target = seen_ids.get(bill_id)
+                    if target is None and index.position(bill_id) is not None:
+                        target = ("row", index.position(bill_id))
+
+                    if target is not None and target[0] == "row":
+                        updates[target[1]] = offset
+                        updated_rows.add(target[1])
+                    else:
+                        if target is not None:
+                            # the same bill twice in the upload, the later
+                            # row replaces the earlier one and keeps its id
+                            superseded.add(target[1])
+                            new_id = added_ids[target[1]]
+                        else:
+                            new_id = next_id
+                            next_id += 1
+                        target = ("new", len(added_ids))
+                        added_ids.append(new_id)
+                        new.append(offset)
+                    if bill_id is not None:
+                        seen_ids[bill_id] = target
+
+                positions = list(updates)
+                offsets = list(updates.values())
+                for column in storage.BILL_COLUMNS[1:]:
+                    _assign(df_bill_data, positions, column,
+                            chunk[column].to_numpy()[offsets])
+                rows = chunk.iloc[new].copy()
+                rows['id'] = added_ids[len(added_ids) - len(new):]
+                added.append(rows)
+
+            if added_ids:
+                rows = pd.concat(added, ignore_index=True)
+                keep = [number not in superseded for number in range(len(rows))]
+                rows = rows.loc[keep].astype({'id': 'int64'})
+                df_bill_data = pd.concat(
+                    [df_bill_data, rows], ignore_index=True
+                ) if not df_bill_data.empty else rows.reset_index(drop=True)
+            # updated cells and new bills come in untyped
+            df_bill_data = storage.typed(df_bill_data, file_name)
+            inserted = len(added_ids) - len(superseded)
+            updated = len(updated_rows)
+
+            # One rewrite for the whole upload, the journal rows are in it
+            _replace_excel(file_name, df_bill_data)
+            journal.discard_rows(file_name, len(journal.read_rows(file_name)))
+            index = bill_index.BillIndex.build(df_bill_data)
+            _remember(file_name, _version(file_name), df_bill_data, index)
+            sidecar.save(file_name, _fingerprint(file_name), df_bill_data)
+            bill_index.save(file_name, _fingerprint(file_name), index)
+        return inserted, updated
+
+    def get(self, file_name: str, bill_id: int) -> dict | None:
+        df_bill_data, index = _load(file_name)
+        return _row(df_bill_data, index.position(bill_id))
+
+    def find_invoice(self, file_name: str, invoice_no: str) -> list[dict]:
+        df_bill_data, index = _load(file_name)
+        return [_row(df_bill_data, p) for p in index.positions_for_invoice(invoice_no)]
+
+    def delete_many(self, file_name: str, bill_ids: list[int]) -> list[int]:
+        with journal.lock_for(file_name):
+            df_bill_data, index = _load(file_name)
+            found = {}
+            for bill_id in bill_ids:
+                position = index.position(bill_id)
+                if position is not None:
+                    found.setdefault(position, bill_id)
+            if not found:
+                return []
+
+            df_bill_data = df_bill_data.drop(
+                df_bill_data.index[list(found)]).reset_index(drop=True)
+            if len(found) == 1:
+                index = index.removed(next(iter(found)))
+            else:
+                index = bill_index.BillIndex.build(df_bill_data)
+            # Journal the delete first: journaled bills are replayed unless
+            # the workbook has their id, a crash after the rewrite (before
+            # the journal is discarded) would bring them back otherwise
+            undo = journal.append_deleted(file_name, list(found.values()))
+            try:
+                _replace_excel(file_name, df_bill_data)
+            except BaseException:
+                journal.truncate(file_name, undo)
+                raise
+            # The rewrite already contains the journal rows, so drop them
+            journal.discard_rows(file_name, len(journal.read_rows(file_name)))
+            _remember(file_name, _version(file_name), df_bill_data, index)
+            sidecar.save(file_name, _fingerprint(file_name), df_bill_data)
+            bill_index.save(file_name, _fingerprint(file_name), index)
+        return list(found.values())
+
+    def export_xlsx(self, file_name: str) -> str:
+        # Make sure journaled bills are in the workbook before handing it out
+        compact_journal(file_name)
+        return file_name
+
+    def workbooks(self, directory: str) -> list[str]:
+        return storage.glob_workbooks(directory, "*.xlsx")
+
+# Function to turn the submitted form into a bill row (the id is given by the engine)
+
+
+def _bill_row(data: Bill) -> dict:
+    return {
         "invoiceNo": data.invoiceNo,
 
         "supplierName": data.supplierName,
@@ -129,32 +496,38 @@ def create_bill(file_name: str, data: Bill):
         "in_time": data.in_time,
         "out_time": data.out_time,
         "address": data.address
+    }
 
+# Function to create a new bill entry
 
-    }
-    # Append the new bill to the DataFrame
-    df_bill_data = pd.concat(
-        [df_bill_data, pd.DataFrame([new_bill])], ignore_index=True)
-    try:
-        with pd.ExcelWriter(file_name, engine='xlsxwriter') as writer:
-            df_bill_data.to_excel(writer, index=False, sheet_name='Sheet1')
 
-            # Access the XlsxWriter workbook and worksheet objects
-            workbook = writer.book
-            worksheet = writer.sheets['Sheet1']
+def create_bill(file_name: str, data: Bill):
+    return create_bills(file_name, [data]) is not False
+
+# Function to create several bills with one write, returns their ids
 
-            # Set the date format for the 'createdAt' column
-            date_format = workbook.add_format(
-                {'num_format': 'dd-mmm-yy'})  # Set format to '15-Oct-24'
-            # Adjust column width and set format (E is the 5th column)
-            worksheet.set_column('O:O', 12, date_format)
 
+def create_bills(file_name: str, data: list[Bill]):
+    engine = _workbook(file_name)
+    # one timestamp for the batch, the bills were entered together
+    now = datetime.now()
+    rows = [{**_bill_row(bill), "createdAt": now} for bill in data]
+    try:
+        before = engine.version(file_name)
+        ids = engine.insert(file_name, rows)
     except Exception as e:
-        print(f"Error saving to Excel file: {e}")
+        print(f"Error saving bills: {e}")
         return False
-    # df_bill_data.to_excel(file_name, index=False, sheet_name='Sheet1')
+    summary.added(file_name, before, engine.version(file_name), rows)
+    return ids
+
+# Function to add or update bills in bulk from converted upload chunks,
+# returns the number of bills inserted and updated
 
-    return True
+
+def import_bills(file_name: str, chunks):
+    engine = _workbook(file_name)
+    return engine.upsert(file_name, chunks)
 
 # Function to get a list of bills
 
@@ -163,26 +536,55 @@ def get_list(file_name: str):
     it_valid_excel, df_bill_data = check_excel(file_name)
     return df_bill_data.to_dict(orient="records")
 
+# Function to get all bills as a DataFrame, for the bulk print routes
+
+
+def get_frame(file_name: str) -> pd.DataFrame:
+    it_valid_excel, df_bill_data = check_excel(file_name)
+    return df_bill_data
+
+# Function to get some columns of all bills, for the routes that need only
+# a few fields of every bill
+
+
+def get_columns(file_name: str, columns: list[str], where=None) -> pd.DataFrame:
+    return _workbook(file_name).load_columns(file_name, columns, where)
+
+# Function to get one page of bills for the bill list
+
+
+def list_page(file_name: str, query: storage.BillQuery):
+    return _workbook(file_name).query(file_name, query)
+
 # Function to read a specific bill by ID
 
 
 def read_data(file_name: str, bill_id: str):
-    it_valid_excel, df_bill_data = check_excel(file_name)
-    bill = df_bill_data[df_bill_data['id'] == int(bill_id)]
-    bill_data = bill.to_dict(orient='records')[0] if not bill.empty else None
-    return bill_data
+    return _workbook(file_name).get(file_name, int(bill_id))
+
+# Function to read the bills carrying an invoice number
+
+
+def read_by_invoice(file_name: str, invoice_no: str):
+    return _workbook(file_name).find_invoice(file_name, invoice_no)
 
 # Function to delete a bill by ID
 
 
 def delete_bill(file_name: str, bill_id: str):
-    it_valid_excel, df_bill_data = check_excel(file_name)
-    if int(bill_id) not in df_bill_data['id'].values:
-        return False
+    return bool(delete_bills(file_name, [bill_id]))
 
-    df_bill_data = df_bill_data[df_bill_data['id']
-                                != int(bill_id)].reset_index(drop=True)
-    # print(df_bill_data)
-    df_bill_data.to_excel(file_name, index=False, sheet_name='Sheet1')
+# Function to delete several bills with one write, returns the ids of the
+# bills that were found and deleted
+
+
+def delete_bills(file_name: str, bill_ids: list[str]):
+    engine = _workbook(file_name)
+    bill_ids = [int(bill_id) for bill_id in bill_ids]
+    bills = {bill_id: engine.get(file_name, bill_id) for bill_id in bill_ids}
+    before = engine.version(file_name)
+    deleted = engine.delete_many(file_name, bill_ids)
+    summary.removed(file_name, before, engine.version(file_name),
+                    [bills[bill_id] for bill_id in deleted])
+    return deleted
 
-    return True
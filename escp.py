@@ -0,0 +1,116 @@
+import os
+from string import Formatter
+
+# Weighbridge slips as raw ESC/P for the dot matrix printer, the same slip
+# as dot_matrex.html without a browser in between. The layout below is
+# compiled once, at import, into a single format string for the whole
+# slip; printing a slip is one format_map and one encode.
+#
+# BILL_ESCP_SPOOL is where ?spool=true sends the bytes: the printer device
+# or share (/dev/usb/lp0, \\localhost\EPSON), or any file.
+
+ESCP_SPOOL = os.environ.get("BILL_ESCP_SPOOL", "")
+
+# 10 characters per inch on an 8 inch line. Plain ASCII, the printer's
+# own character set is not worth a slow charmap codec for what is on a slip
+LINE_WIDTH = 80
+ENCODING = "ascii"
+
+ESC = "\x1b"
+RESET = ESC + "@"
+BOLD, BOLD_OFF = ESC + "E", ESC + "F"
+WIDE, WIDE_OFF = ESC + "W1", ESC + "W0"
+FORM_FEED = "\x0c"
+NEWLINE = "\r\n"
+
+
+def text(column: int, value: str, bold: bool = False, wide: bool = False):
+    return (column, value.replace("{", "{{").replace("}", "}}"),
+            len(value) * (2 if wide else 1), bold, wide)
+
+
+def field(column: int, name: str, width: int, align: str = "<", bold: bool = False):
+    # padded and cut to `width`, the values are always text
+    return (column, "{%s:%s%d.%d}" % (name, align, width, width), width, bold, False)
+
+
+def center(value: str, bold: bool = False, wide: bool = False):
+    size = len(value) * (2 if wide else 1)
+    return text((LINE_WIDTH - size) // 2, value, bold, wide)
+
+# Function to compile a layout, a list of lines of text() / field()
+# segments, into one format string
+
+
+def compile_layout(lines: list[list]) -> str:
+    out = [RESET]
+    for segments in lines:
+        at = 0
+        for column, source, width, bold, wide in segments:
+            out.append(" " * max(column - at, 0))
+            out.append((BOLD if bold else "") + (WIDE if wide else ""))
+            out.append(source)
+            out.append((WIDE_OFF if wide else "") + (BOLD_OFF if bold else ""))
+            at = max(column, at) + width
+        out.append(NEWLINE)
+    out.append(FORM_FEED)
+    return "".join(out)
+
+
+SLIP = compile_layout([
+    [center("SAUSAR COTTON PRO. PVT.LTD.", bold=True, wide=True)],
+    [center("NAGPUR-CHHINDWARA ROAD")],
+    [center("SAUSAR PHONE 07165-295284")],
+    [],
+    [text(0, "RST NO     :"), field(13, "id", 20, bold=True),
+     text(44, "VEHICLE NO :"), field(57, "vehicle_no", 23)],
+    [text(0, "ADDRESS    :"), field(13, "address", 30),
+     text(44, "SUPPLIER   :"), field(57, "supplierName", 23)],
+    [text(0, "MATERIAL   :"), field(13, "goods", 30)],
+    [],
+    [text(0, "Gross Wt   :"), field(13, "before_wight", 10, ">"), text(24, "Kg"),
+     text(44, "Date:"), field(50, "date", 10), text(63, "Time:"), field(68, "in_time", 8)],
+    [text(0, "TARE  Wt   :"), field(13, "after_wight", 10, ">"), text(24, "kg"),
+     text(44, "Date:"), field(50, "date", 10), text(63, "Time:"), field(68, "out_time", 8)],
+    [text(0, "Net   Wt   :"), field(13, "net_wight", 10, ">"), text(24, "kg"),
+     field(44, "wight_in_word", 33), text(78, "kg")],
+    [],
+    [text(0, "Charges (1):Rs.0/-"), text(27, "Charges (2):Rs.0/-"),
+     text(54, "Charges (Total):Rs.0/-")],
+    [],
+    [text(0, "OPERATOR'S SIGNATURE:")],
+    [],
+    [text(0, "Contact for repairs at tel no")],
+])
+SLIP_FIELDS = {name for _, name, _, _ in Formatter().parse(SLIP) if name}
+
+
+def _value(value) -> str:
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return str(value)
+
+# Function to print one slip, `record` as built by printing.dot_matrix
+
+
+def slip(record: dict) -> bytes:
+    values = {name: _value(record.get(name)) for name in SLIP_FIELDS}
+    return SLIP.format_map(values).encode(ENCODING, errors="replace")
+
+# Function to print many slips, one after the other
+
+
+def slips(records):
+    for record in records:
+        yield slip(record)
+
+# Function to send slips to BILL_ESCP_SPOOL, returns the bytes written
+
+
+def spool(chunks) -> int:
+    written = 0
+    with open(ESCP_SPOOL, "ab") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    return written
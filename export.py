@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+
+import pandas as pd
+from pydantic import BaseModel
+
+import sidecar
+import storage
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as parquet
+except ImportError:
+    pa = None
+    parquet = None
+
+# Exports of a workbook as .xlsx, CSV, JSON Lines or Parquet.
+# The bills go out BILL_EXPORT_CHUNK_ROWS at a time: every chunk is serialized
+# and sent before the next one is made, so the export itself never holds
+# more than one chunk whatever the size of the workbook. An .xlsx has to be
+# a finished zip before it can be sent, it is written row by row with
+# XlsxWriter's constant memory mode into a temporary file and streamed from
+# there. Responses carry an ETag (workbook version + export options) and
+# Last-Modified (workbook files), so an unchanged export is a 304.
+
+FILE_CHUNK_BYTES = 64 * 1024
+
+MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportQuery(BaseModel):
+    format: str = "xlsx"
+    date_from: date | None = None
+    date_to: date | None = None
+    columns: list[str] | None = None
+
+    @property
+    def filtered(self) -> bool:
+        return bool(self.date_from or self.date_to or self.columns)
+
+# Function to tag an export: the same workbook version exported with the
+# same options is the same file
+
+
+def etag(version, query: ExportQuery) -> str:
+    key = json.dumps([version, query.model_dump(mode="json")], sort_keys=True)
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+
+
+def last_modified(version) -> float | None:
+    # the versions are (mtime_ns, size) fingerprints, nested or None
+    times = []
+
+    def walk(value):
+        if isinstance(value, (tuple, list)):
+            if len(value) == 2 and all(isinstance(v, int) for v in value):
+                times.append(value[0] / 1e9)
+            else:
+                for v in value:
+                    walk(v)
+
+    walk(version)
+    return max(times) if times else None
+
+def _in_range(df_bill_data: pd.DataFrame, query: ExportQuery) -> pd.Series:
+    days = storage.created_dates(df_bill_data["createdAt"]).dt.normalize()
+    mask = pd.Series(True, index=df_bill_data.index)
+    if query.date_from:
+        mask &= days >= pd.Timestamp(query.date_from)
+    if query.date_to:
+        mask &= days <= pd.Timestamp(query.date_to)
+    return mask
+
+# Function to load the bills an export needs: the whole workbook, or only
+# the asked columns (and createdAt to filter on) of the bills in range
+
+
+def load(engine, file_name: str, query: ExportQuery) -> pd.DataFrame:
+    if not query.columns:
+        return engine.load(file_name)
+    columns = list(query.columns)
+    dated = bool(query.date_from or query.date_to)
+    if dated and "createdAt" not in columns:
+        columns.append("createdAt")
+    return engine.load_columns(
+        file_name, columns, (lambda df: _in_range(df, query)) if dated else None)
+
+# Function to cut the bills to export into chunks, filtered on createdAt
+# and projected to the asked columns
+
+
+def frames(df_bill_data: pd.DataFrame, query: ExportQuery):
+    if query.date_from or query.date_to:
+        df_bill_data = df_bill_data[_in_range(df_bill_data, query)]
+    if query.columns:
+        df_bill_data = df_bill_data[query.columns]
+    if df_bill_data.empty:
+        # one empty chunk still gives the csv header and the parquet schema
+        return iter([df_bill_data])
+    return storage.chunked(df_bill_data)
+
+
+def csv_chunks(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+
+
+def jsonl_chunks(chunks):
+    for chunk in chunks:
+        if not chunk.empty:
+            yield chunk.to_json(orient="records", lines=True, date_format="iso").encode("utf-8")
+
+
+class _Drain:
+    # file object for ParquetWriter that hands over what was written so far
+    def __init__(self):
+        self.parts: list[bytes] = []
+        self.closed = False
+        self.position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def _arrow_frame(chunk: pd.DataFrame) -> pd.DataFrame:
+    # Excel columns mix types (dates as text, times as datetime.time), Arrow
+    # wants one type per column, keep those as text. Categoricals too, each
+    # chunk would otherwise carry its own dictionary
+    chunk = chunk.copy()
+    for column in chunk.columns:
+        if chunk[column].dtype in (object, "category"):
+            chunk[column] = chunk[column].astype(object).map(
+                lambda value: None if value is None or value != value else str(value))
+    return chunk
+
+
+def parquet_chunks(chunks):
+    drain = _Drain()
+    writer = None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(
+            _arrow_frame(chunk), schema=writer.schema if writer else None,
+            preserve_index=False)
+        if writer is None:
+            writer = parquet.ParquetWriter(drain, table.schema)
+        writer.write_table(table)
+        yield drain.take()
+    if writer is not None:
+        writer.close()
+        yield drain.take()
+
+
+# Function to write an .xlsx export to a temporary file next to the sidecars
+
+
+def xlsx_file(file_name: str, df_bill_data: pd.DataFrame, query: ExportQuery) -> str:
+    directory = os.path.dirname(sidecar.path_for(file_name, ""))
+    os.makedirs(directory, exist_ok=True)
+    handle, path = tempfile.mkstemp(suffix=".xlsx", dir=directory)
+    os.close(handle)
+    try:
+        storage.write_xlsx_rows(path, frames(df_bill_data, query),
+                   query.columns or list(df_bill_data.columns))
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+# Function to copy the engine's whole-workbook .xlsx to a temporary file.
+# Run it under the workbook's lock: the copy is streamed after the lock is
+# released, while the workbook itself may be rewritten (or, on Windows, an
+# open handle would keep it from being replaced)
+
+
+def workbook_file(engine, file_name: str) -> str:
+    source = engine.export_xlsx(file_name)
+    directory = os.path.dirname(sidecar.path_for(file_name, ""))
+    os.makedirs(directory, exist_ok=True)
+    handle, path = tempfile.mkstemp(suffix=".xlsx", dir=directory)
+    os.close(handle)
+    try:
+        shutil.copyfile(source, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+# Function to stream a file in chunks, optionally removing it afterwards
+
+
+def file_chunks(path: str, remove: bool = False):
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(FILE_CHUNK_BYTES):
+                yield chunk
+    finally:
+        if remove:
+            os.remove(path)
@@ -0,0 +1,218 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+import storage
+
+# Bulk import of bills from an uploaded .csv or .xlsx. The upload is read
+# INGEST_CHUNK_ROWS rows at a time straight from the spooled upload file,
+# every chunk is checked and converted to the types the app stores, and the
+# chunks go to the storage engine's upsert: a row with the id of a bill
+# updates that bill, any other row is a new bill.
+# Rows that cannot be read are left out and reported with their row number.
+
+INGEST_CHUNK_ROWS = int(os.environ.get("BILL_INGEST_CHUNK_ROWS", 10000))
+
+# Row errors kept for the report, the count goes on past it
+MAX_REPORTED_ERRORS = 1000
+
+# Columns an upload must have, id is optional (rows without one are new
+# bills) and so are year and address
+REQUIRED_COLUMNS = [
+    "invoiceNo", "supplierName", "supplierOtherInfo", "createdAt", "goods",
+    "hsn_sac", "quantity", "rate", "par", "farmerName", "vehicle_no",
+    "farmerCode", "before_wight", "after_wight", "in_time", "out_time",
+]
+NUMBER_COLUMNS = ["quantity", "rate", "before_wight", "after_wight"]
+TIME_COLUMNS = ["in_time", "out_time"]
+TEXT_COLUMNS = [c for c in storage.BILL_COLUMNS
+                if c not in NUMBER_COLUMNS + TIME_COLUMNS + ["id", "createdAt"]]
+
+
+class RowError(BaseModel):
+    # row number as shown in Excel, the header is row 1
+    row: int
+    column: str
+    value: str
+    message: str
+
+
+class ImportReport(BaseModel):
+    filename: str
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    error_count: int = 0
+    errors: list[RowError] = []
+
+    def add_error(self, row: int, column: str, value, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(
+                row=row, column=column, value=_text(value), message=message))
+
+
+def _text(value) -> str:
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return str(value).strip()
+
+
+def _texts(column: pd.Series) -> pd.Series:
+    # _text for a whole column
+    return column.astype(str).str.strip().where(column.notna(), "")
+
+# Function to open an upload, returns its header and an iterator over raw
+# chunks of rows (DataFrames of the upload's columns, object dtype)
+
+
+def open_upload(file, filename: str):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        header = list(pd.read_csv(file, nrows=0, encoding="utf-8-sig").columns)
+        file.seek(0)
+        reader = pd.read_csv(file, dtype=str, keep_default_na=False,
+                             encoding="utf-8-sig", chunksize=INGEST_CHUNK_ROWS)
+        return header, iter(reader)
+    if extension == ".xlsx":
+        from openpyxl import load_workbook
+
+        # read only mode streams the sheet instead of building it in memory
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [_text(name) for name in next(rows, ())]
+        while header and header[-1] == "":
+            header.pop()
+        return header, _sheet_chunks(workbook, rows, header)
+    raise ValueError("upload a .csv or .xlsx file")
+
+
+def _sheet_chunks(workbook, rows, header: list[str]):
+    width = len(header)
+    try:
+        chunk = []
+        for row in rows:
+            chunk.append(tuple(row[:width]) + (None,) * (width - len(row)))
+            if len(chunk) == INGEST_CHUNK_ROWS:
+                yield pd.DataFrame(chunk, columns=header, dtype=object)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header, dtype=object)
+    finally:
+        workbook.close()
+
+# Function to check the header of an upload, returns what is wrong with it
+
+
+def header_problems(header: list[str]) -> list[str]:
+    problems = []
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    extra = [c for c in header if c not in storage.BILL_COLUMNS]
+    duplicated = sorted({c for c in header if header.count(c) > 1})
+    if missing:
+        problems.append("missing columns: " + ", ".join(missing))
+    if extra:
+        problems.append("unknown columns: " + ", ".join(extra))
+    if duplicated:
+        problems.append("repeated columns: " + ", ".join(duplicated))
+    return problems
+
+
+def _created(column: pd.Series, text: pd.Series) -> tuple[pd.Series, np.ndarray]:
+    # "dd-mm-YYYY" text is how createdAt looks when typed into Excel and is
+    # kept as it is, other dates (bills made in the app) become datetimes
+    given = text.to_numpy() != ""
+    typed = text.str.fullmatch(r"\d{2}-\d{2}-\d{4}").to_numpy()
+    day_first = pd.to_datetime(text.where(typed), format="%d-%m-%Y", errors="coerce")
+    other = pd.to_datetime(column.where(~typed & given), format="mixed",
+                           dayfirst=True, errors="coerce")
+    values = pd.Series(
+        [None if pd.isna(value) else value.to_pydatetime() for value in other],
+        index=column.index, dtype=object)
+    values[typed] = text[typed]
+    bad = given & np.where(typed, day_first.isna(), other.isna())
+    return values, bad
+
+
+def _times(column: pd.Series, text: pd.Series) -> tuple[pd.Series, np.ndarray]:
+    # datetime.time from an .xlsx, "HH:MM" or "HH:MM:SS" text from a .csv
+    values = column.map(
+        lambda value: value.time() if isinstance(value, datetime.datetime) else value)
+    is_time = values.map(lambda value: isinstance(value, datetime.time)).to_numpy()
+    text = text.where(~is_time, "")
+    parsed = pd.to_datetime(text.where(text != ""), format="mixed", errors="coerce")
+    values = values.where(is_time, parsed.dt.time)
+    values = values.astype(object).where(is_time | parsed.notna().to_numpy(), None)
+    bad = (text.to_numpy() != "") & parsed.isna().to_numpy()
+    return values, bad
+
+# Function to turn a raw chunk into bills: the stored types for every
+# column, rows that do not convert are reported and dropped. `first_row`
+# is the row number of the chunk's first row
+
+
+def coerce(chunk: pd.DataFrame, first_row: int, report: ImportReport) -> pd.DataFrame:
+    chunk = chunk.reset_index(drop=True)
+    rows = np.arange(first_row, first_row + len(chunk))
+    text = chunk.apply(_texts)
+    # empty rows (Excel keeps formatted ones) are no bills and no errors
+    blank = (text == "").all(axis=1).to_numpy()
+    chunk, text, rows = (chunk[~blank].reset_index(drop=True),
+                         text[~blank].reset_index(drop=True), rows[~blank])
+    bad = np.zeros(len(chunk), dtype=bool)
+    problems = []
+    bills = pd.DataFrame(index=chunk.index)
+
+    def check(column: str, failed: np.ndarray, message: str):
+        nonlocal bad
+        bad |= failed
+        problems.extend((p, column, message) for p in np.flatnonzero(failed))
+
+    if "id" in chunk.columns:
+        ids = pd.to_numeric(text["id"], errors="coerce")
+        check("id", (text["id"] != "").to_numpy() & (ids.isna() | (ids % 1 != 0)).to_numpy(),
+              "not a whole number")
+        bills["id"] = ids.where(ids % 1 == 0).astype("Int64")
+    else:
+        bills["id"] = pd.array([pd.NA] * len(chunk), dtype="Int64")
+
+    for column in TEXT_COLUMNS:
+        if column not in chunk.columns:
+            bills[column] = None
+            continue
+        values = text[column]
+        if values.str.endswith(".0").any():
+            # a whole number read from an .xlsx cell is text like the form's
+            values = values.str.replace(r"^(-?\d+)\.0$", r"\1", regex=True)
+        bills[column] = values.where(values != "", None)
+    check("invoiceNo", bills["invoiceNo"].isna().to_numpy(), "invoiceNo is empty")
+
+    for column in NUMBER_COLUMNS:
+        numbers = pd.to_numeric(text[column], errors="coerce")
+        check(column, (text[column] != "").to_numpy() & numbers.isna().to_numpy(),
+              "not a number")
+        bills[column] = numbers.astype("float64")
+
+    bills["createdAt"], failed = _created(chunk["createdAt"], text["createdAt"])
+    check("createdAt", failed, "not a date")
+    for column in TIME_COLUMNS:
+        bills[column], failed = _times(chunk[column], text[column])
+        check(column, failed, "not a time")
+
+    for position, column, message in sorted(problems):
+        report.add_error(int(rows[position]), column, text[column].iloc[position], message)
+    report.rejected += int(bad.sum())
+    return bills.loc[~bad, storage.BILL_COLUMNS].reset_index(drop=True)
+
+# Function to convert the chunks of an upload one after the other
+
+
+def bills(chunks, report: ImportReport):
+    # data starts on row 2, under the header
+    first_row = 2
+    for chunk in chunks:
+        yield coerce(chunk, first_row, report)
+        first_row += len(chunk)
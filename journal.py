@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+# Append-only journal that sits next to each workbook.
+# Every line is one JSON encoded bill row, or {DELETED: [ids]} for bills
+# deleted while the journal held rows. A line is only acknowledged once
+# it has been flushed and fsync'd, so a crash can at worst leave a torn last
+# line, which read_rows() ignores.
+
+# Key of a delete line
+DELETED = "$deleted"
+
+_locks: dict[str, threading.RLock] = {}
+_locks_guard = threading.Lock()
+
+
+def journal_path(file_name: str) -> str:
+    return file_name + ".journal"
+
+
+def workbook_path(journal_file: str) -> str:
+    return journal_file[: -len(".journal")]
+
+
+# Function to get the lock that guards a workbook and its journal
+
+
+def lock_for(file_name: str) -> threading.RLock:
+    key = os.path.abspath(file_name)
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = threading.RLock()
+        return _locks[key]
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    return str(value)
+
+
+def _decode(row: dict) -> dict:
+    for key, value in row.items():
+        if isinstance(value, dict) and "$datetime" in value:
+            row[key] = datetime.fromisoformat(value["$datetime"])
+    return row
+
+# Function to durably append rows to the journal
+
+
+def append_rows(file_name: str, rows: list[dict]):
+    lines = "".join(json.dumps(row, default=_encode) + "\n" for row in rows)
+    with lock_for(file_name):
+        with open(journal_path(file_name), "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+# Function to durably record deleted bills, before the workbook rewrite of
+# the delete. Returns what truncate() needs to take the line back. Nothing
+# is written without a journal, there is nothing the delete could lose to
+
+
+def append_deleted(file_name: str, bill_ids: list[int]):
+    path = journal_path(file_name)
+    with lock_for(file_name):
+        if not os.path.exists(path):
+            return None
+        size = os.path.getsize(path)
+        append_rows(file_name, [{DELETED: [int(bill_id) for bill_id in bill_ids]}])
+        return size
+
+# Function to take back lines appended since append_deleted() (the rewrite
+# failed, the bills were not deleted)
+
+
+def truncate(file_name: str, size):
+    if size is None:
+        return
+    with lock_for(file_name):
+        with open(journal_path(file_name), "r+b") as f:
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+
+# Function to read every complete row from the journal
+
+
+def read_rows(file_name: str) -> list[dict]:
+    path = journal_path(file_name)
+    if not os.path.exists(path):
+        return []
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                # torn write from a crash, it was never acknowledged
+                break
+            rows.append(_decode(json.loads(line)))
+    return rows
+
+# Function to drop the first `count` rows once they are in the workbook
+
+
+def discard_rows(file_name: str, count: int):
+    path = journal_path(file_name)
+    with lock_for(file_name):
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        remaining = lines[count:]
+        if not remaining:
+            os.remove(path)
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(remaining)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+def pending_journals(directory: str) -> list[str]:
+    return [
+        workbook_path(os.path.join(directory, name))
+        for name in os.listdir(directory)
+        if name.endswith(".journal")
+    ]
@@ -0,0 +1,86 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import summary
+
+# Parses several workbooks at once in worker processes. Parsing .xlsx is
+# CPU bound, threads would just take turns on the GIL. Workers send back
+# only the compact columns the caller needs, never whole DataFrames.
+# BILL_LOAD_WORKERS=1 loads serially, and so does a file whose worker died
+# (a broken pool).
+
+LOAD_WORKERS = int(os.environ.get("BILL_LOAD_WORKERS", min(os.cpu_count() or 1, 8)))
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=LOAD_WORKERS)
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+# Runs in the worker: read the summary columns of one workbook and reduce
+# them. Only those three columns are parsed when the workbook has no
+# current sidecar.
+
+
+def _summary_columns(file_name: str, engine_name: str):
+    import storage
+    import db  # noqa: F401  registers the engines
+
+    engine = storage.get_engine(engine_name)
+    version = engine.version(file_name)
+    days, amounts = summary.columns(engine.load_columns(file_name, summary.COLUMNS))
+    return version, days, amounts
+
+# Function to run `task(file_name, *args)` for every file, in parallel when
+# it is worth it
+
+
+def map_files(task, files: list[str], *args) -> list:
+    if LOAD_WORKERS <= 1 or len(files) <= 1:
+        return [task(file_name, *args) for file_name in files]
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(task, file_name, *args) for file_name in files]
+    except BrokenProcessPool:
+        shutdown()
+        return [task(file_name, *args) for file_name in files]
+    results = []
+    for file_name, future in zip(files, futures):
+        try:
+            results.append(future.result())
+        except BrokenProcessPool:
+            # The worker died (frozen build without freeze_support, killed,
+            # ...), not the task: start over in a new pool next time and
+            # load this one here. Errors of the task itself are raised.
+            shutdown()
+            results.append(task(file_name, *args))
+    return results
+
+# Function to get the summaries of many workbooks, parsing the stale ones
+# side by side
+
+
+def summaries(files: list[str], engine) -> list[dict]:
+    results = {file_name: summary.current(file_name, engine) for file_name in files}
+    stale = [file_name for file_name, result in results.items() if result is None]
+    for file_name, (version, days, amounts) in zip(
+        stale, map_files(_summary_columns, stale, engine.name)
+    ):
+        results[file_name] = summary.build_columns(days, amounts)
+        summary.put(file_name, version, results[file_name])
+    return [results[file_name] for file_name in files]
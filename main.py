@@ -1,28 +1,51 @@
-from pyppeteer import launch
 import asyncio
-import pdfkit
-import httpx
-from xhtml2pdf import pisa
-import requests
-from pyhtml2pdf import converter
 import datetime
-import io
+import email.utils
+import functools
 import os
-from typing import Annotated
-from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile
+from typing import Literal
+from fastapi import (
+    Depends,
+    FastAPI,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
 from fastapi.responses import (
-    FileResponse,
     HTMLResponse,
-    RedirectResponse,
+    Response,
     StreamingResponse,
 )
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import num2words
 import pandas as pd
-from db import Bill, check_excel, create_bill, delete_bill, get_list, read_data
-from glob import glob
+from db import (
+    Bill,
+    check_excel,
+    get_columns,
+    get_frame,
+    get_list,
+    import_bills,
+    list_page,
+    read_data,
+)
+import cache
+import chart
+import escp
+import export
+import ingest
+import loader
+import offload
+import pdf
+import pdf_jobs
+import printing
+import multiprocessing
+import storage
 import webbrowser
+import writer
 
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -31,38 +54,73 @@ templates = Jinja2Templates(directory="templates")
 
 
 def enumerate_filter(seq):
-    return list(enumerate(seq))
+    # lazy, the bulk prints pass row generators
+    return enumerate(seq)
 
 
 # Add the custom filter to the Jinja2 environment
 templates.env.filters["enumerate"] = enumerate_filter
 
+# Bulk prints are streamed: the template renders from the row generator and
+# goes out in chunks as it is rendered, so memory stays flat however many
+# bills the file holds and the browser starts on the first pages right away
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def stream_template(request: Request, name: str, context: dict):
+    chunks = templates.get_template(name).generate(request=request, **context)
+    return StreamingResponse(_buffered(chunks), media_type="text/html")
+
+
+def _buffered(chunks):
+    # jinja yields every bit of markup on its own, send fewer, bigger chunks
+    buffer, size = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_CHUNK_BYTES:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+# Function to answer a single bill print from the rendered page cache.
+# The strong ETag names the workbook, template and bill content, so a
+# browser that already has the page gets a 304 without any rendering
+
+
+async def cached_page(request: Request, name: str, filename: str, data: dict, build):
+    file_name = os.path.join("./database", filename)
+    etag = cache.page_etag(file_name, os.path.join("templates", name), data)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    body = cache.pages.get(etag)
+    if body is None:
+        # the print templates run to thousands of lines, render them in the
+        # storage threads and keep the event loop free
+        body = await offload.run(_render_page, request, name, build, data)
+        cache.pages.put(etag, body)
+    return Response(body, media_type="text/html", headers=headers)
+
+
+def _render_page(request: Request, name: str, build, data: dict) -> bytes:
+    return templates.get_template(name).render(request=request, **build(data)).encode()
+
 
 @app.get("/")
 async def read_item(request: Request):
     try:
-        files = glob("./database/*.xlsx")
-        f = []
-        for file in files:
-            if not file.split("\\")[-1].startswith("~$"):
-                print(file)
-                f.append(file)
-        chart_data = {"labels": [], "total_values": []}
+        engine = storage.engine()
+        f = engine.workbooks("./database")
         total_bills = 0
 
-        # Assuming you're adding total values from the bills as your data source
-        for file in f:
-            for bill in get_list(file):
-                # print(bill)
-                
-                if isinstance(bill["createdAt"], (pd.Timestamp, datetime.datetime)):
-                    chart_data["labels"].append(bill["createdAt"].strftime("%d-%b-%y"))
-                else:
-                    chart_data["labels"].append(str(bill["createdAt"]))
-                chart_data["total_values"].append(
-                    float(bill["quantity"]) * float(bill["rate"])
-                )
-                total_bills += 1
+        # Daily totals kept up to date by create_bill / delete_bill, stale
+        # ones are rebuilt with the workbooks parsed side by side. The chart
+        # itself is fetched from /chart-data
+        summaries = await offload.run(loader.summaries, f, engine)
+        for totals in summaries:
+            total_bills += totals["count"]
         return templates.TemplateResponse(
             request=request,
             name="index.html",
@@ -72,8 +130,6 @@ async def read_item(request: Request):
                     for index, i in enumerate(f)
                 ],
                 "key": ["id", "filename"],
-                "chart_labels": chart_data["labels"],
-                "chart_data": chart_data["total_values"],
                 "total_bills": total_bills,
             },
         )
@@ -83,311 +139,70 @@ async def read_item(request: Request):
             request=request,
             name="error.html",
             context={
-                "message": "error on file replace or delete file {file} or close the file {file}".format(
-                    file=file.split("\\")[-1]
-                )
+                # the summaries are read together, no single file to name
+                "message": "error on file replace or delete file or close the open workbooks"
             },
         )
 
 
+@app.get("/chart-data")
+async def chart_data(
+    bucket: Literal["day", "week", "month"] = "day",
+    points: int = Query(365, ge=3, le=5000),
+):
+    engine = storage.engine()
+    summaries = await offload.run(loader.summaries, engine.workbooks("./database"), engine)
+    return chart.chart_data(summaries, bucket, points)
+
+
 @app.get("/bill_print/{file_name}/{id}")
 async def bill_print(request: Request, id: str, file_name: str):
-    data = read_data(os.path.join("./database", file_name), id)
-    return templates.TemplateResponse(
-        request=request,
-        name="bill.html",
-        context={
-            "invoiceNo": data["invoiceNo"],
-            "date": (
-                datetime.datetime.strptime(data["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y")
-                if type(data["createdAt"]) is pd.Timestamp
-                else data["createdAt"]
-            ),
-            "supplierName": data["supplierName"],
-            "supplierOtherInfo": data["supplierOtherInfo"],
-            "items": [
-                {
-                    "farmerCode": data["farmerCode"],
-                    "good": data["goods"],
-                    "hsn_sac": data["hsn_sac"],
-                    "quantity": "{:.2f}".format(float(data["quantity"])),
-                    "rate": "{:.2f}".format(float(data["rate"])),
-                    "par": data["par"],
-                    "amount": "{:.2f}".format(
-                        float(data["quantity"]) * float(data["rate"])
-                    ),
-                    "vehicle_no": data["vehicle_no"],
-                    "invoiceNo": data["invoiceNo"],
-                    "total": "{:.2f}".format(
-                        float(data["quantity"]) * float(data["rate"])
-                    ),
-                    "amount_in_word": "".join(
-                        [
-                            (
-                                num2words.num2words(
-                                    i,
-                                    lang="en_IN",
-                                )
-                                if i != "00"
-                                else ""
-                            )
-                            for i in "{:.2f}".format(
-                                float(data["quantity"]) * float(data["rate"])
-                            ).split(".")
-                        ]
-                    ),
-                }
-            ],
-            "total_quantity": "{:.2f}".format(data["quantity"]),
-            "total_amount": "{:.2f}".format(
-                float(data["quantity"]) * float(data["rate"])
-            ),
-            "bill_items": [
-                {
-                    "hsn_sac": data["hsn_sac"],
-                    "total": "{:.2f}".format(
-                        float(data["quantity"]) * float(data["rate"])
-                    ),
-                }
-            ],
-            "tex_amount": "{:.2f}".format(
-                float(data["quantity"]) * float(data["rate"])
-            ),
-            "amount_in_word": "".join(
-                [
-                    (
-                        num2words.num2words(
-                            i,
-                            lang="en_IN",
-                        )
-                        if i != "00"
-                        else ""
-                    )
-                    for i in "{:.2f}".format(
-                        float(data["quantity"]) * float(data["rate"])
-                    ).split(".")
-                ]
-            ),
-            "par": data["par"],
-        },
-    )
+    path = os.path.join("./database", file_name)
+    data = await offload.read(path, read_data, path, id)
+    return await cached_page(request, "bill.html", file_name, data, printing.bill)
 
 
 @app.get("/bill_all_print/{file_name}")
 async def bill_print_all(request: Request, file_name: str):
-    data = get_list(os.path.join("./database", file_name))
-    return templates.TemplateResponse(
-        request=request,
-        name="all_bill.html",
-        context={
-            "data": [
-                {
-                    "invoiceNo": i["invoiceNo"],
-                    "date": (
-                         datetime.datetime.strptime(i["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y")
-                        if type(i["createdAt"]) is pd.Timestamp
-                        else i["createdAt"]
-                    ),
-                    "supplierName": i["supplierName"],
-                    "supplierOtherInfo": i["supplierOtherInfo"],
-                    "items": [
-                        {
-                            "farmerCode": i["farmerCode"],
-                            "good": i["goods"],
-                            "hsn_sac": i["hsn_sac"],
-                            "quantity": "{:.2f}".format(float(i["quantity"])),
-                            "rate": "{:.2f}".format(float(i["rate"])),
-                            "par": i["par"],
-                            "amount": "{:.2f}".format(
-                                float(i["quantity"]) * float(i["rate"])
-                            ),
-                            "vehicle_no": i["vehicle_no"],
-                            "invoiceNo": i["invoiceNo"],
-                            "total": "{:.2f}".format(
-                                float(i["quantity"]) * float(i["rate"])
-                            ),
-                            "amount_in_word": " ".join(
-                                [
-                                    (
-                                        str(
-                                            num2words.num2words(
-                                                k,
-                                                lang="en_IN",
-                                            )
-                                        )
-                                        if k != "00"
-                                        else ""
-                                    )
-                                    for k in "{:.2f}".format(
-                                        float(i["quantity"]) * float(i["rate"])
-                                    ).split(".")
-                                ]
-                            ),
-                        }
-                    ],
-                    "total_quantity": "{:.2f}".format(i["quantity"]),
-                    "total_amount": "{:.2f}".format(
-                        float(i["quantity"]) * float(i["rate"])
-                    ),
-                    "bill_items": [
-                        {
-                            "hsn_sac": i["hsn_sac"],
-                            "total": "{:.2f}".format(
-                                float(i["quantity"]) * float(i["rate"])
-                            ),
-                        }
-                    ],
-                    "tex_amount": "{:.2f}".format(
-                        float(i["quantity"]) * float(i["rate"])
-                    ),
-                    "amount_in_word": " ".join(
-                        [
-                            (
-                                str(
-                                    num2words.num2words(
-                                        k,
-                                        lang="en_IN",
-                                    )
-                                )
-                                if k != "00"
-                                else ""
-                            )
-                            for k in "{:.2f}".format(
-                                float(i["quantity"]) * float(i["rate"])
-                            ).split(".")
-                        ]
-                    ),
-                    "par": i["par"],
-                }
-                for i in data
-            ]
-        },
-    )
+    path = os.path.join("./database", file_name)
+    data = await offload.read(path, get_columns, path, printing.BILL_COLUMNS)
+    return stream_template(request, "all_bill.html", {"data": printing.bills(data)})
 
 
 @app.get("/get_pass_print/{file_name}/{id}")
 async def get_pass_print(request: Request, id: str, file_name: str):
-    data = read_data(os.path.join("./database", file_name), id)
-    print(data)
-    return templates.TemplateResponse(
-        request=request,
-        name="get_pass.html",
-        context={
-            "year": data["year"],
-            "items": [
-                {
-                    "date": (
-                         datetime.datetime.strptime(data["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y")
-                        if type(data["createdAt"]) is pd.Timestamp
-                        else data["createdAt"]
-                    ),
-                    "good": data["goods"],
-                    "villagerName": data["farmerName"],
-                    "vehicle_no": data["vehicle_no"],
-                }
-            ],
-        },
-    )
+    path = os.path.join("./database", file_name)
+    data = await offload.read(path, read_data, path, id)
+    return await cached_page(request, "get_pass.html", file_name, data, printing.get_pass)
 
 
 @app.get("/get_all_pass_print/{file_name}")
 async def get_pass_print_all(request: Request, file_name: str):
-    data = get_list(os.path.join("./database", file_name))
-
-    return templates.TemplateResponse(
-        request=request,
-        name="all_get_pass.html",
-        context={
-            "year": data[0]["year"],
-            "data": [
-                {
-                    "items": [
-                        {
-                            "date": (
-                                 datetime.datetime.strptime(i["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y")
-                                if type(i["createdAt"]) is pd.Timestamp
-                                else i["createdAt"]
-                            ),
-                            "good": i["goods"],
-                            "villagerName": i["farmerName"],
-                            "vehicle_no": i["vehicle_no"],
-                        }
-                    ]
-                }
-                for i in data
-            ],
+    path = os.path.join("./database", file_name)
+    data = await offload.read(path, get_columns, path, printing.GET_PASS_COLUMNS)
+
+    return stream_template(
+        request,
+        "all_get_pass.html",
+        {
+            "year": data["year"].iloc[0] if len(data) else "",
+            "data": printing.get_passes(data),
         },
     )
 
 
 @app.get("/get_wight_print/{file_name}/{id}")
 async def get_wight_print(request: Request, id: str, file_name: str):
-    data = read_data(os.path.join("./database", file_name), id)
-    v: list[str] = []
-    s = []
-    for i in [data]:
-        if i["vehicle_no"] not in v:
-            v.append(i["vehicle_no"])
-            s.append(
-                {
-                    "date": (
-                         datetime.datetime.strptime(data["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y")
-                        if type(data["createdAt"]) is pd.Timestamp
-                        else data["createdAt"]
-                    ),
-                    "villagerName": i["farmerName"],
-                    "farmerCode": i["farmerCode"],
-                    "good": i["goods"],
-                    "vehicle_no": i["vehicle_no"],
-                    "par": i["par"],
-                    "before_wight": "{:.2f}".format(i["before_wight"]),
-                    "after_wight": "{:.2f}".format(i["after_wight"]),
-                    "net_wight": "{:.2f}".format(i["after_wight"] - i["before_wight"]),
-                    "in_time": i["in_time"].strftime("%I:%M %p"),
-                    "out_time": i["in_time"].strftime("%I:%M %p"),
-                }
-            )
-    return templates.TemplateResponse(
-        request=request, name="wight.html", context={"items": s, "year": data["year"]}
-    )
+    path = os.path.join("./database", file_name)
+    data = await offload.read(path, read_data, path, id)
+    return await cached_page(request, "wight.html", file_name, data, printing.weight)
 
 
 @app.get("/get_all_wight_print/{file_name}")
 async def get_wight_print_all(request: Request, file_name: str):
-    data = get_list(os.path.join("./database", file_name))
-    d = []
-    for j in data:
-        v: list[str] = []
-        s = []
-        for i in [j]:
-
-            if i["vehicle_no"] not in v:
-                v.append(i["vehicle_no"])
-                s.append(
-                    {
-                        "date": (
-                             datetime.datetime.strptime(j["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y")
-                            if type(j["createdAt"]) is pd.Timestamp
-                            else j["createdAt"]
-                        ),
-                        "villagerName": i["farmerName"],
-                        "farmerCode": i["farmerCode"],
-                        "good": i["goods"],
-                        "par": i["par"],
-                        "vehicle_no": i["vehicle_no"],
-                        "before_wight": "{:.2f}".format(i["before_wight"]),
-                        "after_wight": "{:.2f}".format(i["after_wight"]),
-                        "net_wight": "{:.2f}".format(
-                            i["after_wight"] - i["before_wight"]
-                        ),
-                        "in_time": i["in_time"].strftime("%I:%M %p"),
-                        "out_time": i["in_time"].strftime("%I:%M %p"),
-                    }
-                )
-            d.append({"items": s, "year": f"{j['year']}"})
-    return templates.TemplateResponse(
-        request=request, name="all_wight.html", context={"data": [{**s} for s in d]}
-    )
+    path = os.path.join("./database", file_name)
+    data = await offload.read(path, get_columns, path, printing.WEIGHT_COLUMNS)
+    return stream_template(request, "all_wight.html", {"data": printing.weights(data)})
 
 
 @app.post("/submit-bill/{file_name}")
@@ -395,9 +210,9 @@ async def submit_bill(file_name: str, bill_data: Bill):
     try:
         print(bill_data)
         # Create the billData entry with related items
-        bill = create_bill(
-            file_name=os.path.join("./database", file_name), data=bill_data
-        )
+        # queued with the other counters' bills, written together
+        ids = await writer.insert(os.path.join("./database", file_name), [bill_data])
+        bill = ids is not False
 
         return {"message": "Bill submitted successfully", "bill": bill}
     except Exception as e:
@@ -405,54 +220,44 @@ async def submit_bill(file_name: str, bill_data: Bill):
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+# Function to submit every item of the bill form at once: the bills are
+# checked together and stored with one write
+
+
+@app.post("/submit-bills/{file_name}")
+async def submit_bills(file_name: str, bills_data: list[Bill]):
+    if not bills_data:
+        raise HTTPException(status_code=400, detail="No bills to submit")
+    ids = await writer.insert(os.path.join("./database", file_name), bills_data)
+    if ids is False:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    return {"message": f"{len(ids)} bills submitted successfully", "bills": ids}
+
+
 @app.post("/upload")
 async def upload_excel(request: Request, file: UploadFile = File(...)):
-
-    bill_data_columns = [
-        "id",
-        "invoiceNo",
-        "supplierName",
-        "supplierOtherInfo",
-        "createdAt",
-        "goods",
-        "hsn_sac",
-        "quantity",
-        "rate",
-        "par",
-        "farmerName",
-        "vehicle_no",
-        "farmerCode",
-        "before_wight",
-        "after_wight",
-        "in_time",
-        "out_time",
-    ]
+    # Bills go into database/<name>.xlsx whether the upload is a .csv or
+    # an .xlsx, added to the bills already there
+    upload_name = os.path.basename(file.filename or "")
+    file_name = os.path.join("./database", os.path.splitext(upload_name)[0] + ".xlsx")
+    report = ingest.ImportReport(filename=os.path.basename(file_name))
     try:
-        # Read the uploaded Excel file into DataFrames
-        contents = await file.read()
-        file_name = file.filename
-        # Use `pd.ExcelFile` to read the Excel file with multiple sheets
-        excel_file = pd.read_csv(io.BytesIO(contents))
-        # Check if both required sheets exist
-
-        # Read the sheets into DataFrames
-        df_bill_data = excel_file
-        # print(set(bill_data_columns), set(df_bill_data.columns))
-
-        # Validate the columns in bill_data
-        if set(bill_data_columns) != set(df_bill_data.columns):
+        header, chunks = await offload.run(ingest.open_upload, file.file, upload_name)
+        problems = ingest.header_problems(header)
+        if problems:
             return templates.TemplateResponse(
                 request=request,
                 name="error.html",
-                context={
-                    "message": "bill_data sheet is missing required columns or has extra columns."
-                },
+                context={"message": "bill_data sheet: " + "; ".join(problems)},
             )
-        df_bill_data.to_csv(os.path.join("./database", file_name), index=False)
+        # the upload is read chunk by chunk while it is stored
+        report.inserted, report.updated = await offload.write(
+            file_name, import_bills, file_name, ingest.bills(chunks, report))
 
         return templates.TemplateResponse(
             request=request,
             name="upload.html",
+            context={"report": report},
         )
 
     except Exception as e:
@@ -462,12 +267,60 @@ async def upload_excel(request: Request, file: UploadFile = File(...)):
         )
 
 
+def bill_query(
+    date_from: datetime.date | None = None,
+    date_to: datetime.date | None = None,
+    farmerName: str | None = None,
+    vehicle_no: str | None = None,
+    goods: str | None = None,
+    invoiceNo: str | None = None,
+    sort: Literal[tuple(storage.SORT_COLUMNS)] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    after: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    return storage.BillQuery(
+        date_from=date_from,
+        date_to=date_to,
+        farmerName=farmerName or None,
+        vehicle_no=vehicle_no or None,
+        goods=goods or None,
+        invoiceNo=invoiceNo or None,
+        sort=sort,
+        descending=order == "desc",
+        after=after,
+        limit=limit,
+    )
+
+
+def json_row(row: dict):
+    # NaN from empty Excel cells (NaT for a missing date) is not valid JSON
+    return {
+        key: None if value is pd.NaT or isinstance(value, float) and value != value else value
+        for key, value in row.items()
+    }
+
+
+@app.get("/bills/{filename}/json")
+async def bills_json(filename: str, query: storage.BillQuery = Depends(bill_query)):
+    if not storage.engine().exists(os.path.join("./database", filename)):
+        raise HTTPException(status_code=404, detail=f"{filename} not found!!")
+    file_name = os.path.join("./database", filename)
+    try:
+        rows, next_after = await offload.read(file_name, list_page, file_name, query)
+    except ValueError as e:
+        # the page's anchor bill was deleted
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"data": [json_row(row) for row in rows], "next_after": next_after}
+
+
 @app.get("/bills/{filename}", response_class=HTMLResponse)
 async def bills(
     request: Request,
     filename: str,
+    query: storage.BillQuery = Depends(bill_query),
 ):
-    if not os.path.exists(os.path.join("./database", filename)):
+    if not storage.engine().exists(os.path.join("./database", filename)):
         raise templates.TemplateResponse(
             request=request,
             name="error.html",
@@ -476,7 +329,8 @@ async def bills(
             },
         )
     try:
-        data = get_list(os.path.join("./database", filename))
+        file_name = os.path.join("./database", filename)
+        data, next_after = await offload.read(file_name, list_page, file_name, query)
         return templates.TemplateResponse(
             request=request,
             name="bill_data.html",
@@ -484,6 +338,14 @@ async def bills(
                 "data": data,
                 "key": data[-1].keys() if data.__len__() != 0 else [],
                 "filename": filename,
+                "query": query,
+                "sort_columns": storage.SORT_COLUMNS,
+                "first_url": request.url.remove_query_params("after"),
+                "next_url": (
+                    request.url.include_query_params(after=next_after)
+                    if next_after is not None
+                    else None
+                ),
             },
         )
     except Exception as e:
@@ -499,28 +361,101 @@ async def bills(
         )
 
 
-@app.post("/export/{filename}")
-async def export_data(filename: str):
+def export_query(
+    format: Literal["xlsx", "csv", "jsonl", "parquet"] = "xlsx",
+    date_from: datetime.date | None = None,
+    date_to: datetime.date | None = None,
+    columns: list[str] | None = Query(None),
+) -> export.ExportQuery:
+    return export.ExportQuery(
+        format=format, date_from=date_from, date_to=date_to, columns=columns)
 
-    with open(os.path.join("./database", filename), "rb") as file:
-        file_bytes = io.BytesIO(file.read())
 
-    # Prepare the StreamingResponse with the BytesIO object
-    response = StreamingResponse(
-        file_bytes,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+def not_modified(request: Request, tag: str, modified: float | None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return tag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and modified is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(modified) <= since
+    return False
+
 
-    # Set the Content-Disposition header for download
-    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+# Function to export a workbook as .xlsx, csv, jsonl or parquet, optionally
+# only the bills of a date range and some of the columns
 
-    return response
+
+@app.api_route("/export/{filename}", methods=["GET", "POST"])
+async def export_data(
+    request: Request, filename: str, query: export.ExportQuery = Depends(export_query)
+):
+    file_name = os.path.join("./database", filename)
+    engine = storage.engine()
+    if not engine.exists(file_name):
+        raise HTTPException(status_code=404, detail="workbook not found")
+    unknown = [c for c in query.columns or [] if c not in storage.BILL_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown columns: {', '.join(unknown)}")
+    if query.format == "parquet" and export.pa is None:
+        raise HTTPException(status_code=400, detail="parquet export needs pyarrow")
+
+    version = engine.version(file_name)
+    tag = export.etag(version, query)
+    modified = export.last_modified(version)
+    if not_modified(request, tag, modified):
+        return Response(status_code=304, headers={"ETag": tag})
+
+    if query.format == "xlsx" and not query.filtered:
+        # the whole workbook, a copy of the engine's up to date .xlsx taken
+        # under the lock (on the excel engine that folds the journal in, a
+        # write)
+        path = await offload.write(file_name, export.workbook_file, engine, file_name)
+        chunks = export.file_chunks(path, remove=True)
+    elif query.format == "xlsx":
+        df_bill_data = await offload.read(file_name, export.load, engine, file_name, query)
+        path = await offload.run(export.xlsx_file, file_name, df_bill_data, query)
+        chunks = export.file_chunks(path, remove=True)
+    else:
+        frames = export.frames(
+            await offload.read(file_name, export.load, engine, file_name, query), query)
+        chunks = {
+            "csv": export.csv_chunks,
+            "jsonl": export.jsonl_chunks,
+            "parquet": export.parquet_chunks,
+        }[query.format](frames)
+
+    download_name = os.path.splitext(filename)[0] + "." + query.format
+    headers = {
+        "Content-Disposition": f"attachment; filename={download_name}",
+        "ETag": tag,
+        "Cache-Control": "no-cache",
+    }
+    if modified is not None:
+        headers["Last-Modified"] = email.utils.formatdate(modified, usegmt=True)
+    return StreamingResponse(
+        chunks, media_type=export.MEDIA_TYPES[query.format], headers=headers)
+
+
+@app.post("/compact/{filename}")
+async def compact(filename: str):
+    file_name = os.path.join("./database", filename)
+    if not await writer.compact(file_name):
+        raise HTTPException(
+            status_code=409,
+            detail=f"could not compact {filename}, close the file and try again",
+        )
+    return {"message": "journal compacted successfully"}
 
 
 @app.delete("/delete/{filename}/{id}")
 async def delete_data(filename: str, id: str):
     try:
-        delete_bill(os.path.join("./database", filename), id)
+        if not await writer.delete(os.path.join("./database", filename), [id]):
+            return {"message": "bill not found!!"}
         return {"message": "bill is delete successfully"}
     except:
         return {"message": "bill not found!!"}
@@ -529,7 +464,8 @@ async def delete_data(filename: str, id: str):
 @app.post("/create-template")
 async def create_template(request: Request, filename: str = Form(...)):
     try:
-        check_excel(os.path.join("./database", filename + ".xlsx"))
+        file_name = os.path.join("./database", filename + ".xlsx")
+        await offload.write(file_name, check_excel, file_name)
         return templates.TemplateResponse(
             request=request,
             name="upload.html",
@@ -540,187 +476,188 @@ async def create_template(request: Request, filename: str = Form(...)):
         )
 
 
-async def convert_html_to_pdf(source_html, output_filename):
-    try:
-        # Launch headless browser
-        browser = await launch(
-            headless=True,
-            executablePath="C:\\Program Files (x86)\\Microsoft\\Edge\\Application\\msedge.exe",
-        )
-        page = await browser.newPage()  # Open a new page
-        # await page.setContent(source_html)
-        # Set HTML content
-        await page.setContent(source_html)
-        await page.pdf(
-            {
-                "path": output_filename,
-                "format": "A4",
-                "margins": {
-                    "top": "75px",
-                    "right": "75px",
-                    "bottom": "75px",
-                    "left": "75px",
-                },
-                "printBackground": True,
-                "preferCSSPageSize": True,
-            },
-        )  # Save PDF
-        await browser.close()  # Close browser
-        print(f"PDF successfully generated: {output_filename}")
-    except Exception as e:
-        print(f"Error generating PDF: {e}")
+# Function to render a single print page in-process, for the PDFs
+
+
+def page_html(name: str, build, data: dict) -> str:
+    return templates.get_template(name).render(**build(data))
 
 
 @app.post("/create-pdf/{filename}")
 async def create_pdf(filename: str, request: Request):
-    data = get_list(os.path.join("./database", filename))
-    base_url = request.base_url
+    file_name = os.path.join("./database", filename)
+    if not storage.engine().exists(file_name):
+        raise HTTPException(status_code=404, detail=f"{filename} not found!!")
+
+    # Bill, gate pass and weight slip of every bill, rendered from the
+    # templates and printed by the browser pool in the background. The items
+    # of an invoice share its invoiceNo and workbooks share invoice numbers,
+    # each bill of each workbook gets a folder of its own
+    workbook = os.path.splitext(filename)[0]
+
+    def documents():
+        for i in get_list(file_name):
+            invoice_dir = f"{pdf_jobs.PDF_DIRECTORY}/{workbook}/{i['invoiceNo']}/{i['id']}"
+            for name, build, output in (
+                ("bill.html", printing.bill, "bill.pdf"),
+                ("get_pass.html", printing.get_pass, "get_pass.pdf"),
+                ("wight.html", printing.weight, "wight.pdf"),
+            ):
+                yield (
+                    f"{invoice_dir}/{output}",
+                    pdf_jobs.digest(os.path.join("templates", name), i),
+                    functools.partial(page_html, name, build, i),
+                )
 
-    # Iterate over each bill and create the necessary directories and PDFs
-    for i in data:
-        invoice_dir = f"./pdf/{i['invoiceNo']}"
-        os.makedirs(invoice_dir, exist_ok=True)
+    job = await pdf_jobs.submit(filename, documents)
+    return {"message": "PDF generation started", "job_id": job.id}
 
-        # Define the URLs for bill, get_pass, and wight
-        bill_url = f'{base_url}bill_print/{filename}/{i["id"]}'
-        get_pass_url = f'{base_url}get_pass_print/{filename}/{i["id"]}'
-        wight_url = f'{base_url}get_wight_print/{filename}/{i["id"]}'
 
-        # Fetch the content asynchronously using httpx
-        async with httpx.AsyncClient() as client:
-            bill_response = await client.get(bill_url)
-            get_pass_response = await client.get(get_pass_url)
-            wight_response = await client.get(wight_url)
+@app.get("/pdf-jobs")
+async def pdf_job_list():
+    return pdf_jobs.jobs()
 
-        # If the requests are successful, convert the HTML to PDF
-        if bill_response.status_code == 200:
-            bill_content = bill_response.text
-            await convert_html_to_pdf(bill_content, f"{invoice_dir}/bill.pdf")
 
-        if get_pass_response.status_code == 200:
-            get_pass_content = get_pass_response.text
-            await convert_html_to_pdf(get_pass_content, f"{invoice_dir}/get_pass.pdf")
+@app.get("/pdf-jobs/{job_id}")
+async def pdf_job_status(job_id: int):
+    job = pdf_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"PDF job {job_id} not found!!")
+    return job
 
-        if wight_response.status_code == 200:
-            wight_content = wight_response.text
-            await convert_html_to_pdf(wight_content, f"{invoice_dir}/wight.pdf")
-    return {"message": "PDFs generated successfully"}
 
+@app.post("/pdf-jobs/{job_id}/cancel")
+async def pdf_job_cancel(job_id: int):
+    job = pdf_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"PDF job {job_id} not found!!")
+    return job
 
-@app.get("/get_all_dot_matrix_print/{filename}")
-async def dot_matrix(request: Request, filename: str):
-    data = get_list(os.path.join("./database", filename))
-    # print(datetime.datetime.strptime(data[0]['createdAt'], '%Y-%m-%dT%H:%M:%S.%fZ'))
-    # print(type(data['in_time']))
-    return templates.TemplateResponse(
-        request=request,
-        name="all_dot_matrex.html",
-        context={
-            "data": [
-                {
-                    **i,
-                    "date":  datetime.datetime.strptime(i["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y"),
-                    "before_wight": "{}".format(int(i["after_wight"])),
-                    "after_wight": "{}".format(int(i["before_wight"])),
-                    "net_wight": "{}".format(abs(int(i["before_wight"] - i["after_wight"]))),
-                    "wight_in_word": " ".join(
-                        [
-                            num2words.num2words(
-                                j,
-                                lang="en_IN",
-                            )
-                            for j in str(
-                                abs(int(i["before_wight"]) - int(i["after_wight"]))
-                            )
-                        ]
-                    ),
-                    "in_time": i["in_time"].strftime("%H:%M"),
-                    "out_time": i["out_time"].strftime("%H:%M"),
-                }
-                for i in data
-            ]
-            # .join([num2words.num2words(i, lang="en_IN",) for i in str("{:.2f}".format(data['after_wight'] - data['before_wight']))])
+
+# Function to send ESC/P slips to the browser as a .prn download, or
+# straight to the printer spool
+
+
+async def escp_response(chunks, download_name: str, spool: bool):
+    if spool:
+        if not escp.ESCP_SPOOL:
+            raise HTTPException(status_code=400, detail="BILL_ESCP_SPOOL is not set")
+        # the printer device or share can be slow, write from the storage
+        # threads (the slips are built there too, as they are written)
+        written = await offload.run(escp.spool, chunks)
+        return {"message": f"{written} bytes sent to {escp.ESCP_SPOOL}"}
+    return StreamingResponse(
+        chunks,
+        media_type="application/octet-stream",
+        headers={
+            "Content-Disposition": f'attachment; filename="{download_name}.prn"'
         },
     )
 
 
+@app.get("/get_all_dot_matrix_print/{filename}")
+async def dot_matrix(
+    request: Request,
+    filename: str,
+    output: Literal["html", "escp"] = "html",
+    spool: bool = False,
+):
+    file_name = os.path.join("./database", filename)
+    data = await offload.read(file_name, get_columns, file_name, printing.DOT_MATRIX_COLUMNS)
+    if output == "escp":
+        return await escp_response(
+            escp.slips(printing.dot_matrix(data)), os.path.splitext(filename)[0], spool
+        )
+    return stream_template(request, "all_dot_matrex.html", {"data": printing.dot_matrix(data)})
+
+
 @app.get("/get_dot_matrix_print/{filename}/{id}")
-async def dot_matrix(request: Request, filename: str, id: str):
-    data = read_data(os.path.join("./database", filename), id)
-    print(type(data["in_time"]))
-    return templates.TemplateResponse(
-        request=request,
-        name="dot_matrex.html",
-        context={
-            **data,
-            "date": datetime.datetime.strptime(data["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y"),
-            "before_wight": "{}".format(int(data["after_wight"])),
-            "after_wight": "{}".format(int(data["before_wight"])),
-            "net_wight": "{}".format(abs(int(data["before_wight"] - data["after_wight"]))),
-            "wight_in_word": " ".join(
-                [
-                    num2words.num2words(
-                        i,
-                        lang="en_IN",
-                    )
-                    for i in str(
-                        abs(int(data["before_wight"]) - int(data["after_wight"]))
-                    )
-                ]
-            ),
-            "in_time": data["in_time"].strftime("%H:%M"),
-            "out_time": data["out_time"].strftime("%H:%M"),
-            # .join([num2words.num2words(i, lang="en_IN",) for i in str("{:.2f}".format(data['after_wight'] - data['before_wight']))])
-        },
-    )
+async def dot_matrix(
+    request: Request,
+    filename: str,
+    id: str,
+    output: Literal["html", "escp"] = "html",
+    spool: bool = False,
+):
+    file_name = os.path.join("./database", filename)
+    data = await offload.read(file_name, read_data, file_name, id)
+    if output == "escp":
+        slip = escp.slips(printing.dot_matrix(pd.DataFrame([data])))
+        return await escp_response(slip, f"{os.path.splitext(filename)[0]}-{id}", spool)
+    return await cached_page(request, "dot_matrex.html", filename, data, printing.dot_matrix_slip)
 
 
 @app.get("/get_all_purchase_print/{filename}")
 async def dot_matrix(request: Request, filename: str):
-    data = get_list(os.path.join("./database", filename))
-    print(data)
-    return templates.TemplateResponse(
-        request=request,
-        name="all_purchase.html",
-        context={
-            "data": [
-                {
-                    **i,
-                    "quantity": "{:.2f}".format(float(i["quantity"])),
-                    "rate": "{:.2f}".format(float(i["rate"])),
-                    "date":  datetime.datetime.strptime(i["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y"),
-                    "total": "{:.2f}".format(float(i["quantity"] * i["rate"])),
-                }
-                for i in data
-            ]
-        },
-    )
+    file_name = os.path.join("./database", filename)
+    data = await offload.read(file_name, get_columns, file_name, printing.PURCHASE_COLUMNS)
+    return stream_template(request, "all_purchase.html", {"data": printing.purchases(data)})
 
 
 @app.get("/get_purchase_print/{filename}/{id}")
 async def dot_matrix(request: Request, filename: str, id: str):
-    data = read_data(os.path.join("./database", filename), id)
-    # print(data)
-    return templates.TemplateResponse(
-        request=request,
-        name="purchase.html",
-        context={
-            **data,
-            "quantity": "{:.2f}".format(float(data["quantity"])),
-            "rate": "{:.2f}".format(float(data["rate"])),
-            "date":  datetime.datetime.strptime(data["createdAt"], "%d-%m-%Y").strftime("%d/%m/%Y"),
-            "total": "{:.2f}".format(float(data["quantity"] * data["rate"])),
-        },
-    )
-    # return data
+    file_name = os.path.join("./database", filename)
+    data = await offload.read(file_name, read_data, file_name, id)
+    return await cached_page(request, "purchase.html", filename, data, printing.purchase)
+
+
+# Function to report how late the event loop runs, see offload.py
+
+
+@app.get("/loop-lag")
+async def loop_lag():
+    return offload.lag()
+
+
+# Function to load the most recently changed workbook into the cache once
+# the app is up, the counter's first list or print is then served warm
+
+
+async def warm_up():
+    try:
+        engine = storage.engine()
+        files = await offload.run(engine.workbooks, "./database")
+        versions = await offload.run(lambda: [engine.version(f) for f in files])
+        changed = [(export.last_modified(v) or 0, f) for f, v in zip(files, versions)]
+        if changed:
+            latest = max(changed)[1]
+            await offload.read(latest, get_frame, latest)
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+
+
+_warm_up_task: asyncio.Task | None = None
+_compact_task: asyncio.Task | None = None
 
 
 @app.on_event("startup")
 async def startup():
+    global _warm_up_task, _compact_task
+    offload.start()
+    # Fold journals left over from the last run without delaying startup
+    _compact_task = asyncio.create_task(writer.compact_all("./database"))
+    _warm_up_task = asyncio.create_task(warm_up())
     webbrowser.open("http://localhost:8080")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+    if _compact_task is not None:
+        await asyncio.gather(_compact_task, return_exceptions=True)
+    # let queued and running writes finish before the journals are folded
+    await writer.flush()
+    await writer.compact_all("./database")
+    await offload.shutdown()
+    loader.shutdown()
+    await pdf_jobs.shutdown()
+    await pdf.close()
+
+
 if __name__ == "__main__":
+    # Needed for the loader's worker processes in the packaged main.exe
+    multiprocessing.freeze_support()
     import uvicorn
 
     uvicorn.run(app, host="0.0.0.0", port=8080)
@@ -0,0 +1,56 @@
+import argparse
+import os
+
+import db  # noqa: F401  registers the engines
+import storage
+
+# One shot move between the storage engines.
+#
+#   python migrate.py import                  every database/*.xlsx -> sqlite
+#   python migrate.py import Example.xlsx     a single workbook
+#   python migrate.py export Example.xlsx     sqlite -> database/Example.xlsx
+#
+# Run it while the app is stopped. Importing reads the workbook together
+# with its journal and keeps the bill ids, so printed bills still match.
+
+
+def import_workbook(file_name: str):
+    excel = storage.get_engine("excel")
+    sqlite = storage.get_engine("sqlite")
+    df_bill_data = excel.load(file_name)
+    sqlite.create(file_name)
+    sqlite.import_rows(file_name, df_bill_data)
+    print(f"imported {len(df_bill_data)} bills from {file_name}")
+
+
+def export_workbook(file_name: str, output: str):
+    sqlite = storage.get_engine("sqlite")
+    if not sqlite.exists(file_name):
+        print(f"nothing to export, {file_name} was never imported")
+        return
+    df_bill_data = sqlite.load(file_name)
+    storage.write_xlsx(output, df_bill_data)
+    print(f"exported {len(df_bill_data)} bills to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move bills between storage engines")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("files", nargs="*", help="workbook names, default: all of them")
+    parser.add_argument("--directory", default="./database")
+    args = parser.parse_args()
+
+    if args.action == "import":
+        files = [os.path.join(args.directory, f) for f in args.files] or \
+            storage.get_engine("excel").workbooks(args.directory)
+        for file_name in files:
+            import_workbook(file_name)
+    else:
+        files = [os.path.join(args.directory, f) for f in args.files] or \
+            storage.get_engine("sqlite").workbooks(args.directory)
+        for file_name in files:
+            export_workbook(file_name, file_name)
+
+
+if __name__ == "__main__":
+    main()
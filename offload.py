@@ -0,0 +1,176 @@
+import asyncio
+import collections
+import contextlib
+import functools
+import os
+import statistics
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+# Keeps blocking storage work off the event loop. Reading and parsing
+# workbooks (pandas, openpyxl, xlsxwriter, sqlite) runs in a bounded pool of
+# BILL_STORAGE_THREADS threads, so a slow workbook holds up its own request
+# and nothing else: other clients, static files and the PDF jobs keep being
+# served meanwhile. Threads rather than processes, the frame cache, the
+# bill index and the journal locks live in this process.
+#
+# Every workbook has an async reader/writer lock: any number of requests can
+# read it at once, a write waits for them and has it to itself. Writers go
+# first once they are waiting, a steady stream of reads cannot starve them.
+#
+# A monitor task measures how late the loop wakes up (event loop lag),
+# served on /loop-lag.
+
+STORAGE_THREADS = int(os.environ.get("BILL_STORAGE_THREADS", 4))
+
+# How often the loop lag is sampled, and how many samples are kept
+LAG_INTERVAL = 0.1
+LAG_SAMPLES = 600
+
+_executor: ThreadPoolExecutor | None = None
+_busy = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(STORAGE_THREADS, 1), thread_name_prefix="storage")
+    return _executor
+
+
+class RWLock:
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._condition = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def reading(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def writing(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(
+                    lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+                # a writer that gave up waiting lets the readers through
+                self._condition.notify_all()
+            self._writer = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+# asyncio locks belong to the loop they are first used on, one set per loop
+_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, RWLock]]" = \
+    weakref.WeakKeyDictionary()
+
+# Function to get the reader/writer lock of a workbook
+
+
+def lock_for(file_name: str) -> RWLock:
+    locks = _locks.setdefault(asyncio.get_running_loop(), {})
+    key = os.path.abspath(file_name)
+    if key not in locks:
+        locks[key] = RWLock()
+    return locks[key]
+
+# Function to run blocking work in the storage threads
+
+
+async def run(func, *args, **kwargs):
+    global _busy
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+    _busy += 1
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # the thread cannot be stopped, hold on (and to the workbook lock)
+        # until it is done with the files
+        await asyncio.wait([future])
+        raise
+    finally:
+        _busy -= 1
+
+# Function to read a workbook in the storage threads, alongside other readers
+
+
+async def read(file_name: str, func, *args, **kwargs):
+    async with lock_for(file_name).reading():
+        return await run(func, *args, **kwargs)
+
+# Function to change a workbook in the storage threads, on its own
+
+
+async def write(file_name: str, func, *args, **kwargs):
+    async with lock_for(file_name).writing():
+        return await run(func, *args, **kwargs)
+
+
+_lag: collections.deque = collections.deque(maxlen=LAG_SAMPLES)
+_monitor: asyncio.Task | None = None
+
+
+async def _watch():
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        _lag.append(max(loop.time() - start - LAG_INTERVAL, 0.0))
+
+
+def start():
+    global _monitor
+    if _monitor is None or _monitor.done():
+        _lag.clear()
+        _monitor = asyncio.get_running_loop().create_task(_watch())
+
+
+async def shutdown():
+    global _monitor, _executor
+    if _monitor is not None:
+        _monitor.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _monitor
+        _monitor = None
+    if _executor is not None:
+        # writes still running finish, queued ones are dropped
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+# Function to report the loop lag over the kept samples, in milliseconds
+
+
+def lag() -> dict:
+    samples = sorted(_lag)
+    if not samples:
+        return {"samples": 0, "storage_threads": STORAGE_THREADS, "busy": _busy}
+    return {
+        "samples": len(samples),
+        "interval_ms": LAG_INTERVAL * 1000,
+        "last_ms": round(_lag[-1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2),
+        "p99_ms": round(samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2),
+        "storage_threads": STORAGE_THREADS,
+        "busy": _busy,
+    }
@@ -0,0 +1,247 @@
+import asyncio
+import os
+
+import offload
+
+# PDF rendering, through the backend picked with BILL_PDF_BACKEND:
+#
+#   pyppeteer  headless browsers that stay open (the default). Launching a
+#              browser costs seconds, printing a page into an open one a
+#              fraction of that, so the pool keeps BILL_PDF_BROWSERS
+#              browsers with BILL_PDF_PAGES tabs each and prints up to
+#              browsers * pages PDFs at the same time. A tab (or a browser)
+#              that fails is replaced before it is used again.
+#   pdfkit     wkhtmltopdf, which has to be installed.
+#   xhtml2pdf  pure Python, no browser, but only simple CSS.
+#
+# A backend's library is imported when its first PDF is printed, never at
+# startup: the browser driver and the PDF libraries are most of what the
+# app would otherwise import before it can answer the first request.
+#
+# BILL_BROWSER is the Chrome / Edge executable to drive. Without it Edge is
+# used where it is installed, otherwise pyppeteer's own Chromium.
+
+EDGE = "C:\\Program Files (x86)\\Microsoft\\Edge\\Application\\msedge.exe"
+
+PDF_BROWSER = os.environ.get("BILL_BROWSER") or (EDGE if os.path.exists(EDGE) else None)
+PDF_BROWSERS = int(os.environ.get("BILL_PDF_BROWSERS", 1))
+PDF_PAGES = int(os.environ.get("BILL_PDF_PAGES", 4))
+PDF_BACKEND = os.environ.get("BILL_PDF_BACKEND", "pyppeteer")
+
+PDF_OPTIONS = {
+    "format": "A4",
+    "margins": {
+        "top": "75px",
+        "right": "75px",
+        "bottom": "75px",
+        "left": "75px",
+    },
+    "printBackground": True,
+    "preferCSSPageSize": True,
+}
+
+# The same page for wkhtmltopdf, 75px is about 20mm
+PDFKIT_OPTIONS = {
+    "page-size": "A4",
+    "margin-top": "20mm",
+    "margin-right": "20mm",
+    "margin-bottom": "20mm",
+    "margin-left": "20mm",
+    "print-media-type": None,
+    "quiet": None,
+}
+
+
+class PdfBackend:
+    name = ""
+
+    # how many PDFs it prints at the same time
+    @property
+    def size(self) -> int:
+        return 1
+
+    # Function to print one html document to a PDF file
+    async def render(self, html: str, output_filename: str):
+        raise NotImplementedError
+
+    # Function to print many documents, as many at a time as the backend
+    # can. `jobs` yields (make_html, output_filename), the html is only
+    # rendered when the backend is free. `report(output_filename, error)`
+    # is called after every document. Returns the number printed and failed.
+
+    async def render_all(self, jobs, report=None) -> tuple[int, int]:
+        jobs = iter(jobs)
+        done, failed = 0, 0
+
+        async def worker():
+            nonlocal done, failed
+            for make_html, output_filename in jobs:
+                try:
+                    # the templates are long, render them off the loop
+                    html = await offload.run(make_html)
+                    await self.render(html, output_filename)
+                    done += 1
+                    error = None
+                except Exception as e:
+                    failed += 1
+                    error = e
+                    print(f"Error generating PDF {output_filename}: {e}")
+                if report is not None:
+                    report(output_filename, error)
+
+        await asyncio.gather(*(worker() for _ in range(self.size)))
+        return done, failed
+
+    async def close(self):
+        pass
+
+
+_backends: dict[str, type] = {}
+_instance: PdfBackend | None = None
+
+
+def register(backend_class: type):
+    _backends[backend_class.name] = backend_class
+    return backend_class
+
+# Function to get the backend selected with BILL_PDF_BACKEND, made on first use
+
+
+def backend() -> PdfBackend:
+    global _instance
+    if PDF_BACKEND not in _backends:
+        raise ValueError(
+            f"unknown PDF backend {PDF_BACKEND!r}, pick one of {sorted(_backends)}")
+    if _instance is None:
+        _instance = _backends[PDF_BACKEND]()
+    return _instance
+
+
+async def close():
+    global _instance
+    if _instance is not None:
+        await _instance.close()
+        _instance = None
+
+
+@register
+class BrowserPool(PdfBackend):
+    name = "pyppeteer"
+
+    def __init__(self, browsers: int = PDF_BROWSERS, pages: int = PDF_PAGES,
+                 executable: str | None = PDF_BROWSER):
+        self.browsers = max(browsers, 1)
+        self.pages = max(pages, 1)
+        self.executable = executable
+        self._browsers: list = []
+        self._idle: asyncio.Queue | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def size(self) -> int:
+        return self.browsers * self.pages
+
+    async def _launch(self):
+        from pyppeteer import launch
+
+        options = {
+            "headless": True,
+            # uvicorn handles the signals, the browsers are closed on shutdown
+            "handleSIGINT": False,
+            "handleSIGTERM": False,
+            "handleSIGHUP": False,
+        }
+        if self.executable:
+            options["executablePath"] = self.executable
+        return await launch(**options)
+
+    async def _start(self):
+        async with self._lock:
+            if self._idle is not None:
+                return
+            idle = asyncio.Queue()
+            for index in range(self.browsers):
+                browser = await self._launch()
+                self._browsers.append(browser)
+                for _ in range(self.pages):
+                    idle.put_nowait((index, await browser.newPage()))
+            self._idle = idle
+
+    async def _replace(self, index: int, page):
+        try:
+            await page.close()
+        except Exception:
+            pass
+        try:
+            return await self._browsers[index].newPage()
+        except Exception:
+            # the browser itself is gone, its other tabs fail and get
+            # replaced the same way when they are next used
+            try:
+                await self._browsers[index].close()
+            except Exception:
+                pass
+            self._browsers[index] = await self._launch()
+            return await self._browsers[index].newPage()
+
+    async def render(self, html: str, output_filename: str):
+        await self._start()
+        index, page = await self._idle.get()
+        try:
+            await page.setContent(html)
+            await page.pdf({"path": output_filename, **PDF_OPTIONS})
+        except Exception:
+            try:
+                page = await self._replace(index, page)
+            finally:
+                self._idle.put_nowait((index, page))
+            raise
+        self._idle.put_nowait((index, page))
+
+    async def close(self):
+        async with self._lock:
+            for browser in self._browsers:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+            self._browsers = []
+            self._idle = None
+
+
+# Sync PDF libraries print in threads, BILL_PDF_PAGES at a time
+
+
+class _ThreadBackend(PdfBackend):
+    @property
+    def size(self) -> int:
+        return max(PDF_PAGES, 1)
+
+    async def render(self, html: str, output_filename: str):
+        await asyncio.to_thread(self.write, html, output_filename)
+
+    def write(self, html: str, output_filename: str):
+        raise NotImplementedError
+
+
+@register
+class PdfkitBackend(_ThreadBackend):
+    name = "pdfkit"
+
+    def write(self, html: str, output_filename: str):
+        import pdfkit
+
+        pdfkit.from_string(html, output_filename, options=PDFKIT_OPTIONS)
+
+
+@register
+class Xhtml2pdfBackend(_ThreadBackend):
+    name = "xhtml2pdf"
+
+    def write(self, html: str, output_filename: str):
+        from xhtml2pdf import pisa
+
+        with open(output_filename, "wb") as f:
+            result = pisa.CreatePDF(html, dest=f)
+        if result.err:
+            raise RuntimeError(f"xhtml2pdf could not print {output_filename}")
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+from datetime import datetime
+
+from pydantic import BaseModel
+
+import cache
+import offload
+import pdf
+
+# Background PDF generation. /create-pdf queues a job and returns its id
+# right away; one worker runs the jobs in order through the browser pool.
+# Every PDF is recorded in pdf/.manifest.json with a hash of its bill row
+# and template, a PDF whose hash has not changed since the last run (and
+# whose file is still there) is skipped, so a rerun only prints new and
+# edited bills.
+
+PDF_DIRECTORY = "./pdf"
+MANIFEST = os.path.join(PDF_DIRECTORY, ".manifest.json")
+
+# Finished jobs kept around for the status endpoint
+KEEP_JOBS = 20
+
+
+class PdfJob(BaseModel):
+    id: int
+    filename: str
+    # queued, running, done, cancelled or failed
+    status: str = "queued"
+    total: int = 0
+    generated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    error: str | None = None
+    created_at: datetime
+    finished_at: datetime | None = None
+
+
+_jobs: dict[int, PdfJob] = {}
+_documents: dict[int, object] = {}
+_cancelled: set[int] = set()
+_ids = itertools.count(1)
+_queue: asyncio.Queue | None = None
+_worker: asyncio.Task | None = None
+_templates: dict[str, tuple] = {}
+
+
+def _template_hash(template_path: str) -> str:
+    mtime = os.stat(template_path).st_mtime_ns
+    cached = _templates.get(template_path)
+    if cached is None or cached[0] != mtime:
+        with open(template_path, "rb") as f:
+            cached = (mtime, hashlib.sha256(f.read()).hexdigest())
+        _templates[template_path] = cached
+    return cached[1]
+
+# Function to hash what a PDF is printed from: the template and the bill
+
+
+def digest(template_path: str, row: dict) -> str:
+    return hashlib.sha256(
+        (_template_hash(template_path) + cache.row_hash(row)).encode()).hexdigest()
+
+
+def _load_manifest() -> dict:
+    try:
+        with open(MANIFEST, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest: dict):
+    try:
+        os.makedirs(PDF_DIRECTORY, exist_ok=True)
+        with open(MANIFEST + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(MANIFEST + ".tmp", MANIFEST)
+    except Exception as e:
+        print(f"Error writing PDF manifest: {e}")
+
+# Function to queue PDF generation for a workbook. `documents()` yields
+# (output_filename, digest, make_html) for every PDF of the workbook, it is
+# called by the worker. A job already waiting or running for the same
+# workbook is returned instead of queuing another one.
+
+
+async def submit(filename: str, documents) -> PdfJob:
+    global _queue, _worker
+    for job in _jobs.values():
+        if job.filename == filename and job.status in ("queued", "running"):
+            return job
+    if _queue is None:
+        _queue = asyncio.Queue()
+    if _worker is None or _worker.done():
+        _worker = asyncio.create_task(_work())
+    job = PdfJob(id=next(_ids), filename=filename, created_at=datetime.now())
+    _jobs[job.id] = job
+    _documents[job.id] = documents
+    _forget_old()
+    _queue.put_nowait(job.id)
+    return job
+
+
+def get(job_id: int) -> PdfJob | None:
+    return _jobs.get(job_id)
+
+
+def jobs() -> list[PdfJob]:
+    return sorted(_jobs.values(), key=lambda job: job.id, reverse=True)
+
+# Function to cancel a job, a running one stops after the PDFs it is
+# already printing
+
+
+def cancel(job_id: int) -> PdfJob | None:
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+    if job.status == "queued":
+        job.status = "cancelled"
+        job.finished_at = datetime.now()
+    elif job.status == "running":
+        _cancelled.add(job_id)
+    return job
+
+
+def _forget_old():
+    finished = [job.id for job in jobs() if job.status not in ("queued", "running")]
+    for job_id in finished[KEEP_JOBS:]:
+        _jobs.pop(job_id, None)
+        _documents.pop(job_id, None)
+
+
+async def _work():
+    while True:
+        job = _jobs.get(await _queue.get())
+        if job is None or job.status != "queued":
+            continue
+        try:
+            await _run(job, _documents.pop(job.id))
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"PDF job {job.id} failed: {e}")
+        finally:
+            job.finished_at = datetime.now()
+            _cancelled.discard(job.id)
+
+
+async def _run(job: PdfJob, documents):
+    job.status = "running"
+    # reading the workbook and hashing the rows is blocking work
+    todo = await offload.read(os.path.join("./database", job.filename),
+                              lambda: list(documents()))
+    job.total = len(todo)
+    manifest = _load_manifest()
+    digests = {}
+    # one render per output file, two renders never write the same file
+    pending = {}
+    for output_filename, key, make_html in todo:
+        if manifest.get(output_filename) == key and os.path.exists(output_filename):
+            job.skipped += 1
+            continue
+        digests[output_filename] = key
+        pending[output_filename] = make_html
+
+    def queued():
+        for output_filename, make_html in pending.items():
+            if job.id in _cancelled:
+                return
+            os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+            yield make_html, output_filename
+
+    def report(output_filename: str, error):
+        if error is None:
+            job.generated += 1
+            manifest[output_filename] = digests[output_filename]
+        else:
+            job.failed += 1
+            manifest.pop(output_filename, None)
+
+    try:
+        await pdf.backend().render_all(queued(), report)
+    finally:
+        _save_manifest(manifest)
+    job.status = "cancelled" if job.id in _cancelled else "done"
+
+
+async def shutdown():
+    global _worker
+    for job in _jobs.values():
+        if job.status in ("queued", "running"):
+            cancel(job.id)
+    if _worker is not None:
+        _worker.cancel()
+        _worker = None
@@ -0,0 +1,318 @@
+import numpy as np
+import pandas as pd
+
+import storage
+import words
+
+# Template data for the print routes. For the bulk prints amounts, weights
+# and the number formatting are worked out a whole column at a time, once
+# per request, and the templates get one small dict per bill. Dates and
+# times come as display columns (storage.DISPLAY_COLUMNS), made once per
+# version of the workbook. Amounts
+# in words are spelled once per distinct value, bills repeat the same
+# amounts a lot. The single bill prints, also used for the PDFs, are at the
+# bottom.
+
+
+def _numbers(column: pd.Series) -> np.ndarray:
+    return pd.to_numeric(column, errors="coerce").to_numpy(dtype="float64")
+
+
+def fixed(values: np.ndarray) -> np.ndarray:
+    # same text as "{:.2f}".format, "nan" included
+    return np.char.mod("%.2f", values)
+
+
+def whole(values: np.ndarray) -> np.ndarray:
+    # same text as "{}".format(int(value)), empty for a missing number
+    missing = np.isnan(values)
+    text = np.char.mod("%d", np.trunc(np.where(missing, 0, values)))
+    return np.where(missing, "", text)
+
+
+def _spell(texts: np.ndarray, speak) -> np.ndarray:
+    spoken = {text: speak(text) for text in pd.unique(texts)}
+    return np.array([spoken[text] for text in texts], dtype=object)
+
+
+def _records(df_bill_data: pd.DataFrame, **columns):
+    # columns the route computed win over the stored ones
+    names = [name for name in df_bill_data.columns if name not in columns]
+    names += list(columns)
+    values = [df_bill_data[name].to_numpy() for name in df_bill_data.columns
+              if name not in columns]
+    values += list(columns.values())
+    for row in zip(*values):
+        yield dict(zip(names, row))
+
+# Columns of the bills each bulk print reads, the routes load only these
+BILL_COLUMNS = ["invoiceNo", "date", "supplierName", "supplierOtherInfo",
+                "farmerCode", "goods", "hsn_sac", "quantity", "rate", "par",
+                "vehicle_no"]
+GET_PASS_COLUMNS = ["date", "goods", "farmerName", "vehicle_no", "year"]
+WEIGHT_COLUMNS = ["date", "farmerName", "farmerCode", "goods", "par",
+                  "vehicle_no", "before_wight", "after_wight", "in_time_12h", "year"]
+DOT_MATRIX_COLUMNS = ["id", "supplierName", "address", "date", "goods",
+                      "vehicle_no", "before_wight", "after_wight", "in_time_24h",
+                      "out_time_24h"]
+PURCHASE_COLUMNS = ["invoiceNo", "farmerName", "farmerCode", "address", "par",
+                    "vehicle_no", "quantity", "rate", "date"]
+
+# Function to build the bills of /bill_all_print
+
+
+def bills(df_bill_data: pd.DataFrame):
+    quantity = _numbers(df_bill_data["quantity"])
+    amount = fixed(quantity * _numbers(df_bill_data["rate"]))
+    records = _records(
+        df_bill_data,
+        date=storage.display(df_bill_data, "date"),
+        quantity=fixed(quantity),
+        rate=fixed(_numbers(df_bill_data["rate"])),
+        amount=amount,
+        amount_in_word=_spell(amount, words.amount_in_words),
+    )
+    for i in records:
+        yield {
+            "invoiceNo": i["invoiceNo"],
+            "date": i["date"],
+            "supplierName": i["supplierName"],
+            "supplierOtherInfo": i["supplierOtherInfo"],
+            "items": [
+                {
+                    "farmerCode": i["farmerCode"],
+                    "good": i["goods"],
+                    "hsn_sac": i["hsn_sac"],
+                    "quantity": i["quantity"],
+                    "rate": i["rate"],
+                    "par": i["par"],
+                    "amount": i["amount"],
+                    "vehicle_no": i["vehicle_no"],
+                    "invoiceNo": i["invoiceNo"],
+                    "total": i["amount"],
+                    "amount_in_word": i["amount_in_word"],
+                }
+            ],
+            "total_quantity": i["quantity"],
+            "total_amount": i["amount"],
+            "bill_items": [{"hsn_sac": i["hsn_sac"], "total": i["amount"]}],
+            "tex_amount": i["amount"],
+            "amount_in_word": i["amount_in_word"],
+            "par": i["par"],
+        }
+
+# Function to build the gate passes of /get_all_pass_print
+
+
+def get_passes(df_bill_data: pd.DataFrame):
+    records = _records(df_bill_data, date=storage.display(df_bill_data, "date"))
+    for i in records:
+        yield {
+            "items": [
+                {
+                    "date": i["date"],
+                    "good": i["goods"],
+                    "villagerName": i["farmerName"],
+                    "vehicle_no": i["vehicle_no"],
+                }
+            ]
+        }
+
+# Function to build the weight slips of /get_all_wight_print
+
+
+def weights(df_bill_data: pd.DataFrame):
+    before = _numbers(df_bill_data["before_wight"])
+    after = _numbers(df_bill_data["after_wight"])
+    records = _records(
+        df_bill_data,
+        date=storage.display(df_bill_data, "date"),
+        before_wight=fixed(before),
+        after_wight=fixed(after),
+        net_wight=fixed(after - before),
+        in_time=storage.display(df_bill_data, "in_time_12h"),
+        year=df_bill_data["year"].astype(str).to_numpy(),
+    )
+    for i in records:
+        yield {
+            "items": [
+                {
+                    "date": i["date"],
+                    "villagerName": i["farmerName"],
+                    "farmerCode": i["farmerCode"],
+                    "good": i["goods"],
+                    "par": i["par"],
+                    "vehicle_no": i["vehicle_no"],
+                    "before_wight": i["before_wight"],
+                    "after_wight": i["after_wight"],
+                    "net_wight": i["net_wight"],
+                    "in_time": i["in_time"],
+                    # the slip has always printed the in time twice
+                    "out_time": i["in_time"],
+                }
+            ],
+            "year": i["year"],
+        }
+
+# Function to build the dot matrix slips of /get_all_dot_matrix_print
+
+
+def dot_matrix(df_bill_data: pd.DataFrame):
+    before = _numbers(df_bill_data["before_wight"])
+    after = _numbers(df_bill_data["after_wight"])
+    spoken = np.abs(np.trunc(before) - np.trunc(after))
+    return _records(
+        df_bill_data,
+        date=storage.display(df_bill_data, "date"),
+        # the slip prints the two weights the other way round
+        before_wight=whole(after),
+        after_wight=whole(before),
+        net_wight=whole(np.abs(np.trunc(before - after))),
+        wight_in_word=_spell(whole(spoken), words.digits_in_words),
+        in_time=storage.display(df_bill_data, "in_time_24h"),
+        out_time=storage.display(df_bill_data, "out_time_24h"),
+    )
+
+# Function to build the purchase slips of /get_all_purchase_print
+
+
+def purchases(df_bill_data: pd.DataFrame):
+    quantity = _numbers(df_bill_data["quantity"])
+    rate = _numbers(df_bill_data["rate"])
+    return _records(
+        df_bill_data,
+        quantity=fixed(quantity),
+        rate=fixed(rate),
+        date=storage.display(df_bill_data, "date"),
+        total=fixed(quantity * rate),
+    )
+
+def _shown(data: dict, name: str) -> str:
+    # a display column of one bill, made like the bulk prints make it. A
+    # row read on its own (sqlite) has its dates and times as stored
+    return storage.display(pd.DataFrame([data]), name)[0]
+
+# Function to build the context of the single bill print, /bill_print and
+# its PDF
+
+
+def bill(data: dict) -> dict:
+    return {
+        "invoiceNo": data["invoiceNo"],
+        "date": _shown(data, "date"),
+        "supplierName": data["supplierName"],
+        "supplierOtherInfo": data["supplierOtherInfo"],
+        "items": [
+            {
+                "farmerCode": data["farmerCode"],
+                "good": data["goods"],
+                "hsn_sac": data["hsn_sac"],
+                "quantity": "{:.2f}".format(float(data["quantity"])),
+                "rate": "{:.2f}".format(float(data["rate"])),
+                "par": data["par"],
+                "amount": "{:.2f}".format(
+                    float(data["quantity"]) * float(data["rate"])
+                ),
+                "vehicle_no": data["vehicle_no"],
+                "invoiceNo": data["invoiceNo"],
+                "total": "{:.2f}".format(
+                    float(data["quantity"]) * float(data["rate"])
+                ),
+                "amount_in_word": words.amount_in_words(
+                    "{:.2f}".format(float(data["quantity"]) * float(data["rate"])),
+                    "",
+                ),
+            }
+        ],
+        "total_quantity": "{:.2f}".format(data["quantity"]),
+        "total_amount": "{:.2f}".format(
+            float(data["quantity"]) * float(data["rate"])
+        ),
+        "bill_items": [
+            {
+                "hsn_sac": data["hsn_sac"],
+                "total": "{:.2f}".format(
+                    float(data["quantity"]) * float(data["rate"])
+                ),
+            }
+        ],
+        "tex_amount": "{:.2f}".format(
+            float(data["quantity"]) * float(data["rate"])
+        ),
+        "amount_in_word": words.amount_in_words(
+            "{:.2f}".format(float(data["quantity"]) * float(data["rate"])),
+            "",
+        ),
+        "par": data["par"],
+    }
+
+# Function to build the context of the single gate pass print
+
+
+def get_pass(data: dict) -> dict:
+    return {
+        "year": data["year"],
+        "items": [
+            {
+                "date": _shown(data, "date"),
+                "good": data["goods"],
+                "villagerName": data["farmerName"],
+                "vehicle_no": data["vehicle_no"],
+            }
+        ],
+    }
+
+# Function to build the context of the single weight slip print
+
+
+def weight(data: dict) -> dict:
+    v: list[str] = []
+    s = []
+    for i in [data]:
+        if i["vehicle_no"] not in v:
+            v.append(i["vehicle_no"])
+            s.append(
+                {
+                    "date": _shown(data, "date"),
+                    "villagerName": i["farmerName"],
+                    "farmerCode": i["farmerCode"],
+                    "good": i["goods"],
+                    "vehicle_no": i["vehicle_no"],
+                    "par": i["par"],
+                    "before_wight": "{:.2f}".format(i["before_wight"]),
+                    "after_wight": "{:.2f}".format(i["after_wight"]),
+                    "net_wight": "{:.2f}".format(i["after_wight"] - i["before_wight"]),
+                    "in_time": _shown(data, "in_time_12h"),
+                    "out_time": _shown(data, "in_time_12h"),
+                }
+            )
+    return {"items": s, "year": data["year"]}
+
+# Function to build the context of the single dot matrix slip
+
+
+def dot_matrix_slip(data: dict) -> dict:
+    return {
+        **data,
+        "date": _shown(data, "date"),
+        "before_wight": "{}".format(int(data["after_wight"])),
+        "after_wight": "{}".format(int(data["before_wight"])),
+        "net_wight": "{}".format(abs(int(data["before_wight"] - data["after_wight"]))),
+        "wight_in_word": words.digits_in_words(
+            str(abs(int(data["before_wight"]) - int(data["after_wight"])))
+        ),
+        "in_time": _shown(data, "in_time_24h"),
+        "out_time": _shown(data, "out_time_24h"),
+    }
+
+# Function to build the context of the single purchase print
+
+
+def purchase(data: dict) -> dict:
+    return {
+        **data,
+        "quantity": "{:.2f}".format(float(data["quantity"])),
+        "rate": "{:.2f}".format(float(data["rate"])),
+        "date": _shown(data, "date"),
+        "total": "{:.2f}".format(float(data["quantity"] * data["rate"])),
+    }
@@ -0,0 +1,84 @@
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+# Reads workbooks, whole or only some columns, the latter for the routes
+# that need a few fields of every bill (the dashboard, the bulk prints,
+# filtered exports). With python-calamine
+# installed the sheet is read by calamine (Rust), pandas keeps only the asked
+# columns. Otherwise openpyxl streams the sheet in read only mode, only the
+# asked cells are converted and kept, and pandas' own Excel parser turns
+# them into the frame, so the columns come out exactly as pd.read_excel
+# would give them. BILL_READ_ENGINE=openpyxl or =calamine picks one.
+
+READ_ENGINE = os.environ.get("BILL_READ_ENGINE", "auto")
+
+
+def engine() -> str:
+    if READ_ENGINE != "auto":
+        return READ_ENGINE
+    return "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+
+
+def _cell(value, errors: frozenset):
+    # what pandas makes of an openpyxl cell
+    if value is None:
+        return ""
+    if type(value) is float:
+        whole = int(value)
+        return whole if whole == value else value
+    if isinstance(value, str) and value in errors:
+        return np.nan
+    return value
+
+# Function to read the first sheet, or only some of its columns (columns
+# the sheet does not have come back empty)
+
+
+def read(file_name: str, columns: list[str] | None = None) -> pd.DataFrame:
+    if columns is None:
+        return pd.read_excel(file_name, engine=engine())
+    wanted = set(columns)
+    if engine() == "calamine":
+        df_bill_data = pd.read_excel(
+            file_name, engine="calamine", usecols=lambda name: name in wanted)
+    else:
+        df_bill_data = _stream(file_name, wanted)
+    return df_bill_data.reindex(columns=columns)
+
+
+def _stream(file_name: str, wanted: set[str]) -> pd.DataFrame:
+    from openpyxl import load_workbook
+    from openpyxl.cell.cell import ERROR_CODES
+
+    errors = frozenset(ERROR_CODES)
+    workbook = load_workbook(file_name, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+        header = [_cell(value, errors) for value in next(rows, ())]
+        # the first column of a name, pandas renames the others "name.1"
+        positions = {}
+        for position, name in enumerate(header):
+            if name in wanted and name not in positions:
+                positions[name] = position
+        names = list(positions)
+        data = [names]
+        last_row = 0
+        for row in rows:
+            data.append([_cell(row[p], errors) if p < len(row) else ""
+                         for p in positions.values()])
+            # a row counts when any of its cells, asked for or not, is set
+            if any(value is not None and value != "" for value in row):
+                last_row = len(data) - 1
+    finally:
+        workbook.close()
+    # trailing empty rows are no bills, as in pd.read_excel
+    data = data[:last_row + 1]
+    if not names:
+        return pd.DataFrame(index=pd.RangeIndex(len(data) - 1))
+    return TextParser(data, header=0, skip_blank_lines=False).read()
@@ -0,0 +1,88 @@
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# Columnar copy of each workbook kept in database/.cache.
+# Feather (Arrow IPC, uncompressed so it can be memory mapped) is used when
+# pyarrow is installed, otherwise or when a column holds mixed types that
+# Arrow refuses, a pickle is written instead. Both load far faster than the
+# .xlsx. The sidecar records the fingerprint of the workbook it was built
+# from and is ignored as soon as that no longer matches.
+
+SIDECAR_DIR = ".cache"
+
+
+def path_for(file_name: str, suffix: str) -> str:
+    # Files derived from a workbook live in database/.cache
+    directory, name = os.path.split(file_name)
+    return os.path.join(directory, SIDECAR_DIR, name + suffix)
+
+
+def _base(file_name: str) -> str:
+    return path_for(file_name, "")
+
+
+def _meta_path(file_name: str) -> str:
+    return _base(file_name) + ".meta.json"
+
+# Function to load the sidecar if it still matches the workbook, only the
+# given columns of it when asked
+
+
+def load(file_name: str, fingerprint, columns: list[str] | None = None):
+    try:
+        with open(_meta_path(file_name), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if tuple(meta["fingerprint"]) != tuple(fingerprint):
+        return None
+    path = _base(file_name) + "." + meta["format"]
+    try:
+        if meta["format"] == "feather":
+            if feather is None:
+                return None
+            # Arrow reads just the asked columns of the file
+            return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+        df_bill_data = pd.read_pickle(path)
+        return df_bill_data if columns is None else df_bill_data[columns]
+    except Exception as e:
+        print(f"Error reading sidecar for {file_name}: {e}")
+        return None
+
+# Function to (re)write the sidecar for the workbook
+
+
+def save(file_name: str, fingerprint, df_bill_data: pd.DataFrame):
+    base = _base(file_name)
+    try:
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        # Invalidate first so a half finished save is never trusted
+        if os.path.exists(_meta_path(file_name)):
+            os.remove(_meta_path(file_name))
+        fmt = "pkl"
+        if feather is not None:
+            try:
+                feather.write_feather(
+                    df_bill_data, base + ".feather.tmp", compression="uncompressed")
+                fmt = "feather"
+            except Exception:
+                # Mixed types in a column, fall back to pickle
+                pass
+        if fmt == "pkl":
+            df_bill_data.to_pickle(base + ".pkl.tmp")
+        os.replace(base + "." + fmt + ".tmp", base + "." + fmt)
+        stale = base + (".pkl" if fmt == "feather" else ".feather")
+        if os.path.exists(stale):
+            os.remove(stale)
+        with open(_meta_path(file_name) + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": list(fingerprint), "format": fmt}, f)
+        os.replace(_meta_path(file_name) + ".tmp", _meta_path(file_name))
+    except Exception as e:
+        print(f"Error writing sidecar for {file_name}: {e}")
@@ -0,0 +1,361 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, time
+
+import pandas as pd
+
+import cache
+import sidecar
+import storage
+
+# SQLite storage: one database per logical workbook, database/<name>.sqlite3
+# for database/<name>.xlsx. The database runs in WAL mode, every insert and
+# delete is a single transaction and lookups go through the primary key or
+# the invoiceNo index. Excel is only an export format here.
+
+# createdAt, in_time and out_time keep their Python types through sqlite
+sqlite3.register_adapter(datetime, lambda value: value.isoformat())
+sqlite3.register_adapter(pd.Timestamp, lambda value: value.isoformat())
+sqlite3.register_adapter(time, lambda value: value.isoformat())
+
+
+def _convert_when(value: bytes):
+    text = value.decode()
+    try:
+        if "T" in text:
+            return datetime.fromisoformat(text)
+        if len(text) in (5, 8) and text[2] == ":":
+            return time.fromisoformat(text)
+    except ValueError:
+        pass
+    return text
+
+
+sqlite3.register_converter("BILLTIME", _convert_when)
+
+# NUMERIC columns keep numbers typed in as text as numbers, like Excel does
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bills (
+    id INTEGER PRIMARY KEY,
+    invoiceNo TEXT,
+    supplierName TEXT,
+    supplierOtherInfo TEXT,
+    goods TEXT,
+    hsn_sac NUMERIC,
+    quantity REAL,
+    rate REAL,
+    par TEXT,
+    farmerName TEXT,
+    vehicle_no TEXT,
+    farmerCode TEXT,
+    before_wight NUMERIC,
+    after_wight NUMERIC,
+    createdAt BILLTIME,
+    year TEXT,
+    in_time BILLTIME,
+    out_time BILLTIME,
+    address TEXT
+);
+CREATE INDEX IF NOT EXISTS bills_invoiceNo ON bills (invoiceNo);
+CREATE INDEX IF NOT EXISTS bills_createdAt ON bills (createdAt);
+"""
+
+
+# createdAt as YYYY-MM-DD, whether it was stored as ISO text or typed into
+# Excel as dd-mm-YYYY
+DAY_SQL = """(CASE WHEN createdAt LIKE '__-__-____'
+    THEN substr(createdAt, 7, 4) || '-' || substr(createdAt, 4, 2) || '-' || substr(createdAt, 1, 2)
+    ELSE substr(createdAt, 1, 10) END)"""
+
+# Empty cells sort first, as "" (like storage._sort_keys), and never as
+# NULL: a NULL key would make the keyset comparison of the next page NULL
+SORT_SQL = {
+    "id": "id",
+    # invoice numbers as numbers ("9" before "10"), sqlite puts the ones
+    # that are not numbers after them, as text
+    "invoiceNo": "COALESCE(CASE WHEN invoiceNo <> '' AND invoiceNo NOT GLOB '*[^0-9]*'"
+                 " THEN CAST(invoiceNo AS INTEGER) ELSE invoiceNo END, '')",
+    "createdAt": f"COALESCE({DAY_SQL}, '')",
+    "farmerName": "COALESCE(lower(farmerName), '')",
+    "vehicle_no": "COALESCE(lower(vehicle_no), '')",
+    "goods": "COALESCE(lower(goods), '')",
+}
+
+
+def database_path(file_name: str) -> str:
+    return os.path.splitext(file_name)[0] + ".sqlite3"
+
+
+def _native(value):
+    # Values coming out of pandas: NaN -> NULL, numpy scalars -> Python
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if value is pd.NaT:
+        return None
+    if hasattr(value, "item") and not isinstance(value, (datetime, time)):
+        return value.item()
+    return value
+
+
+@storage.register
+class SqliteEngine(storage.StorageEngine):
+    name = "sqlite"
+
+    def __init__(self):
+        self._connections: dict[str, sqlite3.Connection] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    # Function to get the shared connection and its lock for a workbook
+
+    def _open(self, file_name: str):
+        path = os.path.abspath(database_path(file_name))
+        with self._guard:
+            if path not in self._connections:
+                connection = sqlite3.connect(
+                    path,
+                    detect_types=sqlite3.PARSE_DECLTYPES,
+                    check_same_thread=False,
+                    isolation_level=None,
+                )
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+                connection.executescript(SCHEMA)
+                self._connections[path] = connection
+                self._locks[path] = threading.Lock()
+            return self._connections[path], self._locks[path]
+
+    def version(self, file_name: str):
+        path = database_path(file_name)
+        wal = path + "-wal"
+        if os.path.exists(path):
+            # opening the database creates the -wal file, open it before
+            # looking so the first version is not stale right away
+            self._open(file_name)
+        return tuple(
+            (os.stat(p).st_mtime_ns, os.stat(p).st_size) if os.path.exists(p) else None
+            for p in (path, wal)
+        )
+
+    def exists(self, file_name: str) -> bool:
+        return os.path.exists(database_path(file_name))
+
+    def create(self, file_name: str):
+        self._open(file_name)
+
+    def load(self, file_name: str) -> pd.DataFrame:
+        version = self.version(file_name)
+        df_bill_data = cache.frames.get(file_name, version)
+        if df_bill_data is not None:
+            return df_bill_data
+        connection, lock = self._open(file_name)
+        with lock:
+            df_bill_data = pd.read_sql_query(
+                "SELECT * FROM bills ORDER BY id", connection)
+        df_bill_data = storage.typed(df_bill_data, file_name)
+        cache.frames.put(file_name, version, df_bill_data)
+        return df_bill_data
+
+    def load_columns(self, file_name: str, columns: list[str], where=None) -> pd.DataFrame:
+        version = self.version(file_name)
+        df_bill_data = cache.frames.get(file_name, version)
+        if df_bill_data is not None and not set(columns) & set(storage.DISPLAY_COLUMNS):
+            return storage.select(df_bill_data, columns, where)
+        key = storage.projection_key(file_name, columns)
+        projected = cache.frames.get(key, version)
+        if projected is None:
+            if df_bill_data is None:
+                # only the table's own columns go into the SQL, the rest
+                # come back empty
+                known = [column for column in storage.read_columns(columns)
+                         if column in storage.BILL_COLUMNS]
+                connection, lock = self._open(file_name)
+                with lock:
+                    df_bill_data = pd.read_sql_query(
+                        "SELECT {} FROM bills ORDER BY id".format(
+                            ", ".join(known) or "id"), connection)
+                df_bill_data = storage.typed(df_bill_data, file_name)
+            projected = storage.select(df_bill_data, columns)
+            cache.frames.put(key, version, projected)
+        return storage.select(projected, columns, where)
+
+    def insert(self, file_name: str, rows: list[dict]) -> list[int]:
+        connection, lock = self._open(file_name)
+        columns = storage.BILL_COLUMNS[1:]
+        sql = "INSERT INTO bills ({}) VALUES ({})".format(
+            ", ".join(columns), ", ".join("?" * len(columns)))
+        ids = []
+        with lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    cursor = connection.execute(
+                        sql, [_native(row.get(column)) for column in columns])
+                    ids.append(cursor.lastrowid)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return ids
+
+    # Function to copy rows that already carry ids, used by the migrator
+
+    def import_rows(self, file_name: str, df_bill_data: pd.DataFrame):
+        connection, lock = self._open(file_name)
+        columns = [c for c in storage.BILL_COLUMNS if c in df_bill_data.columns]
+        sql = "INSERT OR REPLACE INTO bills ({}) VALUES ({})".format(
+            ", ".join(columns), ", ".join("?" * len(columns)))
+        rows = [
+            [_native(value) for value in row]
+            for row in df_bill_data[columns].itertuples(index=False, name=None)
+        ]
+        with lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(sql, rows)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def upsert(self, file_name: str, chunks) -> tuple[int, int]:
+        connection, lock = self._open(file_name)
+        columns = storage.BILL_COLUMNS[1:]
+        insert_sql = "INSERT INTO bills ({}) VALUES ({})".format(
+            ", ".join(columns), ", ".join("?" * len(columns)))
+        update_sql = "UPDATE bills SET {} WHERE id = ?".format(
+            ", ".join(f"{column} = ?" for column in columns))
+        inserted, updated = 0, set()
+        # bill id of the upload -> id of the bill it was added as, a later
+        # row with that id replaces it
+        added = {}
+        # One transaction for the upload, the chunks stream through it
+        with lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for chunk in chunks:
+                    bill_ids = chunk['id'].to_numpy()
+                    rows = chunk[columns].itertuples(index=False, name=None)
+                    for bill_id, row in zip(bill_ids, rows):
+                        values = [_native(value) for value in row]
+                        bill_id = None if pd.isna(bill_id) else int(bill_id)
+                        # Rows are matched on their id only, the items of
+                        # one invoice share its invoiceNo
+                        if bill_id in added:
+                            connection.execute(update_sql, values + [added[bill_id]])
+                            continue
+                        target = None
+                        if bill_id is not None:
+                            target = connection.execute(
+                                "SELECT id FROM bills WHERE id = ?",
+                                (bill_id,)).fetchone()
+                        if target is None:
+                            new_id = connection.execute(insert_sql, values).lastrowid
+                            inserted += 1
+                            if bill_id is not None:
+                                added[bill_id] = new_id
+                        else:
+                            connection.execute(update_sql, values + [target[0]])
+                            updated.add(target[0])
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return inserted, len(updated)
+
+    def _select(self, file_name: str, where: str, params) -> list[dict]:
+        connection, lock = self._open(file_name)
+        with lock:
+            cursor = connection.execute(
+                f"SELECT * FROM bills WHERE {where} ORDER BY id", params)
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def get(self, file_name: str, bill_id: int) -> dict | None:
+        rows = self._select(file_name, "id = ?", (bill_id,))
+        return rows[0] if rows else None
+
+    def query(self, file_name: str, query: storage.BillQuery):
+        where, params = ["1 = 1"], []
+        if query.date_from:
+            where.append(f"{DAY_SQL} >= ?")
+            params.append(query.date_from.isoformat())
+        if query.date_to:
+            where.append(f"{DAY_SQL} <= ?")
+            params.append(query.date_to.isoformat())
+        for column in ("farmerName", "vehicle_no", "goods"):
+            value = getattr(query, column)
+            if value:
+                where.append(f"{column} LIKE ? ESCAPE '\\'")
+                params.append("%" + value.replace("\\", "\\\\").replace(
+                    "%", "\\%").replace("_", "\\_") + "%")
+        if query.invoiceNo:
+            where.append("invoiceNo = ?")
+            params.append(query.invoiceNo)
+
+        key = SORT_SQL[query.sort]
+        direction = "DESC" if query.descending else "ASC"
+        compare = "<" if query.descending else ">"
+        if query.after is not None and query.sort == "id":
+            # a deleted anchor bill still has its place
+            where.append(f"id {compare} ?")
+            params.append(query.after)
+        elif query.after is not None:
+            # keyset: rows sorting after (key, id) of the anchor bill
+            where.append(
+                f"({key} {compare} (SELECT {key} FROM bills WHERE id = ?)"
+                f" OR ({key} = (SELECT {key} FROM bills WHERE id = ?) AND id {compare} ?))")
+            params += [query.after, query.after, query.after]
+
+        connection, lock = self._open(file_name)
+        with lock:
+            if query.after is not None and query.sort != "id" and connection.execute(
+                    "SELECT 1 FROM bills WHERE id = ?", (query.after,)).fetchone() is None:
+                # its key is gone with it, the page cannot be placed
+                raise ValueError(
+                    f"bill {query.after} is no longer there, start again from the first page")
+            cursor = connection.execute(
+                f"SELECT * FROM bills WHERE {' AND '.join(where)}"
+                f" ORDER BY {key} {direction}, id {direction} LIMIT ?",
+                params + [query.limit + 1])
+            names = [d[0] for d in cursor.description]
+            rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+        next_after = rows[query.limit - 1]['id'] if len(rows) > query.limit else None
+        return rows[:query.limit], next_after
+
+    def find_invoice(self, file_name: str, invoice_no: str) -> list[dict]:
+        return self._select(file_name, "invoiceNo = ?", (str(invoice_no),))
+
+    def delete_many(self, file_name: str, bill_ids: list[int]) -> list[int]:
+        connection, lock = self._open(file_name)
+        deleted = []
+        with lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for bill_id in bill_ids:
+                    cursor = connection.execute(
+                        "DELETE FROM bills WHERE id = ?", (bill_id,))
+                    if cursor.rowcount > 0:
+                        deleted.append(bill_id)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def export_xlsx(self, file_name: str) -> str:
+        # Exports are written next to the other derived files
+        path = sidecar.path_for(file_name, ".export.xlsx")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df_bill_data = self.load(file_name)
+        storage.write_xlsx_rows(path + ".tmp", storage.chunked(df_bill_data),
+                                list(df_bill_data.columns))
+        os.replace(path + ".tmp", path)
+        return path
+
+    def workbooks(self, directory: str) -> list[str]:
+        return [
+            os.path.splitext(path)[0] + ".xlsx"
+            for path in storage.glob_workbooks(directory, "*.sqlite3")
+        ]
@@ -0,0 +1,618 @@
+import datetime
+import os
+from datetime import date
+from glob import glob
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from pandas.api.types import union_categoricals
+from pydantic import BaseModel
+
+# Storage engines behind the functions in db.py.
+# Every engine stores the bills of one logical workbook, named like the
+# .xlsx the routes have always used (database/<name>.xlsx), the engine
+# decides what actually lives on disk. Pick one with BILL_STORAGE.
+
+STORAGE_ENGINE = os.environ.get("BILL_STORAGE", "excel")
+
+# Rows per chunk when bills are written or exported a piece at a time
+EXPORT_CHUNK_ROWS = int(os.environ.get("BILL_EXPORT_CHUNK_ROWS", 5000))
+
+BILL_COLUMNS = [
+    "id",
+    "invoiceNo",
+    "supplierName",
+    "supplierOtherInfo",
+    "goods",
+    "hsn_sac",
+    "quantity",
+    "rate",
+    "par",
+    "farmerName",
+    "vehicle_no",
+    "farmerCode",
+    "before_wight",
+    "after_wight",
+    "createdAt",
+    "year",
+    "in_time",
+    "out_time",
+    "address"
+]
+
+
+# Columns the bill list can be sorted on
+SORT_COLUMNS = ["id", "invoiceNo", "createdAt",
+                "farmerName", "vehicle_no", "goods"]
+
+# One page of the bill list. Pages are keyed on the id of the last bill of
+# the previous page (`after`), so deep pages cost the same as the first
+
+
+class BillQuery(BaseModel):
+    date_from: date | None = None
+    date_to: date | None = None
+    farmerName: str | None = None
+    vehicle_no: str | None = None
+    goods: str | None = None
+    invoiceNo: str | None = None
+    sort: str = "id"
+    descending: bool = False
+    after: int | None = None
+    limit: int = 50
+
+
+# Formats of dates and times typed into Excel as text. The first one of a
+# workbook that parses the column's first text decides, it is kept for the
+# workbook and the rest of the column is parsed with it in one go; text in
+# another of the formats is tried with those next
+DATE_FORMATS = ["%d-%m-%Y", "%d/%m/%Y", "%d.%m.%Y", "%Y-%m-%d"]
+TIME_FORMATS = ["%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M:%S %p"]
+
+# workbook -> column -> format of its text
+_text_formats: dict[str, dict[str, str]] = {}
+
+
+def _formats_for(file_name: str | None) -> dict[str, str]:
+    if file_name is None:
+        return {}
+    return _text_formats.setdefault(os.path.abspath(file_name), {})
+
+
+def _is_text(column: pd.Series) -> pd.Series:
+    # without a look at every value: .str leaves what is not text NaN
+    kind = pd.api.types.infer_dtype(column, skipna=True)
+    if kind == "string":
+        return column.notna()
+    if kind in ("mixed", "mixed-integer"):
+        return column.str.len().notna()
+    return pd.Series(False, index=column.index)
+
+
+def _parse_text(text: pd.Series, column: str, candidates: list[str],
+                formats: dict[str, str]) -> pd.Series:
+    text = text.str.strip()
+    if column not in formats:
+        sample = text[text != ""].head(1).tolist()
+        for candidate in candidates:
+            try:
+                datetime.datetime.strptime(sample[0], candidate)
+            except (IndexError, ValueError):
+                continue
+            formats[column] = candidate
+            break
+    first = formats.get(column, candidates[0])
+    parsed = pd.to_datetime(text, format=first, errors="coerce")
+    for candidate in candidates:
+        rest = parsed.isna() & (text != "")
+        if not rest.any():
+            break
+        if candidate != first:
+            parsed[rest] = pd.to_datetime(text[rest], format=candidate, errors="coerce")
+    return parsed
+
+
+def created_dates(created: pd.Series, formats: dict[str, str] | None = None) -> pd.Series:
+    # createdAt is a datetime for bills made here, "dd-mm-YYYY" text for
+    # rows typed into Excel. Typed bills have it parsed already
+    if created.dtype.kind == "M":
+        return created
+    is_text = _is_text(created)
+    days = pd.to_datetime(created.where(~is_text), errors="coerce")
+    if is_text.any():
+        days[is_text] = _parse_text(created[is_text], "createdAt", DATE_FORMATS,
+                                    {} if formats is None else formats)
+    return days
+
+
+# Types the bills are kept in once loaded. Columns that repeat a handful of
+# values are categoricals, one small code per bill instead of one Python
+# string; amounts and weights are float64 (the prints compute with them,
+# float32 would shift the last printed digit); createdAt and the weighing
+# times are datetime64, the times on the day of the bill. A column holding
+# a value its type cannot represent (text typed where Excel should have a
+# number) is kept as it was read, nothing is lost to the schema.
+BILL_SCHEMA = {
+    "supplierName": "category",
+    "goods": "category",
+    "hsn_sac": "category",
+    "par": "category",
+    "farmerName": "category",
+    "vehicle_no": "category",
+    "farmerCode": "category",
+    "year": "category",
+    "quantity": "float64",
+    "rate": "float64",
+    "before_wight": "float64",
+    "after_wight": "float64",
+    "createdAt": "datetime64[ns]",
+    "in_time": "datetime64[ns]",
+    "out_time": "datetime64[ns]",
+}
+
+
+# Codes that Excel reads as numbers when they are typed in (52010015) and
+# the form posts as text ("52010015"). Kept as text, one type per column,
+# whole numbers without a ".0": a column of both cannot go to Arrow (the
+# sidecar) and "1" would not find 1
+CODE_COLUMNS = ["invoiceNo", "hsn_sac", "farmerCode"]
+
+
+def _code_text(value):
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _as_codes(values: pd.Series) -> pd.Series | None:
+    # None when the column is text already, typing typed bills stays free
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        uniques = values.cat.categories
+        if pd.api.types.infer_dtype(uniques) in ("string", "empty"):
+            return None
+        codes = values.cat.codes.to_numpy()
+    else:
+        if pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty"):
+            return None
+        codes, uniques = pd.factorize(values)
+    text = np.array([_code_text(value) for value in uniques] + [np.nan], dtype=object)
+    # code -1 (an empty cell) picks the NaN at the end
+    return pd.Series(text[codes], index=values.index, name=values.name)
+
+
+def _missing(column: pd.Series) -> pd.Series:
+    return column.isna() | (column.astype(str).str.strip() == "")
+
+
+def _times(column: pd.Series, days: pd.Series | None,
+           formats: dict[str, str]) -> pd.Series | None:
+    # datetime.time from a time cell, "HH:MM" text from the form, put on
+    # the day of the bill. Full datetimes (written back by us) are kept.
+    # Cells are told apart by their text: a time is "HH:MM:SS", a datetime
+    # "YYYY-MM-DD HH:MM:SS"
+    present = column.notna()
+    is_text = _is_text(column)
+    cells = column.where(present & ~is_text).astype(str)
+    is_datetime = present & ~is_text & (cells.str.len() > 8)
+    when = pd.to_datetime(cells.where(is_datetime), format="ISO8601", errors="coerce")
+    rest = present & ~is_datetime
+    if not rest.any():
+        return when
+    if days is None:
+        return None
+    clock = pd.to_timedelta(cells.where(rest & ~is_text), errors="coerce")
+    if is_text.any():
+        text = _parse_text(column[is_text], column.name, TIME_FORMATS, formats)
+        clock[is_text] = text - text.dt.normalize()
+    when[rest] = days[rest].dt.normalize() + clock[rest]
+    return when
+
+
+def _typed_column(df_bill_data: pd.DataFrame, column: str, dtype: str,
+                  formats: dict[str, str]):
+    values = df_bill_data[column]
+    if dtype == "category":
+        return values.astype("category")
+    if dtype == "float64":
+        converted = pd.to_numeric(values, errors="coerce").astype("float64")
+    elif column == "createdAt":
+        converted = created_dates(values, formats)
+    else:
+        days = df_bill_data.get("createdAt")
+        if days is not None and days.dtype != "datetime64[ns]":
+            days = None
+        converted = _times(values, days, formats)
+        if converted is None:
+            return None
+    if (converted.isna() & ~_missing(values)).any():
+        return None
+    return converted.astype(dtype)
+
+# Function to give loaded bills the types of BILL_SCHEMA. Columns already
+# of their type are left alone, so typing typed bills costs nothing. With
+# the workbook's name its text date and time formats are remembered
+
+
+def typed(df_bill_data: pd.DataFrame, file_name: str | None = None) -> pd.DataFrame:
+    formats = _formats_for(file_name)
+    df_bill_data = df_bill_data.copy(deep=False)
+    for column in CODE_COLUMNS:
+        if column in df_bill_data.columns:
+            codes = _as_codes(df_bill_data[column])
+            if codes is not None:
+                df_bill_data[column] = codes
+    for column, dtype in BILL_SCHEMA.items():
+        if column not in df_bill_data.columns or df_bill_data[column].dtype == dtype:
+            continue
+        converted = _typed_column(df_bill_data, column, dtype, formats)
+        if converted is not None:
+            df_bill_data[column] = converted
+    return df_bill_data
+
+# Text the prints show for the dates and times, as whole columns. Asked
+# for like stored columns, load_columns makes them from their source once
+# per version of the workbook and caches them with the projection. Each
+# distinct date or time is formatted once
+DISPLAY_COLUMNS = {
+    "date": ("createdAt", "%d/%m/%Y"),
+    "in_time_12h": ("in_time", "%I:%M %p"),
+    "in_time_24h": ("in_time", "%H:%M"),
+    "out_time_24h": ("out_time", "%H:%M"),
+}
+
+
+def display(df_bill_data: pd.DataFrame, name: str) -> np.ndarray:
+    if name in df_bill_data.columns:
+        return df_bill_data[name].to_numpy()
+    column, display_format = DISPLAY_COLUMNS[name]
+    values = df_bill_data[column]
+    if column == "createdAt":
+        # only the day shows
+        when = created_dates(values).dt.normalize()
+        # text that is not a date is printed as it is
+        fallback = values.where(values.notna(), "").astype(str).to_numpy()
+    else:
+        # a column the schema could not type is parsed value by value
+        when = values if values.dtype.kind == "M" else pd.to_datetime(
+            values.astype(str), format="mixed", errors="coerce")
+        # only the time of day shows
+        when = when - when.dt.normalize() + pd.Timestamp(0)
+        fallback = ""
+    codes, uniques = pd.factorize(when)
+    shown = np.append(np.asarray(uniques.strftime(display_format), dtype=object), None)
+    return np.where(codes == -1, fallback, shown[codes])
+
+# Function to add the display columns among `columns` that are not there yet
+
+
+def with_display(df_bill_data: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    names = [name for name in columns
+             if name in DISPLAY_COLUMNS and name not in df_bill_data.columns]
+    if not names:
+        return df_bill_data
+    return df_bill_data.assign(**{name: display(df_bill_data, name) for name in names})
+
+# Function to get the stored columns to read for a projection: display
+# columns are made from theirs, and the times, to be typed like the whole
+# workbook, need the day of their bill
+
+
+def read_columns(columns: list[str]) -> list[str]:
+    columns = list(dict.fromkeys(
+        DISPLAY_COLUMNS[name][0] if name in DISPLAY_COLUMNS else name for name in columns))
+    if "createdAt" in columns or not {"in_time", "out_time"} & set(columns):
+        return columns
+    return columns + ["createdAt"]
+
+# Function to add new bills to typed ones. The categoricals take the new
+# values on, the bills already loaded are not encoded again
+
+
+def append(df_bill_data: pd.DataFrame, rows: pd.DataFrame,
+           file_name: str | None = None) -> pd.DataFrame:
+    rows = typed(rows, file_name)
+    for column in BILL_SCHEMA:
+        # a column left empty on one side takes the type of the other
+        if column not in rows.columns or column not in df_bill_data.columns:
+            continue
+        if rows[column].isna().all():
+            rows[column] = rows[column].astype(df_bill_data[column].dtype)
+        elif df_bill_data[column].isna().all():
+            df_bill_data = df_bill_data.assign(
+                **{column: df_bill_data[column].astype(rows[column].dtype)})
+    combined = pd.concat([df_bill_data, rows], ignore_index=True)
+    for column, dtype in BILL_SCHEMA.items():
+        if dtype != "category" or column not in combined.columns \
+                or combined[column].dtype == dtype:
+            continue
+        try:
+            combined[column] = pd.Series(union_categoricals(
+                [df_bill_data[column], rows[column]], ignore_order=True))
+        except (KeyError, TypeError):
+            # the new values are of another kind (text next to numbers)
+            combined[column] = combined[column].astype("category")
+    return combined
+
+
+def _text(values: pd.Series) -> pd.Series:
+    # a column as text, empty cells as "" (not "nan")
+    return values.astype(object).where(values.notna(), "").astype(str)
+
+
+def _sort_keys(df_bill_data: pd.DataFrame, column: str) -> list:
+    # what a sort column orders by, most significant first (then the id).
+    # Empty cells sort first, as "" (sqlite_engine.SORT_SQL does the same)
+    values = df_bill_data[column]
+    if column == "id":
+        return []
+    if column == "createdAt":
+        return [created_dates(values).fillna(pd.Timestamp.min).to_numpy()]
+    if column == "invoiceNo":
+        # invoice numbers as numbers ("9" before "10"), any that are not
+        # numbers after them as text
+        text = _text(values)
+        number = pd.to_numeric(text, errors="coerce")
+        number = number.where(np.isfinite(number) & (number >= 0) & (number % 1 == 0))
+        return [number.isna().to_numpy(), number.fillna(0).to_numpy(),
+                text.where(number.isna(), "").to_numpy()]
+    return [_text(values).str.lower().to_numpy()]
+
+
+# (workbook, sort column) -> (version, row positions in order, id -> rank)
+_orders: dict[tuple[str, str], tuple] = {}
+
+# Function to get the bills of a workbook in `sort` order, then by id, as
+# row positions, and where each id is in that order. Made once per version
+# of the workbook, every page after that seeks to its anchor
+
+
+def _order(file_name: str, version, df_bill_data: pd.DataFrame, sort: str):
+    key = (os.path.abspath(file_name), sort)
+    cached = _orders.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+    ids = df_bill_data["id"].to_numpy()
+    keys = pd.DataFrame(
+        {**{n: values for n, values in enumerate(_sort_keys(df_bill_data, sort))}, "id": ids})
+    positions = keys.sort_values(list(keys.columns), kind="stable").index.to_numpy()
+    ranks = pd.Series(np.arange(len(positions)), index=ids[positions])
+    _orders[key] = (version, positions, ranks)
+    return positions, ranks
+
+
+# Function to find where the page after `query.after` starts in the order.
+# A deleted anchor bill still has a place when sorting by id; for the other
+# sorts its key is gone with it, the page cannot be placed
+
+
+def _seek(ranks: pd.Series, query: BillQuery) -> int:
+    if query.sort == "id":
+        # ranks is by id already
+        if query.descending:
+            return len(ranks) - int(ranks.index.searchsorted(query.after, side="left"))
+        return int(ranks.index.searchsorted(query.after, side="right"))
+    rank = ranks.get(query.after)
+    if rank is None:
+        raise ValueError(f"bill {query.after} is no longer there, start again from the first page")
+    return len(ranks) - rank if query.descending else rank + 1
+
+
+def _matches(df_bill_data: pd.DataFrame, query: BillQuery) -> pd.Series:
+    mask = pd.Series(True, index=df_bill_data.index)
+    if query.date_from or query.date_to:
+        days = created_dates(df_bill_data['createdAt']).dt.normalize()
+        if query.date_from:
+            mask &= days >= pd.Timestamp(query.date_from)
+        if query.date_to:
+            mask &= days <= pd.Timestamp(query.date_to)
+    for column in ("farmerName", "vehicle_no", "goods"):
+        value = getattr(query, column)
+        if value:
+            mask &= _text(df_bill_data[column]).str.contains(
+                value, case=False, regex=False)
+    if query.invoiceNo:
+        mask &= _text(df_bill_data['invoiceNo']) == query.invoiceNo
+    return mask
+
+
+class StorageEngine:
+    name = ""
+
+    def exists(self, file_name: str) -> bool:
+        raise NotImplementedError
+
+    # Function to get a value that changes whenever the stored bills may have
+    def version(self, file_name: str):
+        raise NotImplementedError
+
+    # Function to create an empty workbook
+    def create(self, file_name: str):
+        raise NotImplementedError
+
+    # Function to get every bill as a DataFrame, treat it as read only
+    def load(self, file_name: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    # Function to store new bills, returns the ids given to them
+    def insert(self, file_name: str, rows: list[dict]) -> list[int]:
+        raise NotImplementedError
+
+    # Function to add or update bills in bulk. `chunks` yields DataFrames of
+    # BILL_COLUMNS whose id may be missing. A row updates the bill with its
+    # id, else it is a new bill with the next id (invoiceNo is no key, the
+    # items of an invoice share it); a later row with the same id wins over
+    # an earlier one. Returns the number of bills inserted and updated
+    def upsert(self, file_name: str, chunks) -> tuple[int, int]:
+        raise NotImplementedError
+
+    # Function to get only some columns of every bill, and with `where` (a
+    # function from that frame to a boolean mask) only some bills. Engines
+    # read just those columns when the whole workbook is not loaded yet.
+    # Columns can be DISPLAY_COLUMNS too
+    def load_columns(self, file_name: str, columns: list[str], where=None) -> pd.DataFrame:
+        return select(self.load(file_name), columns, where)
+
+    def get(self, file_name: str, bill_id: int) -> dict | None:
+        df_bill_data = self.load(file_name)
+        bill = df_bill_data[df_bill_data['id'] == bill_id]
+        return bill.to_dict(orient='records')[0] if not bill.empty else None
+
+    def find_invoice(self, file_name: str, invoice_no: str) -> list[dict]:
+        df_bill_data = self.load(file_name)
+        bill = df_bill_data[df_bill_data['invoiceNo'].astype(str) == str(invoice_no)]
+        return bill.to_dict(orient='records')
+
+    def delete(self, file_name: str, bill_id: int) -> bool:
+        return bool(self.delete_many(file_name, [bill_id]))
+
+    # Function to delete several bills with one write, returns the ids of
+    # the bills that were there
+    def delete_many(self, file_name: str, bill_ids: list[int]) -> list[int]:
+        raise NotImplementedError
+
+    # Function to get one page of filtered, sorted bills and the id to pass
+    # as `after` for the next page (None on the last page)
+    def query(self, file_name: str, query: BillQuery):
+        df_bill_data = self.load(file_name)
+        positions, ranks = _order(
+            file_name, self.version(file_name), df_bill_data, query.sort)
+        if query.descending:
+            positions = positions[::-1]
+        start = 0
+        if query.after is not None:
+            start = _seek(ranks, query)
+        # Filter only the bills looked at, in growing slices from the
+        # anchor, until the page (and one more bill) is found
+        found, step = [], query.limit + 1
+        while start < len(positions) and len(found) <= query.limit:
+            candidates = positions[start:start + step]
+            mask = _matches(df_bill_data.iloc[candidates], query).to_numpy()
+            found.extend(candidates[mask])
+            start += step
+            step *= 2
+        page = df_bill_data.iloc[found[:query.limit + 1]]
+        rows = page.iloc[:query.limit].to_dict(orient="records")
+        next_after = rows[-1]['id'] if len(page) > query.limit else None
+        return rows, next_after
+
+    # Function to get a path to an up to date .xlsx of the workbook
+    def export_xlsx(self, file_name: str) -> str:
+        raise NotImplementedError
+
+    # Function to list the logical workbooks in a directory
+    def workbooks(self, directory: str) -> list[str]:
+        raise NotImplementedError
+
+
+# Function to project loaded bills to some columns and filter them
+
+
+def select(df_bill_data: pd.DataFrame, columns: list[str], where=None) -> pd.DataFrame:
+    df_bill_data = with_display(df_bill_data, columns).reindex(columns=columns)
+    if where is not None:
+        df_bill_data = df_bill_data[where(df_bill_data)]
+    return df_bill_data
+
+
+def projection_key(file_name: str, columns: list[str]) -> str:
+    # cache key of a column projection of the workbook
+    return file_name + "#" + ",".join(columns)
+
+# Function to write a DataFrame as a workbook staff can open in Excel
+
+
+def write_xlsx(file_name: str, df_bill_data: pd.DataFrame):
+    # Hand over a file object, pandas refuses paths that do not end in .xlsx
+    with open(file_name, 'wb') as f, pd.ExcelWriter(f, engine='xlsxwriter') as writer:
+        df_bill_data.to_excel(writer, index=False, sheet_name='Sheet1')
+
+        # Access the XlsxWriter workbook and worksheet objects
+        workbook = writer.book
+        worksheet = writer.sheets['Sheet1']
+
+        # Set the date format for the 'createdAt' column
+        date_format = workbook.add_format(
+            {'num_format': 'dd-mmm-yy'})  # Set format to '15-Oct-24'
+        # Adjust column width and set format (E is the 5th column)
+        worksheet.set_column('O:O', 12, date_format)
+
+def chunked(df_bill_data: pd.DataFrame, rows: int = EXPORT_CHUNK_ROWS):
+    for start in range(0, len(df_bill_data), rows):
+        yield df_bill_data.iloc[start:start + rows]
+
+# Function to write bills a chunk of rows at a time, for workbooks too big
+# to build in memory. XlsxWriter's constant memory mode flushes every row
+# as soon as the next one starts; the sheet looks like write_xlsx's
+
+
+def write_xlsx_rows(file_name: str, chunks, columns: list[str]):
+    workbook = xlsxwriter.Workbook(file_name, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Sheet1")
+    header = workbook.add_format(
+        {"bold": True, "border": 1, "align": "center", "valign": "top"})
+    formats = {
+        datetime.datetime: workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"}),
+        datetime.date: workbook.add_format({"num_format": "yyyy-mm-dd"}),
+    }
+    if "createdAt" in columns:
+        position = columns.index("createdAt")
+        worksheet.set_column(position, position, 12,
+                             workbook.add_format({"num_format": "dd-mmm-yy"}))
+    for position, column in enumerate(columns):
+        worksheet.write_string(0, position, column, header)
+    row = 1
+    for chunk in chunks:
+        for values in chunk.itertuples(index=False, name=None):
+            for position, value in enumerate(values):
+                # same cells as pandas writes: blanks for missing values,
+                # text for anything that is not a number or a date
+                if pd.isna(value):
+                    continue
+                if hasattr(value, "item") and not isinstance(value, pd.Timestamp):
+                    value = value.item()
+                if isinstance(value, bool):
+                    worksheet.write_boolean(row, position, value)
+                elif isinstance(value, (int, float)):
+                    worksheet.write_number(row, position, value)
+                elif isinstance(value, datetime.datetime):
+                    worksheet.write_datetime(row, position, value, formats[datetime.datetime])
+                elif isinstance(value, datetime.date):
+                    worksheet.write_datetime(row, position, value, formats[datetime.date])
+                else:
+                    worksheet.write_string(row, position, str(value))
+            row += 1
+    workbook.close()
+
+
+def glob_workbooks(directory: str, pattern: str) -> list[str]:
+    # Skip the "~$name.xlsx" lock files Excel leaves next to open workbooks
+    return [
+        file
+        for file in glob(os.path.join(directory, pattern))
+        if not os.path.basename(file).startswith("~$")
+    ]
+
+
+_engines: dict[str, type] = {}
+_instances: dict[str, StorageEngine] = {}
+
+
+def register(engine_class: type):
+    _engines[engine_class.name] = engine_class
+    return engine_class
+
+# Function to get the engine selected with BILL_STORAGE
+
+
+def engine() -> StorageEngine:
+    return get_engine(STORAGE_ENGINE)
+
+
+def get_engine(name: str) -> StorageEngine:
+    if name not in _engines:
+        raise ValueError(
+            f"unknown storage engine {name!r}, pick one of {sorted(_engines)}")
+    if name not in _instances:
+        _instances[name] = _engines[name]()
+    return _instances[name]
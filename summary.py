@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+import sidecar
+import storage
+
+# Per workbook dashboard totals: bill count and amount (quantity * rate),
+# overall and per day. The summary is kept in database/.cache next to the
+# sidecar, tagged with the storage version it describes, and updated by
+# create_bill / delete_bill instead of being recomputed from every row.
+# A summary whose version no longer matches (the file was edited in Excel)
+# is rebuilt once from the bills.
+
+UNKNOWN_DAY = "unknown"
+
+_summaries: dict[str, tuple] = {}
+_lock = threading.Lock()
+
+
+def _path(file_name: str) -> str:
+    return sidecar.path_for(file_name, ".summary.json")
+
+
+def _empty() -> dict:
+    return {"count": 0, "amount": 0.0, "days": {}}
+
+
+def day_keys(created) -> list[str]:
+    # The days of some createdAt values, parsed the way a full rebuild
+    # parses the column (storage.created_dates), so both agree
+    days = storage.created_dates(pd.Series(list(created), dtype=object))
+    return days.dt.strftime("%Y-%m-%d").fillna(UNKNOWN_DAY).tolist()
+
+
+def _amount(row: dict) -> float:
+    try:
+        return float(row["quantity"]) * float(row["rate"])
+    except (TypeError, ValueError):
+        return 0.0
+
+# Function to compute the summary of a whole workbook, column at a time
+
+
+def build(df_bill_data: pd.DataFrame) -> dict:
+    return build_columns(*columns(df_bill_data))
+
+# Columns of the bills a summary is built from
+COLUMNS = ["createdAt", "quantity", "rate"]
+
+# Function to reduce a workbook to the two columns a summary needs:
+# the day of each bill (datetime64, NaT when unreadable) and its amount
+
+
+def columns(df_bill_data: pd.DataFrame):
+    if df_bill_data.empty:
+        return pd.Series([], dtype="datetime64[ns]").values, pd.Series([], dtype="float64").values
+    days = storage.created_dates(df_bill_data["createdAt"])
+    amounts = (
+        pd.to_numeric(df_bill_data["quantity"], errors="coerce")
+        * pd.to_numeric(df_bill_data["rate"], errors="coerce")
+    ).fillna(0.0)
+    return days.dt.normalize().values, amounts.values.astype("float64")
+
+
+def build_columns(days, amounts) -> dict:
+    result = _empty()
+    if len(days) == 0:
+        return result
+    keys = pd.Series(days).dt.strftime("%Y-%m-%d").fillna(UNKNOWN_DAY)
+    amounts = pd.Series(amounts)
+    grouped = amounts.groupby(keys).agg(["count", "sum"])
+    result["count"] = int(len(amounts))
+    result["amount"] = float(amounts.sum())
+    result["days"] = {
+        day: {"count": int(row["count"]), "amount": float(row["sum"])}
+        for day, row in grouped.iterrows()
+    }
+    return result
+
+
+def _apply(result: dict, rows: list[dict], sign: int):
+    for row, key in zip(rows, day_keys(row["createdAt"] for row in rows)):
+        day = result["days"].setdefault(key, {"count": 0, "amount": 0.0})
+        day["count"] += sign
+        day["amount"] += sign * _amount(row)
+        result["count"] += sign
+        result["amount"] += sign * _amount(row)
+        if day["count"] <= 0:
+            del result["days"][key]
+
+
+def _save(file_name: str, version, result: dict):
+    path = _path(file_name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": version, **result}, f)
+        os.replace(path + ".tmp", path)
+    except Exception as e:
+        print(f"Error writing summary for {file_name}: {e}")
+
+
+def _stored(file_name: str, version):
+    # json turns the version tuples into lists, compare them that way
+    version = json.loads(json.dumps(version))
+    key = os.path.abspath(file_name)
+    with _lock:
+        entry = _summaries.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    try:
+        with open(_path(file_name), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.pop("version", None) != version:
+        return None
+    with _lock:
+        _summaries[key] = (version, data)
+    return data
+
+
+def _store(file_name: str, version, result: dict):
+    version = json.loads(json.dumps(version))
+    with _lock:
+        _summaries[os.path.abspath(file_name)] = (version, result)
+    _save(file_name, version, result)
+
+# Function to get the summary of a workbook, rebuilding it when stale
+
+
+def get(file_name: str, engine) -> dict:
+    result = current(file_name, engine)
+    if result is None:
+        version = engine.version(file_name)
+        result = build(engine.load_columns(file_name, COLUMNS))
+        _store(file_name, version, result)
+    return result
+
+
+def current(file_name: str, engine):
+    return _stored(file_name, engine.version(file_name))
+
+
+def put(file_name: str, version, result: dict):
+    _store(file_name, version, result)
+
+# Functions to keep the summary current after a write that moved the
+# storage from version `before` to `after`
+
+
+def added(file_name: str, before, after, rows: list[dict]):
+    _update(file_name, before, after, rows, 1)
+
+
+def removed(file_name: str, before, after, rows: list[dict]):
+    _update(file_name, before, after, rows, -1)
+
+
+def rekey(file_name: str, before, after):
+    _update(file_name, before, after, [], 1)
+
+
+def _update(file_name: str, before, after, rows: list[dict], sign: int):
+    result = _stored(file_name, before)
+    if result is None:
+        # Never built or already stale, the next get() rebuilds it
+        return
+    result = json.loads(json.dumps(result))
+    _apply(result, rows, sign)
+    _store(file_name, after, result)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app's modules live at the top of the repository, like the benchmarks
+# the tests import them from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+import escp
+
+# One weighbridge slip, byte for byte as the dot matrix printer gets it
+
+RECORD = {
+    "id": 7,
+    "vehicle_no": "MH26BE8560",
+    "address": "Masora",
+    "supplierName": "Bhaurao Bhanji Barmashe",
+    "goods": "REGENAGRI RAW COTTON",
+    "before_wight": "4130",
+    "after_wight": "2020",
+    "net_wight": "2110",
+    "wight_in_word": "two one one zero",
+    "date": "04/02/2026",
+    "in_time": "10:15",
+    "out_time": "13:55",
+}
+
+EXPECTED = (
+    b"\x1b@" + b" " * 13 + b"\x1bE\x1bW1SAUSAR COTTON PRO. PVT.LTD.\x1bW0\x1bF\r\n"
+    + b" " * 29 + b"NAGPUR-CHHINDWARA ROAD\r\n"
+    + b" " * 27 + b"SAUSAR PHONE 07165-295284\r\n"
+    b"\r\n"
+    b"RST NO     : \x1bE7                   \x1bF           VEHICLE NO : MH26BE8560             \r\n"
+    b"ADDRESS    : Masora                         SUPPLIER   : Bhaurao Bhanji Barmashe\r\n"
+    b"MATERIAL   : REGENAGRI RAW COTTON          \r\n"
+    b"\r\n"
+    b"Gross Wt   :       4130 Kg                  Date: 04/02/2026   Time:10:15   \r\n"
+    b"TARE  Wt   :       2020 kg                  Date: 04/02/2026   Time:13:55   \r\n"
+    b"Net   Wt   :       2110 kg                  two one one zero                  kg\r\n"
+    b"\r\n"
+    b"Charges (1):Rs.0/-         Charges (2):Rs.0/-         Charges (Total):Rs.0/-\r\n"
+    b"\r\n"
+    b"OPERATOR'S SIGNATURE:\r\n"
+    b"\r\n"
+    b"Contact for repairs at tel no\r\n"
+    b"\x0c"
+)
+
+
+def test_slip():
+    assert escp.slip(RECORD) == EXPECTED
+
+
+def test_slip_missing_and_long_values():
+    slip = escp.slip({**RECORD, "address": None, "out_time": float("nan"),
+                      "supplierName": "{x} " + "A" * 40, "goods": "Kapūs"})
+    lines = slip.split(b"\r\n")
+    assert lines[5] == b"ADDRESS    : " + b" " * 31 + b"SUPPLIER   : {x} " + b"A" * 19
+    assert lines[6] == b"MATERIAL   : Kap?s" + b" " * 25
+    assert lines[9].endswith(b"Time:        ")
+
+
+def test_slips_and_spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(escp, "ESCP_SPOOL", str(tmp_path / "lp0"))
+    written = escp.spool(escp.slips([RECORD, RECORD]))
+    assert written == 2 * len(EXPECTED)
+    # the spool is appended to, like a printer queue
+    escp.spool(escp.slips([RECORD]))
+    assert (tmp_path / "lp0").read_bytes() == EXPECTED * 3
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+import db
+import journal
+import storage
+
+# Bills added in the app sit in the workbook's journal until a compaction
+# folds them in. Deleting one of them must hold whatever happens between
+# the workbook rewrite of the delete and the journal being discarded.
+
+BILL = {
+    "invoiceNo": "1", "supplierName": "Supplier", "supplierOtherInfo": "",
+    "goods": "RAW COTTON", "hsn_sac": "52010015", "quantity": 2.5,
+    "rate": 7000.0, "par": "Qtl", "farmerName": "Ram", "vehicle_no": "MH40",
+    "farmerCode": "F1", "before_wight": "3000", "after_wight": "1000",
+    "year": "2025-2026", "in_time": "10:00", "out_time": None, "address": None,
+}
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    engine = storage.get_engine("excel")
+    file_name = str(tmp_path / "bills.xlsx")
+    engine.create(file_name)
+    ids = engine.insert(file_name, [BILL, {**BILL, "invoiceNo": "2"}])
+    assert db.compact_journal(file_name)
+    # the third bill is only in the journal
+    ids += engine.insert(file_name, [{**BILL, "invoiceNo": "3"}])
+    return engine, file_name, ids
+
+
+def ids_after_restart(engine, file_name):
+    # a new process: nothing cached in memory
+    db.cache.frames.clear()
+    return sorted(int(bill_id) for bill_id in engine.load(file_name)["id"])
+
+
+@pytest.mark.parametrize("position", [0, 2])
+def test_delete_survives_a_crash_before_the_journal_is_discarded(
+        workbook, monkeypatch, position):
+    engine, file_name, ids = workbook
+
+    def crash(*args):
+        raise Crash()
+
+    monkeypatch.setattr(journal, "discard_rows", crash)
+    with pytest.raises(Crash):
+        engine.delete_many(file_name, [ids[position]])
+    monkeypatch.undo()
+    expected = [bill_id for bill_id in ids if bill_id != ids[position]]
+    assert ids_after_restart(engine, file_name) == expected
+    # and the next compaction folds the delete in
+    assert db.compact_journal(file_name)
+    assert ids_after_restart(engine, file_name) == expected
+
+
+def test_failed_delete_keeps_the_bills(workbook, monkeypatch):
+    engine, file_name, ids = workbook
+
+    def locked(*args):
+        raise PermissionError("the workbook is open in Excel")
+
+    monkeypatch.setattr(db, "_replace_excel", locked)
+    with pytest.raises(PermissionError):
+        engine.delete_many(file_name, [ids[2]])
+    monkeypatch.undo()
+    assert ids_after_restart(engine, file_name) == ids
+    assert len(journal.read_rows(file_name)) == 1
+
+
+def test_delete_journaled_before_the_rewrite_holds(workbook, monkeypatch):
+    # the process died after the delete was journaled, before the rewrite
+    engine, file_name, ids = workbook
+
+    def crash(*args):
+        raise Crash()
+
+    monkeypatch.setattr(db, "_replace_excel", crash)
+    monkeypatch.setattr(journal, "truncate", lambda *args: None)
+    with pytest.raises(Crash):
+        engine.delete_many(file_name, [ids[0], ids[2]])
+    monkeypatch.undo()
+    assert ids_after_restart(engine, file_name) == [ids[1]]
+    assert engine.get(file_name, ids[1])["invoiceNo"] == "2"
+    assert engine.get(file_name, ids[0]) is None
+
+
+def test_rewrites_keep_the_workbook_mode(workbook):
+    engine, file_name, ids = workbook
+    os.chmod(file_name, 0o644)
+    engine.delete_many(file_name, [ids[0]])
+    assert os.stat(file_name).st_mode & 0o777 == 0o644
+    engine.insert(file_name, [BILL])
+    assert db.compact_journal(file_name)
+    assert os.stat(file_name).st_mode & 0o777 == 0o644
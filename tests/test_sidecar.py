@@ -0,0 +1,70 @@
+import os
+
+import pandas as pd
+import pytest
+
+import db
+import sidecar
+import storage
+
+pytest.importorskip("pyarrow")
+
+# The sidecar is Feather (memory mapped, read a column at a time) as long
+# as Arrow takes every column. Bills added in the app post their codes as
+# text while Excel reads the typed-in ones as numbers, that must not push
+# the sidecar to a pickle.
+
+FORM_BILL = {
+    "invoiceNo": "3", "supplierName": "Supplier", "supplierOtherInfo": "",
+    "goods": "RAW COTTON", "hsn_sac": "52010015", "quantity": 2.5,
+    "rate": 7000.0, "par": "Qtl", "farmerName": "Ram", "vehicle_no": "MH40",
+    "farmerCode": "1042", "before_wight": "3000", "after_wight": "1000",
+    "year": "2025-2026", "in_time": "10:00", "out_time": None, "address": None,
+}
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    # as typed into Excel: the codes are numbers
+    file_name = str(tmp_path / "bills.xlsx")
+    storage.write_xlsx(file_name, pd.DataFrame([
+        {**FORM_BILL, "id": n, "in_time": pd.Timestamp(2025, 1, n, 10), "invoiceNo": n, "hsn_sac": 52010015,
+         "farmerCode": 1040 + n, "createdAt": pd.Timestamp(2025, 1, n)}
+        for n in (1, 2)
+    ], columns=storage.BILL_COLUMNS))
+    return storage.get_engine("excel"), file_name
+
+
+def sidecar_files(file_name: str) -> list[str]:
+    directory = os.path.join(os.path.dirname(file_name), sidecar.SIDECAR_DIR)
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith("bills.xlsx.") and not name.endswith(".json"))
+
+
+def test_app_added_bills_keep_the_feather_sidecar(workbook):
+    engine, file_name = workbook
+    engine.load(file_name)
+    assert sidecar_files(file_name) == ["bills.xlsx.feather"]
+
+    assert db.create_bills(file_name, [db.Bill(**FORM_BILL)]) == [3]
+    assert db.compact_journal(file_name)
+    assert sidecar_files(file_name) == ["bills.xlsx.feather"]
+
+    fingerprint = db._fingerprint(file_name)
+    bills = sidecar.load(file_name, fingerprint, ["invoiceNo", "hsn_sac", "farmerCode"])
+    assert bills.to_dict(orient="list") == {
+        "invoiceNo": ["1", "2", "3"],
+        "hsn_sac": ["52010015"] * 3,
+        "farmerCode": ["1041", "1042", "1042"],
+    }
+
+
+def test_codes_are_text(workbook):
+    engine, file_name = workbook
+    db.create_bills(file_name, [db.Bill(**FORM_BILL)])
+    bills = engine.load(file_name)
+    for column in storage.CODE_COLUMNS:
+        assert set(map(type, bills[column])) == {str}, column
+    # the typed-in invoice number and the posted one are found alike
+    assert [bill["id"] for bill in engine.find_invoice(file_name, "1")] == [1]
+    assert [bill["id"] for bill in engine.find_invoice(file_name, "3")] == [3]
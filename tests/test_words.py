@@ -0,0 +1,70 @@
+import num2words
+import pytest
+
+import words
+
+# words.py has to spell every amount exactly as num2words(..., lang="en_IN")
+# did before it, the printed bills must not change. benchmarks/amount_words.py
+# checks a few hundred thousand numbers, these are the edges of its tables.
+
+
+def spell(number) -> str:
+    return num2words.num2words(number, lang="en_IN")
+
+
+def old_amount(amount: str, separator: str = " ") -> str:
+    return separator.join(spell(part) if part != "00" else "" for part in amount.split("."))
+
+
+# where a table, a group (thousand, lakh, crore) or num2words' range ends
+BOUNDARIES = [
+    0, 1, 19, 20, 21, 99, 100, 101, 110, 999, 1000, 1001, 99_999,
+    10 ** 5, 10 ** 5 + 1, 9_999_999, 10 ** 7, 10 ** 7 + 1, 10 ** 9,
+    10 ** 9 + 1, 10 ** 10 - 1,
+]
+
+
+@pytest.mark.parametrize("number", BOUNDARIES + [-n for n in BOUNDARIES])
+def test_cardinal(number):
+    assert words.cardinal(number) == spell(number)
+    assert words.cardinal(str(number)) == spell(str(number))
+
+
+@pytest.mark.parametrize("text", ["07", "00", "-0", " 5", "+5", "1e3"])
+def test_cardinal_unusual_text(text):
+    assert words.cardinal(text) == spell(text)
+
+
+def test_cardinal_past_the_tables():
+    # num2words' own answer past 999 crore, an error
+    with pytest.raises(OverflowError):
+        spell(10 ** 10)
+    with pytest.raises(OverflowError):
+        words.cardinal(10 ** 10)
+
+
+@pytest.mark.parametrize("amount", [
+    "0.00", "0.01", "0.05", "0.10", "0.99", "99.00", "99.99", "100.00",
+    "100.05", "999.99", "1250.50", "100000.00", "10000000.01",
+    "1000000000.00", "99999999.99",
+])
+@pytest.mark.parametrize("separator", [" ", ""])
+def test_amount_in_words(amount, separator):
+    assert words.amount_in_words(amount, separator) == old_amount(amount, separator)
+
+
+@pytest.mark.parametrize("quantity, rate", [
+    (2.5, 6620.5), (0.25, 7125.25), (1.005, 1.0), (2.675, 1.0),
+    (0.125, 1.0), (999.995, 1.0), (40.0, 2499.99875), (0.1, 0.1),
+])
+def test_amount_in_words_rounded(quantity, rate):
+    # the bills format quantity * rate to paise first, half-way cases and
+    # float noise included
+    amount = "{:.2f}".format(float(quantity) * float(rate))
+    assert words.amount_in_words(amount, "") == old_amount(amount, "")
+    assert words.amount_in_words(amount) == old_amount(amount)
+
+
+@pytest.mark.parametrize("weight", ["0", "305", "1000", "99999", "007"])
+def test_digits_in_words(weight):
+    assert words.digits_in_words(weight) == " ".join(spell(digit) for digit in weight)
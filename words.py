@@ -0,0 +1,96 @@
+from functools import lru_cache
+
+# Numbers in words for the printed bills, Indian numbering (lakh, crore).
+# Gives exactly what num2words.num2words(..., lang="en_IN") gives, without
+# its generic word splitting: every number below a thousand comes from a
+# table built at import, bigger ones are a few table lookups, and whole
+# results are kept in LRU caches because bills repeat the same amounts.
+# Anything that is not a plain integer (or is out of num2words' range) is
+# handed to num2words itself, imported only then: the tables cover the
+# bills, and num2words with all its languages is slow to import.
+
+WORDS_CACHE_SIZE = 65536
+
+_ONES = [
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight",
+    "nine", "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen",
+    "sixteen", "seventeen", "eighteen", "nineteen",
+]
+_TENS = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy",
+         "eighty", "ninety"]
+
+# num2words does not go past 999 crore
+_LIMIT = 10 ** 10
+
+# crore, lakh and thousand, the hundreds are part of _BELOW_THOUSAND
+_GROUPS = [(10 ** 7, "crore"), (10 ** 5, "lakh"), (10 ** 3, "thousand")]
+
+
+def _below_hundred(number: int) -> str:
+    if number < 20:
+        return _ONES[number]
+    tens, ones = divmod(number, 10)
+    return _TENS[tens] + ("-" + _ONES[ones] if ones else "")
+
+
+def _below_thousand(number: int) -> str:
+    hundreds, rest = divmod(number, 100)
+    if not hundreds:
+        return _below_hundred(rest)
+    text = _ONES[hundreds] + " hundred"
+    return text + " and " + _below_hundred(rest) if rest else text
+
+
+_BELOW_THOUSAND = [_below_thousand(number) for number in range(1000)]
+_BELOW_HUNDRED = _BELOW_THOUSAND[:100]
+
+
+def _cardinal(number: int) -> str:
+    if number < 1000:
+        return _BELOW_THOUSAND[number]
+    parts = []
+    for size, name in _GROUPS:
+        count, number = divmod(number, size)
+        if count:
+            parts.append(_BELOW_THOUSAND[count] + " " + name)
+    hundreds, rest = divmod(number, 100)
+    if hundreds:
+        parts.append(_ONES[hundreds] + " hundred")
+    text = ", ".join(parts)
+    # the last part under a hundred is joined with "and"
+    return text + " and " + _BELOW_HUNDRED[rest] if rest else text
+
+
+# Function to spell a whole number, "12" and 12 alike
+
+
+@lru_cache(maxsize=WORDS_CACHE_SIZE)
+def cardinal(number) -> str:
+    text = str(number).strip()
+    digits = text[1:] if text[:1] == "-" else text
+    if digits.isascii() and digits.isdigit() and int(digits) < _LIMIT:
+        value = int(digits)
+        if value and text[:1] == "-":
+            return "minus " + _cardinal(value)
+        return _cardinal(value)
+    import num2words
+
+    return num2words.num2words(number, lang="en_IN")
+
+# Function to spell an amount like "1250.50" as rupees and paise, the way
+# the bills print it, "00" paise are left out
+
+
+@lru_cache(maxsize=WORDS_CACHE_SIZE)
+def amount_in_words(amount: str, separator: str = " ") -> str:
+    return separator.join(
+        cardinal(part) if part != "00" else "" for part in amount.split(".")
+    )
+
+# Function to spell a weight digit by digit, "305" -> "three zero five"
+
+
+@lru_cache(maxsize=WORDS_CACHE_SIZE)
+def digits_in_words(number: str) -> str:
+    return " ".join(_ONES[int(digit)] if digit.isdigit() and digit.isascii()
+                    else cardinal(digit) for digit in number)
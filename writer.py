@@ -0,0 +1,171 @@
+import asyncio
+import contextlib
+import os
+import weakref
+
+import db
+import journal
+import offload
+
+# Group commit of the bill inserts and deletes of each workbook. Requests do
+# not write themselves, they queue their change and wait. One writer task
+# per workbook takes what has queued up within BILL_WRITE_WINDOW_MS of the
+# first change (or BILL_WRITE_BATCH bills, whichever comes first) and
+# applies it with one write: every insert of the batch in one journal
+# append (one sqlite transaction), every delete in one workbook rewrite.
+# Changes that arrive while a batch is being written make up the next one,
+# so the busier the counters, the more bills each write carries.
+#
+# A batch that leaves the journal long enough (db.JOURNAL_COMPACT_ROWS) is
+# followed by a compaction, under the same workbook lock as every write.
+#
+# Inserts are applied before deletes within a batch. A delete can only name
+# a bill that existed before it was sent, so no delete of the batch can be
+# about one of its inserts.
+
+WRITE_WINDOW = int(os.environ.get("BILL_WRITE_WINDOW_MS", 5)) / 1000
+WRITE_BATCH = int(os.environ.get("BILL_WRITE_BATCH", 500))
+
+
+class _Change:
+    def __init__(self, kind: str, items: list):
+        # "insert" with Bills or "delete" with bill ids
+        self.kind = kind
+        self.items = items
+        self.result = asyncio.get_running_loop().create_future()
+
+
+class _Writer:
+    def __init__(self):
+        self.pending: list[_Change] = []
+        self.size = 0
+        self.full = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+
+# asyncio objects belong to the loop they are made on, one set per loop
+_writers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, _Writer]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def _writer_for(file_name: str) -> _Writer:
+    writers = _writers.setdefault(asyncio.get_running_loop(), {})
+    key = os.path.abspath(file_name)
+    if key not in writers:
+        writers[key] = _Writer()
+    return writers[key]
+
+
+async def _queue(file_name: str, change: _Change):
+    writer = _writer_for(file_name)
+    writer.pending.append(change)
+    writer.size += len(change.items)
+    if writer.size >= WRITE_BATCH:
+        writer.full.set()
+    if writer.task is None:
+        writer.task = asyncio.create_task(_run(file_name, writer))
+    return await change.result
+
+
+def _take(writer: _Writer) -> list[_Change]:
+    # whole changes, a batch may go over WRITE_BATCH by the last one
+    batch, size = [], 0
+    while writer.pending and (not batch or size < WRITE_BATCH):
+        change = writer.pending.pop(0)
+        batch.append(change)
+        size += len(change.items)
+    writer.size -= size
+    if writer.size < WRITE_BATCH:
+        writer.full.clear()
+    return batch
+
+
+async def _run(file_name: str, writer: _Writer):
+    batch: list[_Change] = []
+    try:
+        while writer.pending:
+            if writer.size < WRITE_BATCH and WRITE_WINDOW > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(writer.full.wait(), WRITE_WINDOW)
+            batch = _take(writer)
+            try:
+                results = await offload.write(file_name, _apply, file_name, batch)
+            except Exception as e:
+                print(f"Error writing bills to {file_name}: {e}")
+                results = [False] * len(batch)
+            for change, result in zip(batch, results):
+                # a request that went away still had its change written
+                if not change.result.done():
+                    change.result.set_result(result)
+            if db.compaction_due(file_name):
+                await compact(file_name)
+    finally:
+        writer.task = None
+        # cancelled on the way out, nobody is left waiting forever
+        for change in batch + writer.pending:
+            if not change.result.done():
+                change.result.cancel()
+
+# Runs in the storage threads: apply a batch, returns each change's result,
+# the ids of its bills for an insert and the ids that were found and
+# deleted for a delete, False for a change that could not be written
+
+
+def _apply(file_name: str, batch: list[_Change]) -> list:
+    results: list = [None] * len(batch)
+    inserts = [n for n, change in enumerate(batch) if change.kind == "insert"]
+    deletes = [n for n, change in enumerate(batch) if change.kind == "delete"]
+    if inserts:
+        ids = db.create_bills(file_name, [bill for n in inserts for bill in batch[n].items])
+        start = 0
+        for n in inserts:
+            count = len(batch[n].items)
+            results[n] = False if ids is False else ids[start:start + count]
+            start += count
+    if deletes:
+        try:
+            deleted = set(db.delete_bills(
+                file_name, [bill_id for n in deletes for bill_id in batch[n].items]))
+        except Exception as e:
+            print(f"Error deleting bills: {e}")
+            deleted = None
+        for n in deletes:
+            results[n] = False if deleted is None else [
+                bill_id for bill_id in batch[n].items if bill_id in deleted]
+    return results
+
+# Function to add bills through the workbook's writer, returns their ids
+# (False if they could not be saved)
+
+
+async def insert(file_name: str, bills: list[db.Bill]):
+    return await _queue(file_name, _Change("insert", list(bills)))
+
+# Function to delete bills through the workbook's writer, returns the ids
+# that were found and deleted (False if the workbook could not be written)
+
+
+async def delete(file_name: str, bill_ids: list[int]):
+    return await _queue(file_name, _Change("delete", [int(bill_id) for bill_id in bill_ids]))
+
+# Function to fold a workbook's journal into it, on its own like any write
+
+
+async def compact(file_name: str):
+    return await offload.write(file_name, db.compact_journal, file_name)
+
+# Function to compact every workbook of a directory that has a journal
+
+
+async def compact_all(directory: str):
+    for file_name in await offload.run(journal.pending_journals, directory):
+        await compact(file_name)
+
+# Function to wait for every queued change to be written
+
+
+async def flush():
+    writers = _writers.get(asyncio.get_running_loop(), {})
+    tasks = [writer.task for writer in writers.values() if writer.task is not None]
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)